@@ -0,0 +1,78 @@
+"""
+Compares the article codecs (see up_crawler/codec.py): serializing,
+deserializing, and writing+reading a directory of article jsons.
+
+    python benchmarks/bench_codec.py -n 2000
+"""
+
+import argparse
+import tempfile
+import timeit
+
+from pathlib import Path
+
+from up_crawler.codec import CODECS
+from up_crawler.data_structures import Article, Language
+
+
+def make_article(i: int, raw_html: bool) -> Article:
+    text = [f"Абзац {j} статті {i}, " * 20 for j in range(25)]
+    return Article(
+        uri=f"https://www.pravda.com.ua/news/2023/11/13/{i}/",
+        title=f"Заголовок статті {i}",
+        author_name="Олена Рощина",
+        text=text,
+        raw_html="".join(f"<p>{x}</p>" for x in text) if raw_html else None,
+        lang=Language.UA,
+        art_id=str(i),
+        date="2023-11-13",
+        tags_full=[("stavka", "Ставка", "/tags/stavka/")] * 5,
+        tags=["stavka"] * 5,
+    )
+
+
+def bench(codec, articles: list[Article], tmp_dir: Path, repeat: int) -> dict:
+    written = [codec.dumps_article(x, indent=True) for x in articles]
+    paths = [tmp_dir / f"{codec.name}_{i}.json" for i in range(len(articles))]
+
+    def files():
+        for art, path in zip(articles, paths):
+            codec.write_article(art, path)
+        for path in paths:
+            codec.read_article(path)
+
+    def best(f) -> float:
+        return min(timeit.repeat(f, number=1, repeat=repeat))
+
+    return {
+        "dumps": best(lambda: [codec.dumps_article(x, indent=True) for x in articles]),
+        "loads": best(lambda: [codec.loads_article(x) for x in written]),
+        "files": best(files),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=1000, help="Articles (%(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of (%(default)s)")
+    parser.add_argument(
+        "--raw_html", action="store_true", help="With the raw html inside the articles"
+    )
+    args = parser.parse_args()
+
+    articles = [make_article(i, raw_html=args.raw_html) for i in range(args.n)]
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, codec in CODECS.items():
+            results[name] = bench(codec, articles, Path(tmp_dir), args.repeat)
+
+    print(f"{args.n} articles, best of {args.repeat}, seconds:")
+    print(f"{'':8}" + "".join(f"{x:>10}" for x in results["fast"]))
+    for name, r in results.items():
+        print(f"{name:8}" + "".join(f"{v:10.3f}" for v in r.values()))
+    speedup = {k: results["wizard"][k] / results["fast"][k] for k in results["fast"]}
+    print(f"{'speedup':8}" + "".join(f"{v:9.1f}x" for v in speedup.values()))
+
+
+if __name__ == "__main__":
+    main()
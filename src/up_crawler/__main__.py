@@ -35,12 +35,26 @@ from up_crawler.data_structures import (
     TagsMapping,
 )
 
-from up_crawler.randomization import RandomizationParams, _parse_timeout
+from up_crawler.randomization import (
+    RandomizationParams,
+    _parse_timeout,
+    _add_rate_limit_args,
+)
 
-from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.get_uris import (
+    UPSitemapCrawler,
+    _add_sitemap_args,
+    _sitemap_crawler_from_args,
+)
 from up_crawler.path_ops import get_file_or_temp, get_dir_or_temp
 from up_crawler.bs_oop import UPCrawler
+from up_crawler.http_session import UPSession, _add_session_args, _session_from_args
+from up_crawler.raw_archive import RawArchiveWriter
+from up_crawler.html_parsers import DEFAULT_HTML_PARSER, _add_parser_args
+from up_crawler.storage import ShardStorage, DirectoryStorage, _add_storage_args
+from up_crawler.codec import DEFAULT_CODEC
 from up_crawler.consts import URIS_TOCRAWL_FN
+from up_crawler.tail import UPTailer
 
 
 
@@ -63,20 +77,72 @@ class FullUPCrawler:
         d2: Optional[Union[datetime, str]] = "yesterday",
         target_dir: Optional[Path | str] = None,
         randomization_params: Optional[RandomizationParams] = RandomizationParams(),
+        concurrency: int = 1,
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        parse_workers: int = 0,
+        html_parser: str = DEFAULT_HTML_PARSER,
+        storage: str = "dirs",
+        max_shard_mb: float = ShardStorage.DEFAULT_MAX_SHARD_MB,
+        inline_raw_html: bool = False,
+        codec: str = DEFAULT_CODEC,
+        sitemap_crawler: Optional[UPSitemapCrawler] = None,
+        tail: bool = False,
+        poll_interval: float = UPTailer.POLL_INTERVAL_SEC,
+        max_polls: Optional[int] = None,
+        stream: bool = True,
     ):
+        """storage: one of STORAGES, see storage.py
+
+        tail: instead of the articles between d1 and d2, keep downloading
+            the new ones every poll_interval seconds, see tail.py
+        stream: start downloading the articles of the first month as soon
+            as its sitemap is there, instead of after all the sitemaps
+        """
+        # One connection pool for the sitemaps, tags pages and articles
+        session = session if session else UPSession()
+
         # Sitemap magic
-        us = UPSitemapCrawler()
+        us = sitemap_crawler if sitemap_crawler else UPSitemapCrawler(session=session)
         target_path = get_dir_or_temp(target_dir)
         csv_path =get_file_or_temp(path = target_dir, fn_if_needed=URIS_TOCRAWL_FN)
         # TODO hypothetically reuse the DF in target_dir if present, but not worth it
-        df_path = us.get_and_save_article_uris(d1=d1, d2=d2, save_path=csv_path)
+        # Tailing or streaming: the URIs are added to the frontier as they're found
+        uri_batches = None
+        if tail:
+            df_path = None
+        elif stream:
+            df_path = None
+            uri_batches = us.iter_and_save_article_uris(d1=d1, d2=d2, save_path=csv_path)
+        else:
+            df_path = us.get_and_save_article_uris(d1=d1, d2=d2, save_path=csv_path)
 
         uc = UPCrawler(
             input_csv=df_path,
-            target_dir=target_dir,
+            target_dir=target_path,
             randomization_params=randomization_params,
+            concurrency=concurrency,
+            session=session,
+            archive=archive,
+            parse_workers=parse_workers,
+            html_parser=html_parser,
+            storage=ShardStorage(
+                target_path,
+                max_shard_mb=max_shard_mb,
+                inline_raw_html=inline_raw_html,
+                codec=codec,
+            )
+            if storage == "shards"
+            else DirectoryStorage(
+                target_path, inline_raw_html=inline_raw_html, codec=codec
+            ),
         )
-        uc.run()
+        if tail:
+            UPTailer(uc, sitemap_crawler=us).run(
+                poll_interval=poll_interval, max_polls=max_polls
+            )
+            return
+        uc.run(uri_batches=uri_batches)
         logger.info(f"Successfully downloaded all articles!")
 
 
@@ -90,12 +156,26 @@ def run(args):
     output_path = args.output
 
     rw = _parse_timeout(args)
+    session = _session_from_args(args)
     fup = FullUPCrawler()
     fup.parse_and_download_everything(
         d1=date_1,
         d2=date_2,
         target_dir=args.output,
         randomization_params=rw,
+        concurrency=args.concurrency,
+        session=session,
+        archive=RawArchiveWriter(args.archive) if args.archive else None,
+        parse_workers=args.parse_workers,
+        html_parser=args.html_parser,
+        storage=args.storage,
+        max_shard_mb=args.max_shard_mb,
+        inline_raw_html=args.inline_raw_html,
+        codec=args.codec,
+        sitemap_crawler=_sitemap_crawler_from_args(args, session=session),
+        tail=args.tail,
+        poll_interval=args.poll_interval,
+        stream=not args.no_stream,
     )
 
 
@@ -132,6 +212,49 @@ def parse_args() -> argparse.Namespace:
         help="""Max timeout when crawling articles, set to -1 to disable \
                 all kinds of randomization. (%(default)s)""",
     )
+    _add_rate_limit_args(parser)
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=1,
+        help="""Max number of article requests in flight at the same time, \
+                >1 uses the asyncio crawler. (%(default)s)""",
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        default=0,
+        help="""Parser processes for the asyncio crawler (-c >1), \
+                0 parses in the crawler's thread. (%(default)s)""",
+    )
+    _add_parser_args(parser)
+    _add_session_args(parser)
+    _add_sitemap_args(parser)
+    _add_storage_args(parser)
+    parser.add_argument(
+        "--no_stream",
+        action="store_true",
+        help="""Get the URIs from all sitemaps first and only then download \
+                the articles, instead of starting with the first month's""",
+    )
+    parser.add_argument(
+        "--tail",
+        action="store_true",
+        help="""Ignore the dates and keep downloading new articles from the \
+                latest sitemaps as they're published, until interrupted""",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=UPTailer.POLL_INTERVAL_SEC,
+        help="Seconds between polls of the latest sitemaps with --tail (%(default)s)",
+    )
+    parser.add_argument(
+        "--archive",
+        type=Path,
+        help="Archive raw responses of articles to this .warc.gz, see up_reparse (%(default)s)",
+    )
     parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
     parser.add_argument(
         "-q",
@@ -178,4 +301,3 @@ if __name__ == "__main__":
 #   - "що передувало": https://www.pravda.com.ua/news/2023/10/10/7423534/
 #       - or just remove the text itself if I won't be implementing that
 #       - generally, look into all article texts that end up in ":"
-#   - "I'm running, and I haven't crawled stuff for 5 days, I'll go through the 5 days" or something
@@ -0,0 +1,387 @@
+"""
+Concurrent (asyncio + aiohttp) version of the article download loop
+of UPCrawler.
+
+Same behaviour as the blocking crawler (404 detection, abort on 403,
+retries on network errors, identical files on disk), but up to N requests
+are in flight at the same time.
+
+It's a pipeline of stages connected by bounded queues, so that a slow stage
+makes the ones before it wait instead of piling up pages in memory:
+
+    feeder -> fetchers (N requests in flight) -> parsers -> writer
+
+Parsing (BeautifulSoup, regexes) is pure Python and GIL-bound, so with
+parse_workers>0 it runs in a ProcessPoolExecutor and scales across cores
+while the fetchers keep the network busy.
+"""
+
+import asyncio
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import aiohttp
+
+from collections import Counter
+
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    before_sleep_log,
+    retry_if_exception_type,
+)
+
+from typing import Iterable, Optional
+
+from up_crawler.data_structures import Language, Article, TagsMapping
+from up_crawler.randomization import RandomizationParams
+from up_crawler.consts import MAX_RETRIES_FOR_REQUEST
+from up_crawler.path_ops import mkdir
+from up_crawler.http_session import (
+    UPSession,
+    get_default_session,
+    ServerBusyError,
+    BadStatusError,
+)
+from up_crawler.raw_archive import RawArchiveWriter
+from up_crawler.html_parsers import DEFAULT_HTML_PARSER
+from up_crawler.para_filter import ParagraphFilter
+from up_crawler.frontier import CrawlFrontier
+from up_crawler.storage import ArticleStorage, DirectoryStorage
+
+from up_crawler.bs_oop import UPCrawler
+
+
+def _parse_in_worker(
+    uri: str,
+    content: bytes,
+    encoding: Optional[str],
+    para_filter: Optional[ParagraphFilter],
+    html_parser: str,
+) -> tuple[Optional[Article], Counter]:
+    """article_from_response in a parser process, returns the article
+    and the hits of the paragraph filter there."""
+    article = UPCrawler.article_from_response(
+        uri, content, encoding, para_filter, html_parser
+    )
+    return article, para_filter.hits if para_filter else Counter()
+
+
+@dataclass
+class _Job:
+    """One translation to download, travelling through the pipeline."""
+
+    art_row: dict
+    group_key: int
+    content: Optional[bytes] = None
+    encoding: Optional[str] = None
+    # Not downloaded because of an error other than a 404, see BadStatusError
+    failed: bool = False
+    article: Optional[Article] = None
+
+
+class AsyncArticleFetcher:
+    """Downloads groups of translations of articles concurrently.
+
+    `concurrency` is the max number of requests in flight at the same time.
+    Politeness comes from RandomizationParams: its token bucket (if
+    requests_per_sec is set) is a budget shared by all the slots, otherwise
+    the random wait happens inside each slot.
+
+    `parse_workers` is the number of parser processes, 0 parses in the
+    event loop's thread.
+
+    With a `frontier`, the groups are the URIs leased from it and their
+    final state is written back there; without one translations already
+    on disk are skipped.
+    """
+
+    # Size of each queue between stages, per task consuming it
+    QUEUE_SIZE_PER_WORKER = 2
+
+    def __init__(
+        self,
+        target_dir: Path,
+        concurrency: int = 8,
+        randomization_params: Optional[RandomizationParams] = RandomizationParams(),
+        regex_paras_to_skip: Optional[list[str] | ParagraphFilter] = None,
+        tags_mapping: Optional[TagsMapping] = None,
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        parse_workers: int = 0,
+        html_parser: str = DEFAULT_HTML_PARSER,
+        frontier: Optional[CrawlFrontier] = None,
+        storage: Optional[ArticleStorage] = None,
+        on_group_done=None,
+    ):
+        self.target_dir = target_dir
+        self.concurrency = max(1, concurrency)
+        self.randomization_params = randomization_params
+        self.regex_paras_to_skip = ParagraphFilter.get(regex_paras_to_skip)
+        self.tags_mapping = tags_mapping
+        # aiohttp connections are pooled with the same settings and headers
+        self.session = session if session else get_default_session()
+        self.archive = archive
+        self.parse_workers = max(0, parse_workers)
+        self.html_parser = html_parser
+        self.frontier = frontier
+        self.storage = storage if storage else DirectoryStorage(target_dir)
+        # Called (from the event loop) after all translations of a group are done
+        self.on_group_done = on_group_done
+
+    def run(self, groups: Iterable[tuple], pbar=None) -> None:
+        """Download all (art_id, group) tuples, as given by df.groupby('id')"""
+        if not self.parse_workers:
+            asyncio.run(self._run(groups=groups, pbar=pbar, pool=None))
+            return
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            asyncio.run(self._run(groups=groups, pbar=pbar, pool=pool))
+
+    async def _run(self, groups: Iterable[tuple], pbar, pool) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._pbar = pbar
+        # group_key -> translations of it not written yet
+        self._remaining: dict = dict()
+
+        num_parsers = self.parse_workers if self.parse_workers else 1
+        fetch_q = asyncio.Queue(maxsize=self.concurrency * self.QUEUE_SIZE_PER_WORKER)
+        parse_q = asyncio.Queue(maxsize=num_parsers * self.QUEUE_SIZE_PER_WORKER)
+        write_q = asyncio.Queue(maxsize=self.QUEUE_SIZE_PER_WORKER)
+
+        async with self.session.async_session(limit=self.concurrency) as session:
+            stages = [
+                *[
+                    asyncio.create_task(self._fetcher(session, fetch_q, parse_q))
+                    for _ in range(self.concurrency)
+                ],
+                *[
+                    asyncio.create_task(self._parser(pool, parse_q, write_q))
+                    for _ in range(num_parsers)
+                ],
+                asyncio.create_task(self._writer(write_q)),
+            ]
+            feeder = asyncio.create_task(
+                self._feed(groups, fetch_q, queues=[fetch_q, parse_q, write_q])
+            )
+            try:
+                # Stages never return on their own, so the first task to
+                # finish is either the feeder (all done) or a stage that raised
+                done, _ = await asyncio.wait(
+                    [feeder, *stages], return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    # Re-raise e.g. the ValueError on 403
+                    task.result()
+            finally:
+                for task in [feeder, *stages]:
+                    task.cancel()
+
+    async def _feed(
+        self, groups: Iterable[tuple], fetch_q: asyncio.Queue, queues: list
+    ) -> None:
+        groups = iter(groups)
+        # In a thread: leasing from the frontier (or waiting for its URIs
+        # to be found, see UPCrawler._stream_groups) doesn't stop the fetchers
+        while (artid_group := await asyncio.to_thread(next, groups, None)) is not None:
+            jobs = self._jobs_for_group(artid_group)
+            group_key = artid_group[0]
+            if not jobs:
+                self._group_done(group_key)
+                continue
+            self._remaining[group_key] = len(jobs)
+            for job in jobs:
+                await fetch_q.put(job)
+        # Everything fetched, then parsed, then written
+        for q in queues:
+            await q.join()
+
+    def _jobs_for_group(self, artid_group: tuple) -> list[_Job]:
+        """Jobs for the translations of the group not downloaded yet."""
+        artid, group = artid_group
+
+        jobs = list()
+        for i, art_row in group.iterrows():
+            if not self.frontier and self.storage.exists(
+                artid, lang=art_row["lang"], uri=art_row["uri"]
+            ):
+                if self.tags_mapping:
+                    art = self.storage.read(artid, lang=art_row["lang"])
+                    UPCrawler.update_tags_mapping(
+                        tags_mapping=self.tags_mapping,
+                        tags=art.tags_full,
+                        language=Language(art_row["lang"]),
+                    )
+                logger.debug(
+                    f"Skipping {artid}/{art_row['lang']} ({art_row['uri']}) as downloaded"
+                )
+                self._progress()
+                continue
+            jobs.append(_Job(art_row=art_row, group_key=artid))
+        return jobs
+
+    async def _fetcher(self, session, fetch_q, parse_q) -> None:
+        while True:
+            job = await fetch_q.get()
+            try:
+                res = await self.fetch(session, job.art_row["uri"])
+            except BadStatusError as e:
+                # e.g. still a 503 after all the retries: not now, maybe later
+                logger.warning(f"Couldn't download {job.art_row['uri']}: {e}")
+                job.failed = True
+                res = None
+            except Exception:
+                self._mark(job, CrawlFrontier.FAILED)
+                raise
+            if res:
+                job.content, job.encoding = res
+            await parse_q.put(job)
+            fetch_q.task_done()
+
+    async def _parser(self, pool, parse_q, write_q) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await parse_q.get()
+            if job.content is not None:
+                args = (
+                    job.art_row["uri"],
+                    job.content,
+                    job.encoding,
+                    self.regex_paras_to_skip,
+                    self.html_parser,
+                )
+                if pool:
+                    job.article, hits = await loop.run_in_executor(
+                        pool, _parse_in_worker, *args
+                    )
+                    if self.regex_paras_to_skip:
+                        self.regex_paras_to_skip.add_hits(hits)
+                else:
+                    job.article = UPCrawler.article_from_response(*args)
+                # Not needed anymore, don't keep it in memory until written
+                job.content = None
+            await write_q.put(job)
+            parse_q.task_done()
+
+    async def _writer(self, write_q) -> None:
+        """Saved from the event loop thread, no locking needed for tags mapping"""
+        while True:
+            job = await write_q.get()
+            if job.article:
+                UPCrawler.save_article(
+                    job.article,
+                    art_path=None,
+                    lang=job.art_row["lang"],
+                    art_id=job.art_row["id"],
+                    date=job.art_row["date"],
+                    tags_mapping=self.tags_mapping,
+                    storage=self.storage,
+                )
+                self._mark(job, CrawlFrontier.DONE, tags=job.article.tags_full)
+                self._progress()
+            elif job.failed:
+                # Unless the frontier will lease it again, that's it for this one
+                if self._mark(job, CrawlFrontier.FAILED):
+                    self._progress()
+            else:
+                self._mark(job, CrawlFrontier.NOT_FOUND)
+                self._progress()
+            self._remaining[job.group_key] -= 1
+            if not self._remaining[job.group_key]:
+                del self._remaining[job.group_key]
+                self._group_done(job.group_key)
+            write_q.task_done()
+
+    def _mark(self, job: _Job, state: str, tags: Optional[list] = None) -> bool:
+        """See CrawlFrontier.mark(), True without a frontier."""
+        if self.frontier:
+            return self.frontier.mark(job.art_row["uri"], state, tags=tags)
+        return True
+
+    def _group_done(self, group_key) -> None:
+        if self.on_group_done:
+            self.on_group_done()
+
+    def _progress(self) -> None:
+        if self._pbar is not None:
+            self._pbar.update()
+
+    async def _get(
+        self, session, uri: str, cache_headers: dict
+    ) -> tuple[int, bytes, Optional[str], dict]:
+        """(status code, content, encoding, headers) of uri, in one of the
+        `concurrency` slots for the duration of the wait and the request."""
+        async with self._semaphore:
+            headers = {"user-agent": self.randomization_params.get_useragent()}
+            headers.update(cache_headers)
+            async with self.randomization_params.async_slot(uri) as record:
+                async with session.get(uri, headers=headers) as website:
+                    content = await website.read()
+                    record.status_code = website.status
+                    record.headers = website.headers
+                    return website.status, content, website.charset, website.headers
+
+    async def crawl_article_uri(self, session, uri: str) -> Optional[Article]:
+        """Async twin of UPCrawler.crawl_article_uri, None if there was a 404
+        (BadStatusError on other errors)"""
+        res = await self.fetch(session, uri)
+        if not res:
+            return None
+        content, encoding = res
+        return UPCrawler.article_from_response(
+            uri, content, encoding, self.regex_paras_to_skip, self.html_parser
+        )
+
+    @retry(
+        stop=stop_after_attempt(MAX_RETRIES_FOR_REQUEST),
+        wait=wait_exponential(multiplier=1, min=1, max=60),
+        before_sleep=before_sleep_log(logger, logging.INFO),
+        retry=retry_if_exception_type(
+            (aiohttp.ClientConnectionError, asyncio.TimeoutError, ServerBusyError)
+        ),
+        # The last error, not a RetryError, once the retries run out
+        reraise=True,
+    )
+    async def fetch(self, session, uri: str) -> Optional[tuple[bytes, Optional[str]]]:
+        """Download uri, return (content, encoding) or None if it's a 404.
+
+        Same status code handling as UPCrawler.do_basic_uri_ops_when_crawling;
+        cache hits are returned without waiting for a slot, see _get().
+        """
+        # Served from cache without a request: no slot to wait for
+        cached, cache_headers = self.session.cache_lookup(uri)
+        if cached:
+            return cached.content, cached.encoding
+
+        for headers in (cache_headers, dict()):
+            status_code, content, encoding, res_headers = await self._get(
+                session, uri, headers
+            )
+            cached = self.session.cache_update(
+                uri,
+                status_code=status_code,
+                content=content,
+                headers=res_headers,
+                encoding=encoding,
+            )
+            if not (status_code == 304 and cache_headers and not cached):
+                break
+            # Evicted since cache_lookup(), so ask again for the page itself
+        if cached:
+            status_code, content, encoding = 200, cached.content, cached.encoding
+
+        if self.archive and status_code == 200:
+            self.archive.write(
+                uri, status_code=status_code, headers=res_headers, content=content
+            )
+
+        if not UPCrawler.check_status_code(uri=uri, status_code=status_code):
+            return None
+        return content, encoding
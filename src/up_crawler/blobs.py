@@ -0,0 +1,107 @@
+"""
+Content-addressed store for the raw html of the articles.
+
+The raw html is most of the size of an article json, and nothing reading
+the articles (UPReader, the CSV export) needs it. So the storages put it
+there instead: compressed, named by the sha256 of the html (the same html
+is stored once), with only the hash (Article.raw_html_ref) in the article.
+Article.get_raw_html() loads it when (and if) it's needed.
+
+    target_dir/blobs/ab/abcdef....html.zst   (.gz without zstandard)
+"""
+
+import gzip
+import hashlib
+import os
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Optional
+
+from up_crawler.path_ops import make_path_ok
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+
+def default_compression() -> str:
+    return "zstd" if zstandard else "gzip"
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        if not zstandard:
+            raise ValueError("zstd compression needs zstandard installed")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data)
+
+
+def decompress(name: str, data: bytes) -> bytes:
+    """Decompress data of the file called name (compression from its suffix)."""
+    if name.endswith(COMPRESSIONS["zstd"]):
+        if not zstandard:
+            raise ValueError(f"Reading {name} needs zstandard installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class BlobStore:
+    """Raw html by its sha256, see module docstring."""
+
+    BLOBS_DIR = "blobs"
+    SUFFIX = ".html"
+
+    def __init__(self, target_dir: Path | str, compression: Optional[str] = None):
+        self.root = make_path_ok(target_dir) / self.BLOBS_DIR
+        self.compression = compression if compression else default_compression()
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, have {list(COMPRESSIONS)}")
+
+    @staticmethod
+    def ref_for(html: str) -> str:
+        return hashlib.sha256(html.encode()).hexdigest()
+
+    def _path(self, ref: str, compression: str) -> Path:
+        return self.root / ref[:2] / (ref + self.SUFFIX + COMPRESSIONS[compression])
+
+    def _find(self, ref: str) -> Optional[Path]:
+        """Path of the blob, whichever compression it was written with."""
+        for compression in COMPRESSIONS:
+            path = self._path(ref, compression)
+            if path.exists():
+                return path
+        return None
+
+    def __contains__(self, ref: str) -> bool:
+        return self._find(ref) is not None
+
+    def put(self, html: str) -> str:
+        """Store html (unless already there), returns its ref."""
+        ref = self.ref_for(html)
+        if ref in self:
+            return ref
+        path = self._path(ref, self.compression)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name, so that half-written blobs never exist
+        tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        tmp_path.write_bytes(compress(html.encode(), self.compression))
+        tmp_path.replace(path)
+        return ref
+
+    def get(self, ref: str) -> str:
+        path = self._find(ref)
+        if path is None:
+            raise KeyError(f"No raw html {ref} in {self.root}")
+        return decompress(path.name, path.read_bytes()).decode()
+
+    def __repr__(self):
+        return f"BlobStore({self.root}, compression={self.compression})"
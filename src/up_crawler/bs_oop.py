@@ -9,11 +9,11 @@ logging.basicConfig()
 logger = logging.getLogger(__name__)
 
 import re
+import queue
+import threading
 
 from pathlib import Path
 
-import requests
-from requests import ConnectionError, ReadTimeout
 from bs4 import BeautifulSoup
 from unicodedata import normalize
 
@@ -37,7 +37,7 @@ from tqdm.contrib.logging import logging_redirect_tqdm
 
 import base64
 
-from typing import List, Tuple, Optional, Dict, Union
+from typing import List, Tuple, Optional, Dict, Union, Iterable, Iterator
 
 from up_crawler.data_structures import (
     Language,
@@ -45,14 +45,40 @@ from up_crawler.data_structures import (
     TagsMapping,
 )
 
-from up_crawler.randomization import RandomizationParams, _parse_timeout
+from up_crawler.randomization import (
+    RandomizationParams,
+    _parse_timeout,
+    _add_rate_limit_args,
+)
 from up_crawler.consts import URI_TAGS_RU, URI_TAGS_UA, REGEX_PARAS_TO_SKIP
 
-from up_crawler.consts import MAX_RETRIES_FOR_REQUEST, TAGS_MAPPING_FN
+from up_crawler.consts import MAX_RETRIES_FOR_REQUEST, TAGS_MAPPING_FN, FRONTIER_FN
 
 from up_crawler.path_ops import get_dir_or_temp, mkdir, get_file_or_temp, make_path_ok
 
 from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.raw_archive import RawArchiveWriter
+from up_crawler.html_parsers import DEFAULT_HTML_PARSER, make_soup, _add_parser_args
+from up_crawler.para_filter import ParagraphFilter
+from up_crawler.frontier import CrawlFrontier
+from up_crawler.tags_journal import TagsJournal
+from up_crawler.codec import get_codec
+from up_crawler.storage import (
+    ArticleStorage,
+    DirectoryStorage,
+    _add_storage_args,
+    _storage_from_args,
+)
+from up_crawler.http_session import (
+    UPSession,
+    get_default_session,
+    NETWORK_ERRORS,
+    ServerBusyError,
+    BadStatusError,
+    is_server_busy,
+    _add_session_args,
+    _session_from_args,
+)
 
 b = breakpoint
 
@@ -79,17 +105,31 @@ class UPCrawler:
     #   p (as always), and ul-> li (bullet point list around 'background')
     PARAS_WITH_TEXT = ["p", "li"]
 
+
+    # Articles leased from the frontier at once
+    LEASE_BATCH = 20
+
+    # Batches of URIs (sitemap months) found ahead of the crawl at most, see run()
+    URI_BATCHES_QUEUE_SIZE = 2
+
     def __init__(
         self,
-        input_csv: Path | str,
+        input_csv: Optional[Path | str],
         target_dir: Optional[Path | str] = None,
         randomization_params: Optional[RandomizationParams] = RandomizationParams(),
         tags_mapping_file: Optional[Path] = None,
         regex_paras_to_skip: Optional[list[str]] = REGEX_PARAS_TO_SKIP,
+        concurrency: int = 1,
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        parse_workers: int = 0,
+        html_parser: str = DEFAULT_HTML_PARSER,
+        storage: Optional[ArticleStorage] = None,
         **kwargs,
     ):
-        self.input_csv = make_path_ok(input_csv)
-        assert self.input_csv.exists()
+        # None: crawl only what's pending in the frontier (e.g. see tail.py)
+        self.input_csv = make_path_ok(input_csv) if input_csv else None
+        assert self.input_csv is None or self.input_csv.exists()
 
         self.target_dir = get_dir_or_temp(target_dir)
 
@@ -114,10 +154,29 @@ class UPCrawler:
 
         # Will be created in run()
         self.tags = None
+        # Tag changes are appended there, the json is rewritten only sometimes
+        self.tags_journal = TagsJournal(self.tags_mapping_file)
 
         self._get_randomization_params(randomization_params, **kwargs)
 
-        self.regex_paras_to_skip = regex_paras_to_skip
+        # Compiled once, counts what it skipped for the run report
+        self.regex_paras_to_skip = ParagraphFilter.get(regex_paras_to_skip)
+
+        # >1 means the asyncio fetcher with that many requests in flight
+        self.concurrency = concurrency
+        # Parser processes for the asyncio fetcher, 0 parses in its thread
+        self.parse_workers = parse_workers
+        # Parser backend for the downloaded pages, see html_parsers.py
+        self.html_parser = html_parser
+
+        # Pooled connections shared with the sitemap crawler if passed
+        self.session = session if session else get_default_session()
+
+        # If set, full raw responses of articles are archived there
+        self.archive = archive
+
+        # Where articles are written, by default a dir per article in target_dir
+        self.storage = storage if storage else DirectoryStorage(self.target_dir)
 
     def _read_tm_from_file(self) -> None:
         """Try to read the tag mapping from file if provided.
@@ -133,7 +192,7 @@ class UPCrawler:
             logger.info(
                 f"Using existing  tags mapping file at {str(self.tags_mapping_file)}"
             )
-            self.tags = TagsMapping.from_json_file(self.tags_mapping_file)
+            self.tags = self.tags_journal.load()
         except Exception as e:
             logger.warning(
                 f"Had problems accessing tags mapping file {self.tags_mapping_file}, will create new one: {e}"
@@ -141,60 +200,190 @@ class UPCrawler:
 
     def create_or_read_tag_mapping(self):
         """Try reading tag mapping from file, use UP's website if that fails."""
+        if self.tags:
+            # Loaded by a previous run of this crawler (e.g. up_daemon)
+            return
         self._read_tm_from_file()
 
         # If the above didn't create a tag mapping fro whatever reason...
         if not self.tags:
             # Parse UP's tags pages to create a tags mapping w/o English tags
             self.tags = self.create_tag_mapping(
-                randomization_params=self.randomization_params
+                randomization_params=self.randomization_params,
+                session=self.session,
             )
             self.save_tags_mapping()
 
     #  @staticmethod
-    def parse_input(self, csv_path: Path):
-        df = pd.read_csv(csv_path)
+    def parse_input(
+        self,
+        csv_path: Optional[Path],
+        uri_batches: Optional[Iterable[pd.DataFrame]] = None,
+    ):
+        # What's done and what's left lives in the frontier, not in the files
+        frontier = CrawlFrontier(self.target_dir / FRONTIER_FN)
+
+        if csv_path:
+            logger.info(f"Reading {csv_path}")
+            # Also the ones downloaded before the frontier, reconcile() happens once
+            frontier.import_csv(csv_path, is_downloaded=self.storage.exists)
+        # Articles downloaded before the frontier existed
+        frontier.reconcile(is_downloaded=self.storage.exists)
+        # Tags of the articles downloaded until now, without reading them
+        for lang, tags in frontier.tags().items():
+            UPCrawler.update_tags_mapping(
+                tags_mapping=self.tags, tags=tags, language=Language(lang)
+            )
 
-        full_articles = list()
+        counts = frontier.counts()
+        num_finished = sum(
+            v for k, v in counts.items() if k not in [frontier.PENDING, frontier.IN_FLIGHT]
+        )
+        logger.info(
+            f"Found {frontier.num_articles()} articles ({sum(counts.values())} incl. translations)"
+        )
+        logger.info(frontier.report())
 
-        # Each group contains 1..3 translations of the same article
-        grouped = df.groupby("id")
+        try:
+            with logging_redirect_tqdm():
+                with tqdm(
+                    total=sum(counts.values()), initial=num_finished, desc="articles"
+                ) as pbar:
+                    # Each group contains 1..3 translations of the same article
+                    num_articles = max(self.LEASE_BATCH, self.concurrency)
+                    if uri_batches is None:
+                        grouped = frontier.iter_groups(num_articles=num_articles)
+                    else:
+                        grouped = self._stream_groups(
+                            uri_batches, frontier, pbar=pbar, num_articles=num_articles
+                        )
+                    if self.concurrency > 1:
+                        self._parse_groups_concurrently(
+                            grouped, pbar=pbar, frontier=frontier
+                        )
+                    else:
+                        self._parse_groups(grouped, pbar=pbar, frontier=frontier)
+        finally:
+            # Leased but not done, e.g. after a 403 or ctrl+c
+            frontier.release()
+        logger.info(f"Done! {frontier.report()}")
+        self._log_stats()
+        frontier.close()
+
+    def _stream_groups(
+        self,
+        uri_batches: Iterable[pd.DataFrame],
+        frontier: CrawlFrontier,
+        pbar,
+        num_articles: int,
+    ) -> Iterator[tuple[int, pd.DataFrame]]:
+        """Groups leased from the frontier, while the URIs of uri_batches
+        are added to it as they come.
 
-        num_articles_full = len(df)
-        num_articles = len(grouped)
+        uri_batches are produced in a thread, at most URI_BATCHES_QUEUE_SIZE
+        of them ahead; the groups end when both are exhausted.
+        """
+        batches = queue.Queue(maxsize=self.URI_BATCHES_QUEUE_SIZE)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=_produce_batches,
+            args=(uri_batches, batches, stop),
+            name="uri_batches",
+            daemon=True,
+        )
+        producer.start()
+
+        def add(batch) -> bool:
+            """Add batch to the frontier, False if there'll be no more."""
+            if batch is _NO_MORE_BATCHES:
+                return False
+            if isinstance(batch, BaseException):
+                raise batch
+            # Downloaded before, e.g. by a crawl without the frontier
+            num_new = frontier.add(batch, is_downloaded=self.storage.exists)
+            pbar.total += num_new
+            pbar.refresh()
+            return True
+
+        producing = True
+        try:
+            while True:
+                # Add what was found until now
+                while producing:
+                    try:
+                        producing = add(batches.get_nowait())
+                    except queue.Empty:
+                        break
+                groups = frontier.lease(num_articles=num_articles)
+                if groups:
+                    yield from groups
+                elif producing:
+                    # Nothing to download until the next batch
+                    producing = add(batches.get())
+                else:
+                    return
+        finally:
+            # e.g. the crawl stopped on a 403
+            stop.set()
+
+    def _parse_groups(self, grouped, pbar, frontier: CrawlFrontier) -> None:
+        # For each group of translations
+        for art_id, group in grouped:
+            logger.debug(f"Processing article {art_id,','.join(list(group.lang))}")
+            self.process_group(
+                (art_id, group),
+                randomization_params=self.randomization_params,
+                target_dir=self.target_dir,
+                tags_mapping=self.tags,
+                pbar=pbar,
+                regex_paras_to_skip=self.regex_paras_to_skip,
+                session=self.session,
+                archive=self.archive,
+                html_parser=self.html_parser,
+                frontier=frontier,
+                storage=self.storage,
+            )
+            # Update tags mapping at the end of the group
+            self.save_tags_mapping(silent=True, incremental=True)
+
+    def _log_stats(self) -> None:
+        logger.info(f"Politeness: {self.randomization_params.stats.report()}")
+        if self.session.cache:
+            logger.info(self.session.cache.report())
+        if self.regex_paras_to_skip:
+            logger.info(self.regex_paras_to_skip.report())
+            for r in self.regex_paras_to_skip.unused_rules():
+                logger.info(f"Paragraph rule '{r}' never matched")
+
+    def _parse_groups_concurrently(
+        self, grouped, pbar, frontier: Optional[CrawlFrontier] = None
+    ) -> None:
+        """Download the groups with the asyncio fetcher, see async_crawler.py"""
+        # Imported here because async_crawler builds on UPCrawler
+        from up_crawler.async_crawler import AsyncArticleFetcher
 
-        logger.info(f"Reading {csv_path}")
         logger.info(
-            f"Found {num_articles} articles ({num_articles_full} incl. translations) over {len(df.groupby('date'))} days"
+            f"Downloading with up to {self.concurrency} concurrent requests, "
+            f"{self.parse_workers} parser processes"
         )
-        num_existing_articles = len(
-            [x for x in self.target_dir.iterdir() if x.is_dir() and x.name.isnumeric()]
+        fetcher = AsyncArticleFetcher(
+            target_dir=self.target_dir,
+            concurrency=self.concurrency,
+            randomization_params=self.randomization_params,
+            regex_paras_to_skip=self.regex_paras_to_skip,
+            tags_mapping=self.tags,
+            session=self.session,
+            archive=self.archive,
+            parse_workers=self.parse_workers,
+            html_parser=self.html_parser,
+            frontier=frontier,
+            storage=self.storage,
+            # Update tags mapping at the end of the group
+            on_group_done=lambda: self.save_tags_mapping(
+                silent=True, incremental=True
+            ),
         )
-        if num_existing_articles:
-            logger.info(
-                f"The output directory may have {num_existing_articles} articles already downloaded"
-            )
-
-        with logging_redirect_tqdm():
-            with tqdm(total=num_articles_full, desc="articles") as pbar:
-                # For each group of translations
-                #  for art_id, group in tqdm(grouped, leave=False, desc="articles"):
-                for art_id, group in grouped:
-                    logger.debug(
-                        f"Processing article {art_id,','.join(list(group.lang))}"
-                    )
-                    self.process_group(
-                        (art_id, group),
-                        randomization_params=self.randomization_params,
-                        target_dir=self.target_dir,
-                        tags_mapping=self.tags,
-                        pbar=pbar,
-                        regex_paras_to_skip=self.regex_paras_to_skip,
-                    )
-                    #  full_articles.append(fa)
-                    # Update tags mapping at the end of the group
-                    self.save_tags_mapping(silent=True)
-                logger.info(f"Successfully downloaded {len(full_articles)} articles")
+        fetcher.run(grouped, pbar=pbar)
 
     @staticmethod
     def process_group(
@@ -204,14 +393,26 @@ class UPCrawler:
         pbar,
         tags_mapping: Optional[TagsMapping] = None,
         use_downloaded_files_to_update_tags: bool = True,
-        regex_paras_to_skip: Optional[list[str]] = None,
+        regex_paras_to_skip: Optional[list[str] | ParagraphFilter] = None,
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
+        frontier: Optional[CrawlFrontier] = None,
+        storage: Optional[ArticleStorage] = None,
     ) -> None:
+        """Download the translations of one article.
+
+        With a frontier, the group contains only the URIs leased from it,
+        and their final state is written back there. Without one,
+        translations already in storage are skipped.
+        Articles are written to storage, by default a dir per article in
+        target_dir.
+        """
         artid, group = artid_group
 
-        group_dir = target_dir / str(artid)
-        mkdir(group_dir)
+        storage = storage if storage else DirectoryStorage(target_dir)
 
-        logger.debug(f"Saving group {artid} to {group_dir}")
+        logger.debug(f"Saving group {artid} to {storage}")
 
         fa_dict = dict()
         for i, art_row in group.iterrows():
@@ -220,15 +421,10 @@ class UPCrawler:
             art_id = art_row["id"]
             date = art_row["date"]
 
-            art_filename = (
-                lang + "_" + base64.b64encode(uri.encode()).decode() + ".json"
-            )
-            art_path = group_dir / art_filename
-
-            if art_path.exists():
+            if not frontier and storage.exists(art_id, lang=lang, uri=uri):
                 if use_downloaded_files_to_update_tags and tags_mapping:
                     # Update the tags mapping to use info from the downloaded article
-                    art = Article.from_json_file(art_path)
+                    art = storage.read(art_id, lang=lang)
                     UPCrawler.update_tags_mapping(
                         tags_mapping=tags_mapping,
                         tags=art.tags_full,
@@ -241,26 +437,43 @@ class UPCrawler:
                 continue
 
             logger.debug(f"{i}/{len(group)}: {uri} ({lang})")
-            art = UPCrawler.crawl_article_uri(
-                uri=uri,
-                regex_paras_to_skip=regex_paras_to_skip,
-                randomization_params=randomization_params,
-            )
+            try:
+                art = UPCrawler.crawl_article_uri(
+                    uri=uri,
+                    regex_paras_to_skip=regex_paras_to_skip,
+                    randomization_params=randomization_params,
+                    session=session,
+                    archive=archive,
+                    html_parser=html_parser,
+                )
+            except BadStatusError as e:
+                # e.g. still a 503 after all the retries: not now, maybe later
+                logger.warning(f"Couldn't download {uri}: {e}")
+                # Unless the frontier will lease it again, that's it for this one
+                if not frontier or frontier.mark(uri, frontier.FAILED):
+                    pbar.update()
+                continue
+            except Exception:
+                if frontier:
+                    frontier.mark(uri, frontier.FAILED)
+                raise
             if not art:
-                # if something went wrong
+                # 404
+                if frontier:
+                    frontier.mark(uri, frontier.NOT_FOUND)
+                pbar.update()
                 continue
-            art.lang = Language(lang)
-            art.art_id = art_id
-            art.date = date
-            art.to_json_file(art_path, indent=4, ensure_ascii=False)
-
-            # Update tags mapping - maybe we get a couple of English tags...
-            if tags_mapping:
-                UPCrawler.update_tags_mapping(
-                    tags_mapping=tags_mapping,
-                    tags=art.tags_full,
-                    language=Language(lang),
-                )
+            UPCrawler.save_article(
+                art,
+                art_path=None,
+                lang=lang,
+                art_id=art_id,
+                date=date,
+                tags_mapping=tags_mapping,
+                storage=storage,
+            )
+            if frontier:
+                frontier.mark(uri, frontier.DONE, tags=art.tags_full)
 
             fa_dict[Language(lang)] = art
             pbar.update()
@@ -268,6 +481,40 @@ class UPCrawler:
         # TODO bad assumption that the date of all translations is the same, I should use UA only
         return
 
+    @staticmethod
+    def _article_path(group_dir: Path, lang: str, uri: str) -> Path:
+        """Path of the json of one translation, e.g. group_dir/eng_<base64(uri)>.json"""
+        return DirectoryStorage.article_path(group_dir, lang=lang, uri=uri)
+
+    @staticmethod
+    def save_article(
+        art: Article,
+        art_path: Optional[Path],
+        lang: str,
+        art_id,
+        date: str,
+        tags_mapping: Optional[TagsMapping] = None,
+        storage: Optional[ArticleStorage] = None,
+    ) -> None:
+        """Fill in the metadata from the URI list, write the article to
+        storage (or to art_path if not given) and update the tags mapping
+        with its tags."""
+        art.lang = Language(lang)
+        art.art_id = art_id
+        art.date = date
+        if storage:
+            storage.write(art)
+        else:
+            get_codec().write_article(art, art_path)
+
+        # Update tags mapping - maybe we get a couple of English tags...
+        if tags_mapping:
+            UPCrawler.update_tags_mapping(
+                tags_mapping=tags_mapping,
+                tags=art.tags_full,
+                language=Language(lang),
+            )
+
     @staticmethod
     def update_tags_mapping(tags_mapping: TagsMapping, tags, language: Language):
         """Updates the tags mapping with tags from an article.
@@ -282,8 +529,16 @@ class UPCrawler:
                 tags_mapping.tags_mapping[tag_short] = dict()
             tags_mapping.tags_mapping[tag_short][language] = (tag_name, tag_link)
 
-    def save_tags_mapping(self, silent: bool = False):
-        """Saves tags mapping to json."""
+    def save_tags_mapping(self, silent: bool = False, incremental: bool = False):
+        """Saves tags mapping to json.
+
+        incremental: only append the changed tags to the journal (and
+            rewrite the json if it hasn't been for a while), see TagsJournal
+        """
+        if incremental:
+            self.tags_journal.flush(self.tags)
+            return
+
         msg = f"Saving tags mapping to {self.tags_mapping_file}"
         if silent:
             logger.debug(msg)
@@ -291,25 +546,38 @@ class UPCrawler:
             logger.info(msg)
 
         try:
-            self.tags.to_json_file(self.tags_mapping_file, indent=4, ensure_ascii=False)
+            self.tags_journal.compact(self.tags)
         except KeyboardInterrupt as e:
             # Still try to save the file?
             logger.error(
                 f"Keyboardinterrupt during the saving of tags map, still saving..."
             )
-            self.tags.to_json_file(self.tags_mapping_file, indent=4, ensure_ascii=False)
+            self.tags_journal.compact(self.tags)
             raise e
 
     @staticmethod
     def save_group(group, target_dir: Path):
         artid, group = group
 
-    def run(self):
-        assert self.input_csv.exists()
+    def run(
+        self,
+        input_csv: Optional[Path | str] = None,
+        uri_batches: Optional[Iterable[pd.DataFrame]] = None,
+    ):
+        """input_csv: crawl this one instead of self.input_csv
+        uri_batches: dataframes of URIs (like the csv) still being found,
+            e.g. UPSitemapCrawler.iter_article_uris(); crawled as they come
+        """
+        input_csv = make_path_ok(input_csv) if input_csv else self.input_csv
+        assert input_csv is None or input_csv.exists()
         # Create a tag mapping
         self.create_or_read_tag_mapping()
         # Crawl the pages in the CSV
-        r = self.parse_input(self.input_csv)
+        try:
+            r = self.parse_input(input_csv, uri_batches=uri_batches)
+        finally:
+            # Also on errors: replaces the json and the journal with one file
+            self.save_tags_mapping()
 
     ######
     # CRAWLING
@@ -317,7 +585,7 @@ class UPCrawler:
 
     @staticmethod
     def parse_soup(
-        soup, regex_paras_to_skip: Optional[list[str]] = None
+        soup, regex_paras_to_skip: Optional[list[str] | ParagraphFilter] = None
     ) -> Optional[Article]:
 
         # If we got an error, pass return it up
@@ -355,25 +623,21 @@ class UPCrawler:
 
         text_paras = text_raw.find_all(UPCrawler.PARAS_WITH_TEXT)
 
+        para_filter = ParagraphFilter.get(regex_paras_to_skip)
+
         text = list()
 
         # Add non-empty paragraphs as list of strings
         for para in text_paras:
-            # if not-empty
-            if para.text:
-                # if not matching any of the bad regexes (if we set some)
-                if regex_paras_to_skip:
-                    flag = False
-                    for r in regex_paras_to_skip:
-                        if re.compile(r, re.IGNORECASE).match(para.text):
-                            flag = True
-                    if flag:
-                        continue
-                # Normalize to replace all nonbreakable space and friends
-                #  see https://stackoverflow.com/questions/10993612/how-to-remove-xa0-from-string-in-python
-                norm_text = normalize("NFKC", para.text).strip()
-                if norm_text:
-                    text.append(norm_text)
+            # Normalize to replace all nonbreakable space and friends
+            #  see https://stackoverflow.com/questions/10993612/how-to-remove-xa0-from-string-in-python
+            norm_text = normalize("NFKC", para.text).strip()
+            if not norm_text:
+                continue
+            # if not matching any of the bad regexes (if we set some)
+            if para_filter and para_filter.skip(norm_text):
+                continue
+            text.append(norm_text)
 
         article = Article(
             uri=None,  # WILL BE FILLED IN PARENT FUNCTION
@@ -382,29 +646,42 @@ class UPCrawler:
             tags_full=tags,
             tags=[x[0] for x in tags],
             text=text,
-            raw_html=text_raw,  # TODO isn't it better to save the ENTIRE page here?
+            # str, so that articles can be pickled (e.g. from parser processes)
+            raw_html=str(text_raw),  # TODO isn't it better to save the ENTIRE page here?
         )
         return article
 
     @staticmethod
     def crawl_article_uri(
         uri: str,
-        regex_paras_to_skip: Optional[list[str]] = None,
+        regex_paras_to_skip: Optional[list[str] | ParagraphFilter] = None,
         #  tag_mapping: Optional[dict[str, dict[Language, tuple(str, str)]]],
         randomization_params: RandomizationParams = RandomizationParams(),
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
     ) -> Optional[Article]:
         """crawl_single_uri, with Article in one language
 
         Args:
             uri (str): uri
-            regex_paras_to_skip: list of regexes, paragraphs matching any
-                of them (case-insensitive) won't be added to article text
+            regex_paras_to_skip: list of regexes (or a ParagraphFilter),
+                paragraphs matching any of them (case-insensitive) won't be
+                added to article text
+            archive: if set, the full raw response is archived there
+            html_parser: parser backend, see html_parsers.py
 
         Returns:
             Optional[Article]: None if there was a 404
+
+        Raise BadStatusError on other errors, see check_status_code
         """
         soup = UPCrawler.do_basic_uri_ops_when_crawling(
-            uri=uri, randomization_params=randomization_params
+            uri=uri,
+            randomization_params=randomization_params,
+            session=session,
+            archive=archive,
+            html_parser=html_parser,
         )
 
         if not soup:
@@ -420,16 +697,21 @@ class UPCrawler:
     @staticmethod
     def create_tag_mapping(
         randomization_params: RandomizationParams = RandomizationParams(),
+        session: Optional[UPSession] = None,
     ) -> TagsMapping:
         """Parse UP's tag pages for UA and RU and create a dict with
         tags in both languages.
         """
         logger.info(f"Creating tag mapping from UP's website...")
         ua_tags = UPCrawler.crawl_tags_uri(
-            uri=URI_TAGS_UA, randomization_params=randomization_params
+            uri=URI_TAGS_UA,
+            randomization_params=randomization_params,
+            session=session,
         )
         ru_tags = UPCrawler.crawl_tags_uri(
-            uri=URI_TAGS_RU, randomization_params=randomization_params
+            uri=URI_TAGS_RU,
+            randomization_params=randomization_params,
+            session=session,
         )
 
         all_keys = set(ua_tags.keys()).union(ru_tags.keys())
@@ -448,6 +730,7 @@ class UPCrawler:
     def crawl_tags_uri(
         uri: str,
         randomization_params: RandomizationParams = RandomizationParams(),
+        session: Optional[UPSession] = None,
     ) -> dict[str, tuple[str, str]]:
         """Crawls page with tags, e.g. https://www.pravda.com.ua/tags/,
         to get the tag names/uris and their names in the language
@@ -464,12 +747,17 @@ class UPCrawler:
             Dictionary name -> (full_name, uri)
         """
         soup = UPCrawler.do_basic_uri_ops_when_crawling(
-            uri=uri, randomization_params=randomization_params
+            uri=uri, randomization_params=randomization_params, session=session
         )
         # If we got an error, pass return it up
         if not soup:
             return soup
 
+        return UPCrawler.tags_from_soup(soup)
+
+    @staticmethod
+    def tags_from_soup(soup) -> dict[str, tuple[str, str]]:
+        """Tags listed on a tags page, see crawl_tags_uri"""
         # short name -> plain language name, uri
         tags: dict[str, tuple[str, str]] = dict()
         div_tags_container = soup.find_all("div", class_="block_tags")[0]
@@ -494,66 +782,151 @@ class UPCrawler:
         wait=wait_exponential(multiplier=1, min=1, max=60),  # Exponential backoff
         before_sleep=before_sleep_log(logger, logging.INFO),
         #  retry=retry_if_not_exception_type((ValueError))
-        retry=retry_if_exception_type((ConnectionError, ReadTimeout)),
+        retry=retry_if_exception_type(NETWORK_ERRORS),
+        # The last error, not a RetryError, once the retries run out
+        reraise=True,
     )
     @staticmethod
     def do_basic_uri_ops_when_crawling(
         uri: str,
         randomization_params: Optional[RandomizationParams] = RandomizationParams(),
+        session: Optional[UPSession] = None,
+        archive: Optional[RawArchiveWriter] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
     ) -> Optional[BeautifulSoup]:
-        """Gets the soup, or returns None if errors happened.
+        """Gets the soup, or returns None if it's a 404.
 
-        Returns None if URI is 404 or got any HTTP code except 404
-        Raise ValueError on 403
+        Raise ValueError on 403, BadStatusError on other errors
 
         Retry X times if networking issues happen.
+
+        Uses the pooled keep-alive `session`, or the default shared one.
+        Successful responses are written to `archive` if set.
         """
+        session = session if session else get_default_session()
 
         logger.debug(f"Using randomization: {randomization_params}")
 
-        # wait
-        randomization_params.random_wait()
-
         # be polite
         useragent = randomization_params.get_useragent()
         headers = {"user-agent": useragent}
         #  logger.debug(f"Using headers: {headers}")
 
-        website = requests.get(uri, headers=headers, timeout=(10, 10))
-
-        if website.status_code != 200:
-            if website.status_code != 404:
-                logger.info(f"{uri} returned status code {website.status_code}")
+        # Served from cache without a request: no slot to wait for
+        website, _ = session.cache_lookup(uri)
+        if not website:
+            # wait as long as needed, then download
+            with randomization_params.slot(uri) as record:
+                website = session.get(uri, headers=headers, timeout=(10, 10))
+                # The adaptive rate controller (if any) reacts to these
+                record.status_code = website.status_code
+                record.headers = website.headers
+
+        if archive and website.status_code == 200:
+            archive.write(
+                uri,
+                status_code=website.status_code,
+                headers=website.headers,
+                content=website.content,
+            )
 
-            # Be a good scraper and fail loudly at the first sign of problems
-            if website.status_code == 403:
-                logger.error(f"403! {uri} returned status code {website.status_code}")
-                raise ValueError("403")
+        return UPCrawler.soup_from_response(
+            uri=uri,
+            status_code=website.status_code,
+            content=website.content,
+            encoding=website.encoding,
+            html_parser=html_parser,
+        )
 
-            return None
+    @staticmethod
+    def soup_from_response(
+        uri: str,
+        status_code: int,
+        content: bytes,
+        encoding: Optional[str] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
+    ) -> Optional[BeautifulSoup]:
+        """Turn a downloaded page into soup, or return None if it's a 404.
 
-        soup = BeautifulSoup(
-            website.content, "html.parser", from_encoding=website.encoding
-        )
+        Shared by the blocking and the asyncio crawlers, so that both
+        treat status codes and 404 pages the same way.
+        Only the parts of the page needed by the extractors are parsed.
 
-        def is_404(website):
-            if website.status_code == 404:
-                return True
+        Returns None if URI is 404 (status code or UP's 404 page)
+        Raise exceptions on other errors, see check_status_code
+        """
+        if not UPCrawler.check_status_code(uri=uri, status_code=status_code):
+            return None
 
-            title = soup.find_all("h1")[0].text
-            # Inspired by https://www.pravda.com.ua/news/2022/03/15/7331466/
-            errors = ["error 404", "ошибка 404", "помилка 404"]
-            for e in errors:
-                if e in title.lower():
-                    return True
-            return False
+        soup = make_soup(content, encoding=encoding, parser=html_parser)
 
-        if is_404(website):
+        if UPCrawler._is_404_page(soup):
             logger.debug(f"{uri} returned 404")
             return None
         logger.debug(f"Returning soup")
         return soup
 
+    @staticmethod
+    def check_status_code(uri: str, status_code: int) -> bool:
+        """True if the response is worth parsing, False if it's a 404.
+
+        Raise ValueError on 403
+        Raise ServerBusyError on 429/5xx, retried after a backoff
+        Raise BadStatusError on any other status code
+        """
+        if is_server_busy(status_code):
+            logger.info(f"{uri} returned status code {status_code}, will retry")
+            raise ServerBusyError(uri=uri, status_code=status_code)
+
+        if status_code != 200:
+            if status_code == 404:
+                return False
+
+            # Be a good scraper and fail loudly at the first sign of problems
+            if status_code == 403:
+                logger.error(f"403! {uri} returned status code {status_code}")
+                raise ValueError("403")
+
+            logger.info(f"{uri} returned status code {status_code}")
+            raise BadStatusError(uri=uri, status_code=status_code)
+        return True
+
+    @staticmethod
+    def article_from_response(
+        uri: str,
+        content: bytes,
+        encoding: Optional[str] = None,
+        regex_paras_to_skip: Optional[list[str] | ParagraphFilter] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
+    ) -> Optional[Article]:
+        """Parse a successfully downloaded article page, None if it's a 404 page.
+
+        Needs only picklable arguments, so it can run in parser processes.
+        """
+        soup = UPCrawler.soup_from_response(
+            uri=uri,
+            status_code=200,
+            content=content,
+            encoding=encoding,
+            html_parser=html_parser,
+        )
+        if not soup:
+            return None
+        article = UPCrawler.parse_soup(soup=soup, regex_paras_to_skip=regex_paras_to_skip)
+        article.uri = uri
+        return article
+
+    @staticmethod
+    def _is_404_page(soup: BeautifulSoup) -> bool:
+        """UP sometimes returns 200 with an error page, detect it by title."""
+        title = soup.find_all("h1")[0].text
+        # Inspired by https://www.pravda.com.ua/news/2022/03/15/7331466/
+        errors = ["error 404", "ошибка 404", "помилка 404"]
+        for e in errors:
+            if e in title.lower():
+                return True
+        return False
+
     ######
     # RANDOM
     ######
@@ -568,18 +941,53 @@ class UPCrawler:
             logger.debug(f"Using RandomizationParams {self.randomization_params}")
 
 
+# Put after the last batch of URIs by _produce_batches
+_NO_MORE_BATCHES = object()
+
+
+def _produce_batches(
+    uri_batches: Iterable[pd.DataFrame], batches: queue.Queue, stop: threading.Event
+) -> None:
+    """Put uri_batches in batches, then _NO_MORE_BATCHES (or the exception
+    that stopped them), unless stopped before."""
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for batch in uri_batches:
+            if not put(batch):
+                return
+        put(_NO_MORE_BATCHES)
+    except Exception as e:
+        put(e)
+
+
 def run_crawl(args):
     assert args.input, "Provide path to json with URIs to crawl"
 
     logger.info(f"Running with params {args}")
     logger.info(f"Crawling URIs from {args.input}")
     rw = _parse_timeout(args)
+    target_dir = get_dir_or_temp(args.output)
     #  res = crawl_all_uris(args.input, output_file=args.output, randomization_params=rw)
     cr = UPCrawler(
         input_csv=args.input,
-        target_dir=args.output,
+        target_dir=target_dir,
         randomization_params=rw,
         tags_mapping_file=args.tags_mapping_file,
+        concurrency=args.concurrency,
+        session=_session_from_args(args),
+        archive=RawArchiveWriter(args.archive) if args.archive else None,
+        parse_workers=args.parse_workers,
+        html_parser=args.html_parser,
+        storage=_storage_from_args(args, target_dir=target_dir),
     )
     cr.run()
 
@@ -615,6 +1023,30 @@ def parse_args_crawl() -> argparse.Namespace:
         help="""Max timeout when crawling articles, set to -1 to disable \
                 all kinds of randomization. (%(default)s)""",
     )
+    _add_rate_limit_args(parser)
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=1,
+        help="""Max number of article requests in flight at the same time, \
+                >1 uses the asyncio crawler. (%(default)s)""",
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        default=0,
+        help="""Parser processes for the asyncio crawler (-c >1), \
+                0 parses in the crawler's thread. (%(default)s)""",
+    )
+    _add_parser_args(parser)
+    _add_session_args(parser)
+    _add_storage_args(parser)
+    parser.add_argument(
+        "--archive",
+        type=Path,
+        help="Archive raw responses of articles to this .warc.gz, see up_reparse (%(default)s)",
+    )
     parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
     parser.add_argument(
         "-q",
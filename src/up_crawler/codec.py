@@ -0,0 +1,311 @@
+"""
+Fast (de)serialization of Article, FullArticle and TagsMapping.
+
+dataclass_wizard's to_json/from_json inspect the type hints of every field
+of every object written or read, which is a noticeable part of both
+crawling and exporting a corpus. FastCodec builds/reads the same json
+(same camelCase keys, same types once loaded) by hand with orjson (if
+installed, stdlib json otherwise). WizardCodec is the dataclass_wizard way,
+kept to compare against and just in case.
+
+See benchmarks/bench_codec.py for how they compare.
+
+Articles can be read with only some of their fields (a projection, see
+projection()), the others are left None and not converted; Article.get_field()
+and get_raw_html() load the whole article again if one of them is needed
+after all.
+"""
+
+import dataclasses
+import json
+
+from abc import ABC, abstractmethod
+
+from functools import partial
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Iterable, Optional
+
+from up_crawler.data_structures import Article, FullArticle, Language, TagsMapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """numpy/pandas scalars (e.g. art_id from a dataframe) as python ones."""
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Can't serialize {type(obj)}")
+
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    if orjson:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, indent=2 if indent else None
+    ).encode()
+
+
+def _loads(data: bytes | str):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _get(d: dict, camel: str, snake: str):
+    """Field written by us (camelCase) or by hand (snake_case)."""
+    value = d.get(camel)
+    return d.get(snake) if value is None else value
+
+
+ARTICLE_FIELDS = [x.name for x in dataclasses.fields(Article)]
+# Always read, needed to put the translations together into FullArticles
+ALWAYS_READ = frozenset(["lang", "art_id", "date", "tags"])
+
+
+def projection(fields: Optional[Iterable[str]]) -> Optional[frozenset[str]]:
+    """Article fields to read: fields plus ALWAYS_READ; None reads all."""
+    if fields is None:
+        return None
+    fields = frozenset(fields)
+    unknown = fields.difference(ARTICLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown article fields {sorted(unknown)}, have {ARTICLE_FIELDS}")
+    return fields | ALWAYS_READ
+
+
+def _projected(art: Article, fields: frozenset[str]) -> Article:
+    """art with only fields, remembering which ones those are."""
+    for name in ARTICLE_FIELDS:
+        if name not in fields:
+            setattr(art, name, None)
+    art._fields = fields
+    return art
+
+
+def _read_lang(d: dict) -> Optional[Language]:
+    lang = d.get("lang")
+    return Language(lang) if lang is not None else None
+
+
+def _read_art_id(d: dict) -> Optional[str]:
+    # Optional[str] in Article, like dataclass_wizard does
+    art_id = _get(d, "artId", "art_id")
+    return str(art_id) if art_id is not None else None
+
+
+def _read_tags_full(d: dict) -> Optional[list[tuple[str, str, str]]]:
+    tags_full = _get(d, "tagsFull", "tags_full")
+    return [tuple(x) for x in tags_full] if tags_full is not None else None
+
+
+# Article field -> how FastCodec reads it from the json dict
+_FIELD_READERS = {
+    "uri": lambda d: d.get("uri"),
+    "title": lambda d: d.get("title"),
+    "author_name": lambda d: _get(d, "authorName", "author_name"),
+    "text": lambda d: d.get("text"),
+    "raw_html": lambda d: _get(d, "rawHtml", "raw_html"),
+    "lang": _read_lang,
+    "art_id": _read_art_id,
+    "date": lambda d: d.get("date"),
+    "tags_full": _read_tags_full,
+    "tags": lambda d: d.get("tags"),
+    "raw_html_ref": lambda d: _get(d, "rawHtmlRef", "raw_html_ref"),
+}
+
+
+class Codec(ABC):
+    """(De)serializes the data structures to/from json bytes."""
+
+    name: str
+
+    @abstractmethod
+    def dumps_article(self, art: Article, indent: bool = False) -> bytes:
+        """json of art, indented if indent"""
+
+    @abstractmethod
+    def loads_article(
+        self, data: bytes | str, fields: Optional[frozenset[str]] = None
+    ) -> Article:
+        """fields: a projection(), None for all"""
+
+    @abstractmethod
+    def dumps_full_article(self, fa: FullArticle, indent: bool = False) -> bytes:
+        """json of fa, indented if indent"""
+
+    @abstractmethod
+    def loads_full_article(self, data: bytes | str) -> FullArticle:
+        """FullArticle from dumps_full_article()"""
+
+    @abstractmethod
+    def dumps_tags_mapping(self, tm: TagsMapping, indent: bool = False) -> bytes:
+        """json of tm, indented if indent"""
+
+    @abstractmethod
+    def loads_tags_mapping(self, data: bytes | str) -> TagsMapping:
+        """TagsMapping from dumps_tags_mapping()"""
+
+    def write_article(self, art: Article, path: Path, indent: bool = True) -> None:
+        Path(path).write_bytes(self.dumps_article(art, indent=indent))
+
+    def read_article(
+        self, path: Path | str, fields: Optional[frozenset[str]] = None
+    ) -> Article:
+        art = self.loads_article(Path(path).read_bytes(), fields=fields)
+        if fields is not None:
+            # To load the fields left out, if needed after all
+            art._loader = partial(self.read_article, str(path))
+        return art
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class WizardCodec(Codec):
+    """dataclass_wizard's to_json/from_json."""
+
+    name = "wizard"
+
+    @staticmethod
+    def _dumps(obj, indent: bool) -> bytes:
+        return obj.to_json(indent=4 if indent else None, ensure_ascii=False).encode()
+
+    def dumps_article(self, art, indent=False):
+        return self._dumps(art, indent)
+
+    def loads_article(self, data, fields=None):
+        art = Article.from_json(data)
+        return _projected(art, fields) if fields is not None else art
+
+    def dumps_full_article(self, fa, indent=False):
+        return self._dumps(fa, indent)
+
+    def loads_full_article(self, data):
+        return FullArticle.from_json(data)
+
+    def dumps_tags_mapping(self, tm, indent=False):
+        return self._dumps(tm, indent)
+
+    def loads_tags_mapping(self, data):
+        return TagsMapping.from_json(data)
+
+
+class FastCodec(Codec):
+    """The same json as WizardCodec, built by hand, see module docstring."""
+
+    name = "fast"
+
+    @staticmethod
+    def article_to_dict(art: Article) -> dict:
+        return {
+            "uri": art.uri,
+            "title": art.title,
+            "authorName": art.author_name,
+            "text": art.text,
+            "rawHtml": art.raw_html,
+            "lang": art.lang.value if art.lang is not None else None,
+            "artId": art.art_id,
+            "date": art.date,
+            "tagsFull": art.tags_full,
+            "tags": art.tags,
+            "rawHtmlRef": art.raw_html_ref,
+        }
+
+    @staticmethod
+    def article_from_dict(d: dict, fields: Optional[frozenset[str]] = None) -> Article:
+        if fields is None:
+            return Article(
+                uri=d["uri"],
+                title=d["title"],
+                author_name=_get(d, "authorName", "author_name"),
+                text=d["text"],
+                raw_html=_get(d, "rawHtml", "raw_html"),
+                lang=_read_lang(d),
+                art_id=_read_art_id(d),
+                date=d.get("date"),
+                tags_full=_read_tags_full(d),
+                tags=d.get("tags"),
+                raw_html_ref=_get(d, "rawHtmlRef", "raw_html_ref"),
+            )
+        # The required fields are None unless in fields
+        values = dict(uri=None, title=None, author_name=None, text=None)
+        values.update((name, _FIELD_READERS[name](d)) for name in fields)
+        art = Article(**values)
+        art._fields = fields
+        return art
+
+    def dumps_article(self, art, indent=False):
+        return _dumps(self.article_to_dict(art), indent=indent)
+
+    def loads_article(self, data, fields=None):
+        return self.article_from_dict(_loads(data), fields=fields)
+
+    def dumps_full_article(self, fa, indent=False):
+        return _dumps(
+            {
+                "artId": fa.art_id,
+                "datePublished": fa.date_published,
+                "tags": fa.tags,
+                "articles": {
+                    Language(lang).value: self.article_to_dict(art)
+                    for lang, art in fa.articles.items()
+                },
+            },
+            indent=indent,
+        )
+
+    def loads_full_article(self, data):
+        d = _loads(data)
+        return FullArticle(
+            art_id=int(_get(d, "artId", "art_id")),
+            date_published=_get(d, "datePublished", "date_published"),
+            tags=d["tags"],
+            articles={
+                Language(lang): self.article_from_dict(art)
+                for lang, art in d["articles"].items()
+            },
+        )
+
+    def dumps_tags_mapping(self, tm, indent=False):
+        tags_mapping = None
+        if tm.tags_mapping is not None:
+            tags_mapping = {
+                tag_short: {Language(lang).value: value for lang, value in langs.items()}
+                for tag_short, langs in tm.tags_mapping.items()
+            }
+        return _dumps({"tagsMapping": tags_mapping}, indent=indent)
+
+    def loads_tags_mapping(self, data):
+        tags_mapping = _get(_loads(data), "tagsMapping", "tags_mapping")
+        if tags_mapping is not None:
+            tags_mapping = {
+                tag_short: {
+                    Language(lang): tuple(value) if value is not None else None
+                    for lang, value in langs.items()
+                }
+                for tag_short, langs in tags_mapping.items()
+            }
+        return TagsMapping(tags_mapping=tags_mapping)
+
+
+CODECS = {x.name: x for x in (FastCodec(), WizardCodec())}
+DEFAULT_CODEC = FastCodec.name
+
+
+def get_codec(codec: Optional[str | Codec] = None) -> Codec:
+    """Codec by name (one of CODECS), codecs are passed through, None is the default one."""
+    if isinstance(codec, Codec):
+        return codec
+    name = codec if codec else DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name}, have {list(CODECS)}")
+    return CODECS[name]
@@ -17,6 +17,10 @@ URI_TAGS_RU = "https://www.pravda.com.ua/rus/tags/"
 
 TAGS_MAPPING_FN = "tags_mapping.json"
 URIS_TOCRAWL_FN = "uris.csv"
+# State of each URI to crawl, in the output dir
+FRONTIER_FN = "frontier.sqlite"
+# High-water mark of up_daemon, in the output dir
+DAEMON_STATE_FN = "daemon_state.json"
 
 
 # Paragraphs containing this text won't be added to article text, case insensitive
@@ -0,0 +1,165 @@
+"""
+Compact in-memory corpus, for loading whole datasets into RAM.
+
+A list of FullArticles keeps for every translation a full Article: a list
+of paragraph strings, its own copies of the same tag tuples, author names
+and dates as all the others, and the raw html. CompactCorpus keeps
+instead `__slots__` objects with:
+    - the paragraphs joined into a single string
+    - tags, authors, dates etc. interned: one object per distinct value
+    - no raw html
+and gives back FullArticles (without raw_html) on demand.
+
+    corpus = UPReader.read_compact(open_storage(path))
+    for fa in corpus:
+        ...
+"""
+
+import sys
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from tqdm import tqdm
+
+from typing import Iterable, Iterator, Optional
+
+from up_crawler.data_structures import Article, FullArticle, Language
+
+# Between the paragraphs of CompactArticle.text, not used in texts themselves
+PARA_SEP = "\x1e"
+
+
+class CompactArticle:
+    """Article without the raw html and with its text in a single string."""
+
+    __slots__ = (
+        "uri",
+        "title",
+        "author_name",
+        "text",
+        "lang",
+        "art_id",
+        "date",
+        "tags_full",
+        "tags",
+    )
+
+    def __init__(self, art: Article, corpus: "CompactCorpus"):
+        self.uri = art.uri
+        self.title = art.title
+        self.author_name = corpus.intern(art.author_name)
+        self.text = PARA_SEP.join(art.text)
+        self.lang = Language(art.lang) if art.lang is not None else None
+        self.art_id = corpus.intern(art.art_id)
+        self.date = corpus.intern(art.date)
+        self.tags_full = None
+        if art.tags_full is not None:
+            self.tags_full = corpus.intern_tuple(
+                tuple(
+                    corpus.intern_tuple(tuple(map(corpus.intern, x)))
+                    for x in art.tags_full
+                )
+            )
+        self.tags = corpus.intern_tuple(
+            tuple(map(corpus.intern, art.tags)) if art.tags is not None else None
+        )
+
+    def get_paragraphs(self) -> list[str]:
+        return self.text.split(PARA_SEP) if self.text else list()
+
+    def to_article(self) -> Article:
+        return Article(
+            uri=self.uri,
+            title=self.title,
+            author_name=self.author_name,
+            text=self.get_paragraphs(),
+            lang=self.lang,
+            art_id=self.art_id,
+            date=self.date,
+            tags_full=list(self.tags_full) if self.tags_full is not None else None,
+            tags=list(self.tags) if self.tags is not None else None,
+        )
+
+    def __repr__(self):
+        return f"CompactArticle({self.uri})"
+
+
+class _CompactFullArticle:
+    __slots__ = ("art_id", "date_published", "tags", "articles")
+
+    def __init__(self, fa: FullArticle, corpus: "CompactCorpus"):
+        self.art_id = fa.art_id
+        self.date_published = corpus.intern(fa.date_published)
+        self.tags = corpus.intern_tuple(tuple(map(corpus.intern, fa.tags)))
+        # Usually 1-3 translations, a tuple is smaller than a dict
+        self.articles = tuple(
+            CompactArticle(art, corpus=corpus) for art in fa.articles.values()
+        )
+
+    def to_full_article(self) -> FullArticle:
+        return FullArticle(
+            art_id=self.art_id,
+            date_published=self.date_published,
+            tags=list(self.tags),
+            # Keyed by lang code, like UPReader.full_article
+            articles={x.lang.value: x.to_article() for x in self.articles},
+        )
+
+
+class CompactCorpus:
+    """FullArticles kept compactly, see module docstring."""
+
+    def __init__(self):
+        self._articles: list[_CompactFullArticle] = list()
+        # art_id -> position in self._articles
+        self._index: dict[int, int] = dict()
+        self._tuples: dict[tuple, tuple] = dict()
+
+    @staticmethod
+    def intern(s: Optional[str]) -> Optional[str]:
+        return sys.intern(s) if isinstance(s, str) else s
+
+    def intern_tuple(self, t: Optional[tuple]) -> Optional[tuple]:
+        """One tuple object for all equal tuples (of already interned items)."""
+        if t is None:
+            return None
+        return self._tuples.setdefault(t, t)
+
+    def add(self, fa: FullArticle) -> None:
+        self._index[fa.art_id] = len(self._articles)
+        self._articles.append(_CompactFullArticle(fa, corpus=self))
+
+    @classmethod
+    def from_full_articles(cls, fas: Iterable[FullArticle]) -> "CompactCorpus":
+        corpus = cls()
+        for fa in tqdm(fas, desc="articles"):
+            corpus.add(fa)
+        logger.info(f"Loaded {len(corpus)} articles")
+        return corpus
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def __iter__(self) -> Iterator[FullArticle]:
+        """FullArticles (without raw_html), built one at a time."""
+        for x in self._articles:
+            yield x.to_full_article()
+
+    def __getitem__(self, i: int) -> FullArticle:
+        return self._articles[i].to_full_article()
+
+    def __contains__(self, art_id: int) -> bool:
+        return art_id in self._index
+
+    def get(self, art_id: int) -> Optional[FullArticle]:
+        i = self._index.get(art_id)
+        return self[i] if i is not None else None
+
+    def art_ids(self) -> list[int]:
+        return list(self._index)
+
+    def __repr__(self):
+        return f"CompactCorpus({len(self)} articles)"
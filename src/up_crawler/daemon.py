@@ -0,0 +1,284 @@
+"""
+Long-running crawler: every interval, download the articles published
+since the last successful run.
+
+The high-water mark (all articles published up to it were planned and
+crawled) is kept in DAEMON_STATE_FN in the output dir. Each run gets from
+the archive sitemaps only the articles after it, crawls them, and then
+advances it, atomically, to the day before the newest article found: that
+day may still get articles in the archive, so it's planned again next time
+(the URIs already there are skipped by the frontier). A failed run doesn't
+move the mark, so the next one covers its gap too.
+
+Unlike running up_run from cron, the process stays warm between runs:
+the tags mapping stays loaded, the connections (and the month sitemap
+cache) stay open, the paragraph filters compiled.
+
+    up_daemon -o /data/up -ds '2023-11-01' --interval 21600
+"""
+
+import json
+import os
+import pdb
+import sys
+import time
+import traceback
+import argparse
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+import dateparser
+from datetime import datetime, timedelta
+
+from typing import Optional
+
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.consts import DAEMON_STATE_FN, URIS_TOCRAWL_FN
+from up_crawler.get_uris import (
+    UPSitemapCrawler,
+    _add_sitemap_args,
+    _sitemap_crawler_from_args,
+)
+from up_crawler.html_parsers import _add_parser_args
+from up_crawler.http_session import _add_session_args, _session_from_args
+from up_crawler.path_ops import make_path_ok, mkdir
+from up_crawler.randomization import _add_rate_limit_args, _parse_timeout
+from up_crawler.raw_archive import RawArchiveWriter
+from up_crawler.storage import _add_storage_args, _storage_from_args
+
+
+class Watermark:
+    """Persisted high-water mark: the articles published up to it are done."""
+
+    def __init__(self, path: Path | str):
+        self.path = make_path_ok(path)
+
+    def load(self) -> Optional[datetime]:
+        if not self.path.exists():
+            return None
+        state = json.loads(self.path.read_text())
+        return datetime.fromisoformat(state["watermark"])
+
+    def store(self, watermark: datetime) -> None:
+        """Replace the stored mark, atomically."""
+        state = {"watermark": watermark.isoformat(), "updated": time.time()}
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        tmp_path.write_text(json.dumps(state))
+        tmp_path.replace(self.path)
+
+    def __repr__(self):
+        return f"Watermark({self.path})"
+
+
+class UPDaemon:
+    """Crawls the gap since the last run on a schedule, see module docstring."""
+
+    INTERVAL_SEC = 24 * 60 * 60
+
+    def __init__(
+        self,
+        crawler: UPCrawler,
+        start: datetime | str,
+        sitemap_crawler: Optional[UPSitemapCrawler] = None,
+    ):
+        """crawler: downloads the planned articles to its target_dir
+        start: where to start if there's no mark yet"""
+        self.crawler = crawler
+        self.sitemap_crawler = (
+            sitemap_crawler
+            if sitemap_crawler
+            else UPSitemapCrawler(session=crawler.session)
+        )
+        self.watermark = Watermark(crawler.target_dir / DAEMON_STATE_FN)
+        self.start = dateparser.parse(start) if isinstance(start, str) else start
+
+    def plan(
+        self, now: Optional[datetime] = None
+    ) -> tuple[Optional[Path], Optional[datetime]]:
+        """Save the URIs of the articles published after the mark, returns
+        the csv (None if there are none) and the mark once they're crawled."""
+        since = self.watermark.load()
+        since = since if since else self.start
+        now = now if now else datetime.now()
+        logger.info(f"Planning the articles published after {since}")
+        try:
+            df = self.sitemap_crawler.get_article_uris(d1=since, d2=now)
+        except ValueError as e:
+            # Nothing new in the archive (yet)
+            logger.info(f"Nothing to crawl: {e}")
+            return None, since
+        csv_path = self.sitemap_crawler.save_articles_df(
+            df, save_path=self.crawler.target_dir / URIS_TOCRAWL_FN
+        )
+        # The newest day may still get articles, so it's planned again next time
+        newest = df.date.max().to_pydatetime()
+        return csv_path, max(since, newest - timedelta(days=1))
+
+    def run_once(self, now: Optional[datetime] = None) -> bool:
+        """Plan, crawl and advance the mark; True if anything was crawled."""
+        csv_path, new_mark = self.plan(now=now)
+        if csv_path is None:
+            return False
+        self.crawler.run(input_csv=csv_path)
+        self.watermark.store(new_mark)
+        logger.info(f"Crawled everything up to {new_mark}")
+        return True
+
+    def run(
+        self, interval: float = INTERVAL_SEC, max_runs: Optional[int] = None
+    ) -> None:
+        """run_once() every interval seconds, max_runs times (None: until
+        interrupted). A failed run is logged and retried next time."""
+        num_runs = 0
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception(f"Run failed, mark stays at {self.watermark.load()}: {e}")
+            num_runs += 1
+            if max_runs and num_runs >= max_runs:
+                break
+            wait = max(0, interval - (time.monotonic() - started))
+            logger.info(f"Next run in {wait:.0f}s")
+            time.sleep(wait)
+
+    def __repr__(self):
+        return f"UPDaemon({self.crawler.target_dir}, {self.watermark})"
+
+
+def run(args):
+    logger.info(f"Running with params {args}")
+    target_dir = mkdir(make_path_ok(args.output))
+    session = _session_from_args(args)
+    crawler = UPCrawler(
+        input_csv=None,
+        target_dir=target_dir,
+        randomization_params=_parse_timeout(args),
+        tags_mapping_file=args.tags_mapping_file,
+        concurrency=args.concurrency,
+        session=session,
+        archive=RawArchiveWriter(args.archive) if args.archive else None,
+        parse_workers=args.parse_workers,
+        html_parser=args.html_parser,
+        storage=_storage_from_args(args, target_dir=target_dir),
+    )
+    daemon = UPDaemon(
+        crawler,
+        start=args.date_start,
+        sitemap_crawler=_sitemap_crawler_from_args(args, session=session),
+    )
+    daemon.run(interval=args.interval, max_runs=1 if args.once else None)
+
+
+def parse_args() -> argparse.Namespace:
+    DEFAULT_START_DATE = "three days ago"
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Output for the dataset, the mark is kept there too",
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        "--date_start",
+        "-ds",
+        help="Starting date for articles if there's no mark yet, as str (%(default)s)",
+        type=str,
+        default=DEFAULT_START_DATE,
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=UPDaemon.INTERVAL_SEC,
+        help="Seconds from the start of a run to the start of the next one (%(default)s)",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Crawl the gap since the last run and exit, e.g. for cron",
+    )
+    parser.add_argument(
+        "--tags_mapping_file",
+        "-tm",
+        help="Location of file with tags mapping, if present. (%(default)s)",
+        type=Path,
+    )
+    parser.add_argument(
+        "--timeout",
+        "-t",
+        type=int,
+        default=5,
+        help="""Max timeout when crawling articles, set to -1 to disable \
+                all kinds of randomization. (%(default)s)""",
+    )
+    _add_rate_limit_args(parser)
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=1,
+        help="""Max number of article requests in flight at the same time, \
+                >1 uses the asyncio crawler. (%(default)s)""",
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        default=0,
+        help="""Parser processes for the asyncio crawler (-c >1), \
+                0 parses in the crawler's thread. (%(default)s)""",
+    )
+    _add_parser_args(parser)
+    _add_session_args(parser)
+    _add_sitemap_args(parser)
+    _add_storage_args(parser)
+    parser.add_argument(
+        "--archive",
+        type=Path,
+        help="Archive raw responses of articles to this .warc.gz, see up_reparse (%(default)s)",
+    )
+    parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
+    parser.add_argument(
+        "-q",
+        help="Output only warnings",
+        action="store_const",
+        dest="loglevel",
+        const=logging.WARN,
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Output more details",
+        action="store_const",
+        dest="loglevel",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.setLevel(args.loglevel if args.loglevel else logging.INFO)
+
+    logger.debug(args)
+
+    try:
+        run(args)
+    except Exception as e:
+        if args.pdb:
+            extype, value, tb = sys.exc_info()
+            traceback.print_exc()
+            pdb.post_mortem(tb)
+        else:
+            logger.exception(e)
+
+
+if __name__ == "__main__":
+    main()
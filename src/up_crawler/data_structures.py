@@ -60,10 +60,48 @@ class Article(JSONSerializable, JSONFileWizard):
     ] = None  # tag_short_name, tag_name, tag_link
     tags: Optional[List[str]] = None
 
+    # sha256 of raw_html when it's kept in a BlobStore instead (see blobs.py),
+    # raw_html is None then. See self.get_raw_html()
+    raw_html_ref: Optional[str] = None
+
     def get_text(self):
         """Get the article text as single string."""
         return " ".join(self.text)
 
+    def get_raw_html(self) -> Optional[str]:
+        """raw_html, loaded from the blob store of the storage it was read
+        from if only its raw_html_ref is there."""
+        if not self._is_read("raw_html") or not self._is_read("raw_html_ref"):
+            return self._read_whole().get_raw_html()
+        if self.raw_html is None and self.raw_html_ref:
+            blobs = getattr(self, "_blobs", None)
+            if blobs is None:
+                raise ValueError(f"No blob store to load raw html of {self.uri} from")
+            return blobs.get(self.raw_html_ref)
+        return self.raw_html
+
+    def get_field(self, name: str):
+        """Field name, read now if it was left out when the article was read
+        (see codec.projection)."""
+        if name == "raw_html":
+            return self.get_raw_html()
+        if not self._is_read(name):
+            return getattr(self._read_whole(), name)
+        return getattr(self, name)
+
+    def _is_read(self, name: str) -> bool:
+        fields = getattr(self, "_fields", None)
+        return fields is None or name in fields
+
+    def _read_whole(self) -> "Article":
+        """The article read again with all its fields."""
+        loader = getattr(self, "_loader", None)
+        if loader is None:
+            raise ValueError(f"Don't know where to read all of {self.uri} from")
+        art = loader()
+        art._blobs = getattr(self, "_blobs", None)
+        return art
+
     def __rich_repr__(self) -> rich.repr.Result:
         yield "ID", self.art_id,
         yield "lang", self.lang.name
@@ -0,0 +1,161 @@
+"""
+Manifest of the articles exported by up_convert, for incremental exports.
+
+For every translation exported it records (in a sqlite db next to the
+output) its content hash, where it was exported to, and a cheap signature
+of its stored version (file mtime and size, or shard record position).
+The next `up_convert --incremental` then only hashes the translations whose
+signature changed, and exports only the articles with a translation that's
+new or whose content actually changed: appended rows for CSV, new part
+files for Parquet. The manifest also knows which export run holds each
+article, so the old rows of an article exported again are dropped from
+there first (see runs_of()), and every article is in the output once.
+"""
+
+import hashlib
+import sqlite3
+import time
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Iterable, Optional
+
+from up_crawler.path_ops import make_path_ok
+
+
+class ExportManifest:
+    """What was exported where, see module docstring."""
+
+    FN = "_export_manifest.sqlite"
+    # Outputs that are files, the manifest goes next to them
+    FILE_SUFFIXES = (".csv", ".parquet")
+
+    def __init__(self, db_path: Path | str):
+        self.db_path = make_path_ok(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS exported (
+                art_id INTEGER NOT NULL,
+                lang TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                output TEXT NOT NULL,
+                run INTEGER NOT NULL,
+                exported_at REAL NOT NULL,
+                PRIMARY KEY (art_id, lang)
+            )"""
+        )
+        self._db.commit()
+
+    @staticmethod
+    def path_for(output: Path | str) -> Path:
+        """Default manifest of an export: in the output dir (as a file
+        pyarrow ignores), or next to the output file."""
+        output = make_path_ok(output)
+        if output.suffix in ExportManifest.FILE_SUFFIXES:
+            return output.with_name(output.name + ".manifest.sqlite")
+        return output / ExportManifest.FN
+
+    def next_run(self) -> int:
+        """Number of the next export, e.g. to name its part files."""
+        return self._db.execute("SELECT COALESCE(MAX(run), 0) + 1 FROM exported").fetchone()[0]
+
+    def delta(self, storage) -> tuple[list[int], list[tuple]]:
+        """Articles (art_ids, sorted) of storage with new or changed
+        translations since they were last exported, and the manifest rows
+        to record() once they are."""
+        exported = {
+            (art_id, lang): (signature, content_hash)
+            for art_id, lang, signature, content_hash in self._db.execute(
+                "SELECT art_id, lang, signature, content_hash FROM exported"
+            )
+        }
+        # Nothing exported yet (e.g. reset() for a full export): all of it
+        # is new anyway. Not hashed, so once rewritten it's exported again
+        hash_content = bool(exported)
+        art_ids = set()
+        rows = list()
+        num_touched = 0
+        for art_id, lang, signature in storage.signatures():
+            old = exported.get((art_id, lang))
+            if old and old[0] == signature:
+                continue
+            content_hash = (
+                hashlib.sha256(storage.read_bytes(art_id, lang)).hexdigest()
+                if hash_content
+                else ""
+            )
+            rows.append((art_id, lang, signature, content_hash))
+            if old and old[1] == content_hash:
+                # Rewritten, but the same
+                num_touched += 1
+                continue
+            art_ids.add(art_id)
+        logger.info(
+            f"{len(art_ids)} articles new or changed since the last export"
+            + (f" ({num_touched} translations rewritten unchanged)" if num_touched else "")
+        )
+        return sorted(art_ids), rows
+
+    def runs_of(self, art_ids: Iterable[int]) -> dict[int, set[int]]:
+        """Export runs holding the articles, {run: art_ids}, e.g. to drop
+        the old rows of the ones about to be exported again."""
+        art_ids = set(art_ids)
+        runs = dict()
+        for art_id, run in self._db.execute("SELECT DISTINCT art_id, run FROM exported"):
+            if art_id in art_ids:
+                runs.setdefault(run, set()).add(art_id)
+        return runs
+
+    def record(
+        self,
+        rows: Iterable[tuple],
+        output: Path | str,
+        run: int,
+        art_ids: Optional[Iterable[int]] = None,
+    ) -> None:
+        """Record rows from delta() as exported to output by export run.
+
+        art_ids: the articles from delta(), all their translations are in
+            run now; None: the articles of all rows
+        """
+        now = time.time()
+        rows = list(rows)
+        art_ids = set(art_ids) if art_ids is not None else {row[0] for row in rows}
+        with self._db:
+            self._db.executemany(
+                """INSERT OR REPLACE INTO exported
+                (art_id, lang, signature, content_hash, output, run, exported_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(*row, str(output), run, now) for row in rows if row[0] in art_ids],
+            )
+            # Rewritten unchanged, still in the run that exported them
+            self._db.executemany(
+                "UPDATE exported SET signature = ? WHERE art_id = ? AND lang = ?",
+                [(row[2], row[0], row[1]) for row in rows if row[0] not in art_ids],
+            )
+            # Their unchanged translations were exported again with them
+            self._db.executemany(
+                "UPDATE exported SET output = ?, run = ? WHERE art_id = ?",
+                [(str(output), run, art_id) for art_id in art_ids],
+            )
+
+    def reset(self) -> None:
+        """Forget everything exported, e.g. when the output is rewritten."""
+        with self._db:
+            self._db.execute("DELETE FROM exported")
+
+    def num_exported(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM exported").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __repr__(self):
+        return f"ExportManifest({self.db_path})"
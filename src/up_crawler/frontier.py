@@ -0,0 +1,337 @@
+"""
+Persistent crawl frontier: the state of every URI to crawl, in a sqlite db
+(WAL mode) in the output directory.
+
+Resuming a crawl doesn't need to look at the files already downloaded:
+the URIs still to do are a query away. Several crawlers (processes) can
+work on the same output directory, each leasing its own batches of
+articles; leases not finished in time (e.g. the crawler was killed) are
+leased again by whoever comes next.
+
+States of a URI:
+    pending -> in_flight (leased) -> done | 404 | failed
+Failed attempts go back to pending until MAX_ATTEMPTS.
+
+The tags of the downloaded articles are kept there too, one row per
+(tag, language), so that a tags mapping can be updated with them without
+reading the articles.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+import pandas as pd
+
+from typing import Iterator, Optional
+
+from up_crawler.path_ops import make_path_ok
+
+
+class CrawlFrontier:
+    """URIs to crawl and their state, grouped by article (art_id)."""
+
+    PENDING = "pending"
+    IN_FLIGHT = "in_flight"
+    DONE = "done"
+    NOT_FOUND = "404"
+    FAILED = "failed"
+
+    # Columns of the URI lists used by the crawlers
+    COLUMNS = ["uri", "lang", "id", "date"]
+
+    MAX_ATTEMPTS = 3
+    # A lease not finished in this time is considered abandoned
+    LEASE_SEC = 60 * 60
+
+    def __init__(self, db_path: Path | str, worker: Optional[str] = None):
+        self.db_path = make_path_ok(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Leases are taken in the name of this worker
+        self.worker = worker if worker else f"{socket.gethostname()}-{os.getpid()}"
+
+        # The connection is shared by the threads of this process
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            self.db_path, check_same_thread=False, timeout=60, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS uris (
+                uri TEXT PRIMARY KEY,
+                art_id INTEGER NOT NULL,
+                lang TEXT NOT NULL,
+                date TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                updated REAL
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS uris_state ON uris(state, art_id)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS uris_art_id ON uris(art_id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS tags (
+                tag_short TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                tag_name TEXT NOT NULL,
+                tag_link TEXT NOT NULL,
+                PRIMARY KEY (tag_short, lang)
+            )"""
+        )
+
+    def _transaction(self):
+        """Write transaction taken right away, so that concurrent leases
+        by other processes wait instead of racing."""
+        return _Transaction(self._db, self._lock)
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def add(self, df: pd.DataFrame, is_downloaded=None) -> int:
+        """Add the URIs not known yet (with at least COLUMNS), returns how many.
+
+        is_downloaded(art_id, lang, uri) -> bool: the URIs already downloaded
+            are added as done, like reconcile() does for the ones added before
+        """
+        if pd.api.types.is_datetime64_any_dtype(df.date):
+            # Straight from the sitemaps: same dates as in their csvs
+            df = df.assign(date=df.date.dt.strftime("%Y-%m-%d"))
+        now = time.time()
+        rows = [
+            (
+                r.uri,
+                int(r.id),
+                r.lang,
+                str(r.date),
+                self.DONE
+                if is_downloaded and is_downloaded(int(r.id), lang=r.lang, uri=r.uri)
+                else self.PENDING,
+                now,
+            )
+            for r in df[self.COLUMNS].itertuples(index=False)
+        ]
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                """INSERT OR IGNORE INTO uris (uri, art_id, lang, date, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            return db.total_changes - before
+
+    def import_csv(self, csv_path: Path | str, is_downloaded=None) -> int:
+        """Add the URIs of a UPSitemapCrawler csv, unless it was imported
+        already (same path, size and mtime). Returns number of new URIs.
+
+        is_downloaded: see add()
+        """
+        csv_path = make_path_ok(csv_path)
+        stat = csv_path.stat()
+        marker = f"{stat.st_size}:{stat.st_mtime_ns}"
+        key = f"imported:{csv_path}"
+        if self._get_meta(key) == marker:
+            logger.debug(f"{csv_path} already imported")
+            return 0
+        num_new = self.add(pd.read_csv(csv_path), is_downloaded=is_downloaded)
+        with self._transaction():
+            self._set_meta(key, marker)
+        logger.info(f"Imported {num_new} new URIs from {csv_path}")
+        return num_new
+
+    def reconcile(self, is_downloaded) -> int:
+        """Once per frontier: mark as done the pending URIs already
+        downloaded before the frontier existed.
+
+        is_downloaded(art_id, lang, uri) -> bool, e.g. ArticleStorage.exists
+        """
+        if self._get_meta("reconciled"):
+            return 0
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uri, art_id, lang FROM uris WHERE state = ?", (self.PENDING,)
+            ).fetchall()
+        now = time.time()
+        done = [
+            (self.DONE, now, uri)
+            for uri, art_id, lang in rows
+            if is_downloaded(art_id, lang=lang, uri=uri)
+        ]
+        with self._transaction() as db:
+            db.executemany("UPDATE uris SET state = ?, updated = ? WHERE uri = ?", done)
+            self._set_meta("reconciled", str(time.time()))
+        if done:
+            logger.info(f"{len(done)} URIs were already downloaded")
+        return len(done)
+
+    def lease(self, num_articles: int = 20) -> list[tuple[int, pd.DataFrame]]:
+        """Lease the pending URIs of up to num_articles articles.
+
+        Returns (art_id, group) tuples like df.groupby('id'), empty list
+        when there's nothing left to do.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            art_ids = [
+                x[0]
+                for x in db.execute(
+                    """SELECT DISTINCT art_id FROM uris
+                    WHERE state = ? OR (state = ? AND lease_until < ?)
+                    ORDER BY art_id LIMIT ?""",
+                    (self.PENDING, self.IN_FLIGHT, now, num_articles),
+                ).fetchall()
+            ]
+            if not art_ids:
+                return list()
+            placeholders = ",".join("?" * len(art_ids))
+            rows = db.execute(
+                f"""SELECT uri, lang, art_id, date FROM uris
+                WHERE art_id IN ({placeholders})
+                AND (state = ? OR (state = ? AND lease_until < ?))
+                ORDER BY art_id, uri""",
+                (*art_ids, self.PENDING, self.IN_FLIGHT, now),
+            ).fetchall()
+            db.executemany(
+                """UPDATE uris SET state = ?, attempts = attempts + 1,
+                worker = ?, lease_until = ?, updated = ? WHERE uri = ?""",
+                [
+                    (self.IN_FLIGHT, self.worker, now + self.LEASE_SEC, now, r[0])
+                    for r in rows
+                ],
+            )
+        df = pd.DataFrame(rows, columns=self.COLUMNS)
+        return list(df.groupby("id"))
+
+    def iter_groups(self, num_articles: int = 20) -> Iterator[tuple[int, pd.DataFrame]]:
+        """Lease batches until nothing is left, one (art_id, group) at a time."""
+        while groups := self.lease(num_articles=num_articles):
+            yield from groups
+
+    def mark(
+        self, uri: str, state: str, tags: Optional[list[tuple[str, str, str]]] = None
+    ) -> bool:
+        """Set the final state of a leased URI: DONE, NOT_FOUND or FAILED.
+        Returns False if it'll be leased again.
+
+        FAILED URIs are retried later, unless they failed MAX_ATTEMPTS times.
+        tags: Article.tags_full of a DONE article, added to the tag index
+        """
+        with self._transaction() as db:
+            if tags:
+                # Last one wins, like in UPCrawler.update_tags_mapping
+                db.executemany(
+                    """INSERT OR REPLACE INTO tags (tag_short, lang, tag_name, tag_link)
+                    SELECT ?, lang, ?, ? FROM uris WHERE uri = ?""",
+                    [(*tag, uri) for tag in tags],
+                )
+            if state == self.FAILED:
+                db.execute(
+                    "UPDATE uris SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                    "lease_until = NULL, updated = ? WHERE uri = ?",
+                    (self.MAX_ATTEMPTS, self.PENDING, self.FAILED, time.time(), uri),
+                )
+                row = db.execute("SELECT state FROM uris WHERE uri = ?", (uri,)).fetchone()
+                return not row or row[0] == self.FAILED
+            db.execute(
+                "UPDATE uris SET state = ?, lease_until = NULL, updated = ? "
+                "WHERE uri = ?",
+                (state, time.time(), uri),
+            )
+        return True
+
+    def release(self) -> None:
+        """Give back the URIs leased by this worker and not finished."""
+        with self._transaction() as db:
+            db.execute(
+                """UPDATE uris SET state = ?, attempts = MAX(0, attempts - 1),
+                lease_until = NULL WHERE state = ? AND worker = ?""",
+                (self.PENDING, self.IN_FLIGHT, self.worker),
+            )
+
+    def tags(self) -> dict[str, list[tuple[str, str, str]]]:
+        """Tags of all downloaded articles, as
+        {lang: [(tag_short, tag_name, tag_link), ...]}"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT lang, tag_short, tag_name, tag_link FROM tags"
+            ).fetchall()
+        tags = dict()
+        for lang, *tag in rows:
+            tags.setdefault(lang, list()).append(tuple(tag))
+        return tags
+
+    def counts(self) -> dict[str, int]:
+        """Number of URIs in each state."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM uris GROUP BY state"
+            ).fetchall()
+        return dict(rows)
+
+    def num_articles(self, state: Optional[str] = None) -> int:
+        """Number of articles (all, or with a URI in this state)."""
+        query = "SELECT COUNT(DISTINCT art_id) FROM uris"
+        params = tuple()
+        if state:
+            query += " WHERE state = ?"
+            params = (state,)
+        with self._lock:
+            return self._db.execute(query, params).fetchone()[0]
+
+    def report(self) -> str:
+        counts = self.counts()
+        return "Frontier: " + ", ".join(f"{v} {k}" for k, v in sorted(counts.items()))
+
+    def close(self):
+        self._db.close()
+
+    def __repr__(self):
+        return f"CrawlFrontier({self.db_path}, worker={self.worker})"
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (or ROLLBACK on exceptions)."""
+
+    def __init__(self, db: sqlite3.Connection, lock: threading.RLock):
+        self.db = db
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.lock.release()
+            raise
+        return self.db
+
+    def __exit__(self, exc_type, *args):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
@@ -16,17 +16,21 @@ logger = logging.getLogger(__name__)
 from pathlib import Path
 
 import re
+import zlib
+import xml.etree.ElementTree as ET
 
 import requests
 from bs4 import BeautifulSoup
 from unicodedata import normalize
 from urllib.parse import urlparse
-from urllib.error import HTTPError
-
-import advertools as adv
 
 import dateparser
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from collections import deque
+from itertools import islice
 
 import pandas as pd
 
@@ -35,7 +39,7 @@ from dataclasses import dataclass
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
-from typing import List, Tuple, Optional, Dict, Union
+from typing import List, Tuple, Optional, Dict, Union, Iterator, Iterable
 
 from up_crawler.data_structures import (
     Language,
@@ -43,8 +47,15 @@ from up_crawler.data_structures import (
 )
 
 from up_crawler.randomization import RandomizationParams
+from up_crawler.http_session import (
+    UPSession,
+    get_default_session,
+    _add_session_args,
+    _session_from_args,
+    iter_body,
+)
 
-from up_crawler.consts import URI_REGEX_EXT
+from up_crawler.sitemap_cache import MonthSitemapCache
 from up_crawler.path_ops import (
     make_path_ok,
     make_writable,
@@ -60,8 +71,23 @@ b = breakpoint
 class UPSitemapCrawler:
     """Parses sitemap and gets URIs of articles to later download."""
 
-    # Latest (~1month-ish?) articles - TODO implement
+    # A month's archive sitemap can still change for a bit after its end
+    # (late translations etc.), after that it's cached as immutable
+    SITEMAP_GRACE_DAYS = 3
+
+    # <loc> of <url> in sitemaps
+    SITEMAP_LOC_TAG = "{http://www.sitemaps.org/schemas/sitemap/0.9}loc"
+    SITEMAP_URL_TAG = "{http://www.sitemaps.org/schemas/sitemap/0.9}url"
+
+    # Columns of the sitemap dataframes
+    SITEMAP_COLUMNS = ["uri", "date", "domain", "lang", "kind", "art_id", "id"]
+    # Only articles of this kind are kept from the sitemaps
+    SITEMAP_KIND = "news"
+
+    # Latest articles, the ones not in the archive sitemaps yet (see tail.py)
     SITEMAP_CURRENT_MONTH_URI = "https://www.pravda.com.ua/sitemap/sitemap-news.xml"
+    SITEMAP_NOW_URI = "https://www.pravda.com.ua/sitemap/sitemap-now.xml"
+    SITEMAP_LATEST_URIS = [SITEMAP_CURRENT_MONTH_URI, SITEMAP_NOW_URI]
 
     # Articles from before that
     SITEMAP_MONTH_ARCHIVE_URI = (
@@ -76,6 +102,23 @@ class UPSitemapCrawler:
         https://www.pravda.com.ua/sitemap/sitemap-now.xml
     """
 
+    # Month sitemaps downloaded at once
+    SITEMAP_WORKERS = 4
+
+    def __init__(
+        self,
+        session: Optional[UPSession] = None,
+        sitemap_workers: int = SITEMAP_WORKERS,
+        month_cache: Optional[MonthSitemapCache] = None,
+    ):
+        # Pooled connections shared with the article crawler if passed
+        self.session = session if session else get_default_session()
+        self.sitemap_workers = sitemap_workers
+        # If set, parsed month sitemaps are kept there, see sitemap_cache.py
+        self.month_cache = month_cache
+        # Latest sitemap uri -> validators of its last response
+        self._latest_validators: dict[str, dict] = dict()
+
     @classmethod
     def _get_sitemap_uri_for_month(cls, day: datetime):
         # TODO - handle archive VS news sitemaps
@@ -89,35 +132,294 @@ class UPSitemapCrawler:
         sitemap_uri = cls.SITEMAP_MONTH_ARCHIVE_URI.format(year=year, month=month)
         return sitemap_uri
 
-    def get_articles_from_sitemap(self, sitemap_uri: str) -> Optional[pd.DataFrame]:
+    @classmethod
+    def _is_month_closed(cls, day: datetime) -> bool:
+        """True if the sitemap of day's month won't change anymore."""
+        next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return next_month + timedelta(days=cls.SITEMAP_GRACE_DAYS) < datetime.now()
+
+    def get_articles_from_sitemap(
+        self, sitemap_uri: str, immutable: bool = False
+    ) -> Optional[pd.DataFrame]:
         """Get articles from sitemap at URI, return DataFrame with columns
         domain, lang, art_id.
 
         If file not found return None, raises all other HTTP/connection exceptions
+
+        immutable: the sitemap won't change anymore, so if the session has a cache
+            it'll be used without asking the server
+        """
+        res = self._get_sitemap(sitemap_uri, immutable=immutable)
+        if res is None:
+            return None
+        return self._read_sitemap_df(res)
+
+    def _get_sitemap(
+        self, sitemap_uri: str, immutable: bool = False, headers: Optional[dict] = None
+    ):
+        """Response with the sitemap at sitemap_uri (or a 304 to headers),
+        None if there's none. The body isn't read yet, see _read_sitemap_df()."""
+        logger.info(f"Getting {sitemap_uri}")
+        res = self.session.get(
+            sitemap_uri,
+            headers=headers,
+            timeout=(10, 60),
+            immutable=immutable,
+            stream=True,
+        )
+        if res.status_code not in (200, 304):
+            res.close()
+        if res.status_code == 404:
+            logger.debug(f"No sitemap at {sitemap_uri}")
+            return None
+        if res.status_code not in (200, 304):
+            logger.error(
+                f"HTTP {res.status_code} when getting sitemap {sitemap_uri}"
+            )
+            res.raise_for_status()
+        return res
+
+    def _read_sitemap_df(
+        self, res, d1: Optional[datetime] = None, d2: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """_sitemap_df() of a response from _get_sitemap(), parsed as its
+        body is downloaded."""
+        try:
+            return self._sitemap_df(iter_body(res), d1=d1, d2=d2)
+        finally:
+            res.close()
+
+    @classmethod
+    def _sitemap_df(
+        cls,
+        content: bytes | Iterable[bytes],
+        d1: Optional[datetime] = None,
+        d2: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        """Dataframe of the news articles in a sitemap, only the ones
+        published after d1 and before d2 if given (like _filter_arts_by_hr_date).
+
+        content: the sitemap, or the chunks of its body as downloaded.
+        It's parsed as a stream and the rows filtered while at it, without
+        building its tree or a dataframe of all its URIs.
         """
         # we expect to get an archive sitemap, so no cool metadata from news sitemap
         # we emphatically don't trust lastmod because it's not publishing date
-        try:
-            dfo = adv.sitemap_to_df(sitemap_uri, recursive=False)
-        except HTTPError as e:
-            if e.status == 404:
-                logger.debug(f"No sitemap at {sitemap_uri}")
-                return None
-            logger.error(f"HTTPError when getting sitemap {sitemap_uri}")
-            logger.exception(e)
-            raise
-
-        # dataframe with capture groups extracted as columns
-        # we expect all URIs to have a trailing slash!
-        df = dfo["loc"].str.extract(URI_REGEX_EXT)
-        df["date"] = pd.to_datetime(df.date_part, format="%Y/%m/%d")
+        # (y, m, d) of the first and last day to keep
+        first = (d1 + timedelta(days=1)).timetuple()[:3] if d1 else None
+        last = None
+        if d2:
+            last = (d2 if d2.time() != datetime.min.time() else d2 - timedelta(days=1))
+            last = last.timetuple()[:3]
+
+        rows = list()
+        for loc in cls._iter_sitemap_locs(content):
+            parts = cls.split_article_uri(loc)
+            if parts is None or parts[4] != cls.SITEMAP_KIND:
+                continue
+            day = tuple(map(int, parts[1].split("/")))
+            if (first and day < first) or (last and day > last):
+                continue
+            rows.append(parts)
 
+        df = pd.DataFrame(rows, columns=cls.SITEMAP_COLUMNS)
+        df["date"] = pd.to_datetime(df.date, format="%Y/%m/%d")
         # ukrainian language where not mentioned in the URI, so ukr/rus/eng
         df.loc[df.lang.isna(), "lang"] = Language.UA.value
-        df = df[["uri", "date", "domain", "lang", "kind", "art_id", "id"]]
-        df = df[df.kind == "news"]
         return df
 
+    @staticmethod
+    def split_article_uri(uri: str) -> Optional[tuple[str, ...]]:
+        """(uri, date_part, domain, lang, kind, art_id, id) of an article URI
+        like https://www.pravda.com.ua/eng/news/2023/11/13/7428464/, the same
+        as the groups of URI_REGEX_EXT would be; lang is None for ukr.
+
+        None if it isn't one (e.g. no trailing slash, or more path after the id).
+        """
+        domain_end = uri.find(".com.ua/")
+        if domain_end < 0 or not uri.endswith("/"):
+            return None
+        domain_end += len(".com.ua/")
+        parts = uri[domain_end:-1].split("/")
+        lang = None
+        if parts[0] in ("eng", "rus"):
+            lang = parts.pop(0)
+        if len(parts) != 5:
+            return None
+        kind, year, month, day, art_num = parts
+        if not (
+            len(year) == 4
+            and year.isdigit()
+            and month.isdigit()
+            and day.isdigit()
+            and art_num
+        ):
+            return None
+        date_part = f"{year}/{month}/{day}"
+        art_id = f"{date_part}/{art_num}/"
+        return uri, date_part, uri[:domain_end], lang, kind, art_id, art_num
+
+    @staticmethod
+    def months_needed(d1: datetime, d2: datetime) -> list[pd.Period]:
+        """Months with articles published between d1 and d2, both included."""
+        return list(pd.period_range(start=d1, end=d2, freq="M"))
+
+    def get_month(
+        self,
+        month: pd.Period,
+        d1: Optional[datetime] = None,
+        d2: Optional[datetime] = None,
+    ) -> Optional[pd.DataFrame]:
+        """Dataframe of the articles in month's sitemap (None if it has none),
+        from self.month_cache if it's there and still valid.
+
+        Without a month cache, only the ones published between d1 and d2.
+        """
+        day = month.to_timestamp().to_pydatetime()
+        sm_uri = self._get_sitemap_uri_for_month(day)
+        # if we ended up in the future that's okay, skip
+        if sm_uri is None:
+            return None
+        closed = self._is_month_closed(day)
+        if not self.month_cache:
+            # Nothing to keep, so only the articles between d1 and d2
+            res = self._get_sitemap(sm_uri, immutable=closed)
+            return self._read_sitemap_df(res, d1=d1, d2=d2) if res is not None else None
+
+        df, meta = self.month_cache.load(month)
+        if meta and meta["closed"]:
+            logger.debug(f"{month} from {self.month_cache}")
+            return df
+        res = self._get_sitemap(
+            sm_uri,
+            immutable=closed,
+            headers=self.month_cache.conditional_headers(meta) if df is not None else None,
+        )
+        if res is not None and res.status_code == 304:
+            logger.debug(f"{month} not modified, from {self.month_cache}")
+            res.close()
+            return df
+        df = self._read_sitemap_df(res) if res is not None else None
+        if df is not None or closed:
+            # Sitemaps of open months may still appear
+            self.month_cache.store(
+                month,
+                df,
+                uri=sm_uri,
+                closed=closed,
+                headers=res.headers if res is not None else None,
+            )
+        return df
+
+    def get_latest_articles(self) -> pd.DataFrame:
+        """Dataframe of the articles in the latest sitemaps (SITEMAP_LATEST_URIS),
+        the ones not in the archive sitemaps yet.
+
+        The sitemaps are requested conditionally, the ones not changed
+        since the last call are skipped; nothing changed -> empty dataframe.
+        """
+        dfs = list()
+        for sm_uri in self.SITEMAP_LATEST_URIS:
+            validators = self._latest_validators.get(sm_uri)
+            res = self._get_sitemap(
+                sm_uri, headers=MonthSitemapCache.conditional_headers(validators)
+            )
+            if res is None:
+                continue
+            if res.status_code == 304:
+                res.close()
+                continue
+            dfs.append(self._read_sitemap_df(res))
+            # Only once it's parsed, or its URIs would be lost behind a 304
+            self._latest_validators[sm_uri] = {
+                "etag": res.headers.get("etag"),
+                "last_modified": res.headers.get("last-modified"),
+            }
+        if not dfs:
+            return pd.DataFrame(columns=self.SITEMAP_COLUMNS)
+        return pd.concat(dfs).drop_duplicates("uri")
+
+    def get_months(
+        self,
+        months: list[pd.Period],
+        d1: Optional[datetime] = None,
+        d2: Optional[datetime] = None,
+    ) -> list[pd.DataFrame]:
+        """Dataframes of the months that have a sitemap, downloaded
+        self.sitemap_workers at a time. See get_month() for d1, d2."""
+        get_month = partial(self.get_month, d1=d1, d2=d2)
+        if len(months) <= 1 or self.sitemap_workers <= 1:
+            dfs = [get_month(m) for m in months]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(self.sitemap_workers, len(months))
+            ) as pool:
+                dfs = list(pool.map(get_month, months))
+        return [x for x in dfs if x is not None]
+
+    @classmethod
+    def _sitemap_locs(cls, content: bytes) -> list[str]:
+        """All <loc>s in a (possibly gzipped) sitemap."""
+        return list(cls._iter_sitemap_locs(content))
+
+    @classmethod
+    def _iter_sitemap_locs(cls, content: bytes | Iterable[bytes]) -> Iterator[str]:
+        """<loc>s of a (possibly gzipped) sitemap, or of the chunks of its
+        body, decompressed and parsed as they come. Every <url> is dropped
+        from the tree as soon as it's read, so memory stays flat however
+        big the sitemap is. Empty <loc>s are skipped."""
+        chunks = [content] if isinstance(content, bytes) else content
+        parser = ET.XMLPullParser(events=("start", "end"))
+        # Decompresses the body if gzipped, None until the first bytes
+        decompressor = None
+        root = None
+
+        def read_locs() -> Iterator[str]:
+            nonlocal root
+            for event, elem in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = elem
+                elif elem.tag == cls.SITEMAP_LOC_TAG:
+                    loc = elem.text.strip() if elem.text else None
+                    if loc:
+                        yield loc
+                elif elem.tag == cls.SITEMAP_URL_TAG:
+                    root.clear()
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if decompressor is None:
+                # .xml.gz is served as a gzip file, not as gzip-encoded xml
+                decompressor = (
+                    zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                    if chunk[:2] == b"\x1f\x8b"
+                    else False
+                )
+            parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+            yield from read_locs()
+        if decompressor:
+            parser.feed(decompressor.flush())
+        parser.close()
+        yield from read_locs()
+
+    @staticmethod
+    def parse_article_uri(uri: str) -> Optional[dict]:
+        """Parse article URI to the same columns as in the sitemap dataframe:
+        uri, date (YYYY-MM-DD), domain, lang, kind, art_id, id
+
+        Returns None if it doesn't look like an article URI.
+        """
+        parts = UPSitemapCrawler.split_article_uri(uri)
+        if parts is None:
+            return None
+        res = dict(zip(UPSitemapCrawler.SITEMAP_COLUMNS, parts))
+        res["date"] = str(datetime.strptime(res["date"], "%Y/%m/%d").date())
+        # ukrainian language where not mentioned in the URI
+        res["lang"] = res["lang"] if res["lang"] else Language.UA.value
+        return res
+
     @staticmethod
     def _filter_arts_by_hr_date(
         df: pd.DataFrame,
@@ -173,35 +475,14 @@ class UPSitemapCrawler:
         Returns:
             pd.DataFrame: dataframe with articles and semantically meaningful columns
         """
-        # TODO use 'news' sitemap for the most recent articles not found in archive!
-        d1p = dateparser.parse(d1) if isinstance(d1, str) else d1
-        d2p = dateparser.parse(d2) if isinstance(d2, str) else d2
-        logger.info(
-            f"Getting URLs of articles published between {d1p.date()} ('{d1}') and {d2p.date()} ('{d2}')"
-        )
-
-        if d1p.date() == d2p.date():
-            raise ValueError(f"Dates should differ!")
-
-        # Add a ~month so that the date range will definitely include d2
-        # TODO draw this to see whether teh concept is sound
-        d2p_safe = d2p + pd.to_timedelta(30, "days")
+        # The most recent articles not found in archive: see get_latest_articles()
+        d1p, d2p = self._parse_date_range(d1, d2)
 
-        # Range of months
-        months_range = pd.date_range(start=d1p, end=d2p_safe, freq="M")
+        # Exactly the months from d1's to d2's
+        months_range = self.months_needed(d1p, d2p)
         logger.debug(f"{months_range=}")
 
-        all_arts = list()
-        for m in months_range:
-            sm_uri = self._get_sitemap_uri_for_month(m)
-            logger.debug(f"{m} -> {sm_uri}")
-            # if we ended up in the future that's okay, skip
-            if sm_uri is None:
-                continue
-            df_articles = self.get_articles_from_sitemap(sm_uri)
-            if df_articles is None:
-                continue
-            all_arts.append(df_articles)
+        all_arts = self.get_months(months_range, d1=d1p, d2=d2p)
         if not all_arts:
             raise ValueError(f"No sitemaps found for the relevant months: {months_range}")
         df_full = pd.concat(all_arts)
@@ -218,6 +499,74 @@ class UPSitemapCrawler:
 
         return df_filt
 
+    @staticmethod
+    def _parse_date_range(
+        d1: Union[datetime, str], d2: Optional[Union[datetime, str]]
+    ) -> tuple[datetime, datetime]:
+        d1p = dateparser.parse(d1) if isinstance(d1, str) else d1
+        d2p = dateparser.parse(d2) if isinstance(d2, str) else d2
+        logger.info(
+            f"Getting URLs of articles published between {d1p.date()} ('{d1}') and {d2p.date()} ('{d2}')"
+        )
+
+        if d1p.date() == d2p.date():
+            raise ValueError(f"Dates should differ!")
+        return d1p, d2p
+
+    def iter_article_uris(
+        self,
+        d1: Union[datetime, str],
+        d2: Optional[Union[datetime, str]] = "yesterday",
+    ) -> Iterator[pd.DataFrame]:
+        """Like get_article_uris(), but a dataframe per month (sorted by date,
+        none for months without articles), each as soon as its sitemap is
+        there, while the next ones (up to sitemap_workers) are downloaded."""
+        d1p, d2p = self._parse_date_range(d1, d2)
+        months_range = self.months_needed(d1p, d2p)
+        get_month = partial(self.get_month, d1=d1p, d2=d2p)
+        window = max(1, min(self.sitemap_workers, len(months_range)))
+        num_arts = 0
+        # (month, future) submitted and not yielded yet, in order
+        in_flight = deque()
+        months = iter(months_range)
+        with ThreadPoolExecutor(max_workers=window) as pool:
+            try:
+                while True:
+                    # Only window months ahead of the consumer, not all of them
+                    for month in islice(months, window - len(in_flight)):
+                        in_flight.append((month, pool.submit(get_month, month)))
+                    if not in_flight:
+                        break
+                    month, future = in_flight.popleft()
+                    df = future.result()
+                    if df is None:
+                        continue
+                    df = self._filter_arts_by_hr_date(df, d1p, d2p).sort_values("date")
+                    if not len(df):
+                        continue
+                    num_arts += len(df)
+                    logger.info(f"Got {len(df)} article URLs from {month} ({num_arts} until now)")
+                    yield df
+            finally:
+                # Stopped early: don't download the months nobody will read
+                for _, future in in_flight:
+                    future.cancel()
+        if not num_arts:
+            logger.warning(f"No articles found matching the criteria!")
+
+    def iter_and_save_article_uris(
+        self,
+        d1: Union[datetime, str],
+        d2: Optional[Union[datetime, str]] = "yesterday",
+        save_path: Optional[str | Path] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """iter_article_uris(), also appending each month to the csv file
+        save_path (a temp one if None) as it comes."""
+        path = get_file_or_temp(save_path, fn_if_needed="uris_list.csv")
+        for i, df in enumerate(self.iter_article_uris(d1=d1, d2=d2)):
+            df.to_csv(path, index=False, mode="a" if i else "w", header=not i)
+            yield df
+
     def get_and_save_article_uris(
         self,
         d1: Union[datetime, str],
@@ -247,12 +596,40 @@ class UPSitemapCrawler:
         return res
 
 
+## CLI
+
+
+def _add_sitemap_args(parser) -> None:
+    """Add the sitemap crawling arguments to an argparse parser."""
+    parser.add_argument(
+        "--sitemap_workers",
+        type=int,
+        default=UPSitemapCrawler.SITEMAP_WORKERS,
+        help="Month sitemaps downloaded at once (%(default)s)",
+    )
+    parser.add_argument(
+        "--sitemap_cache",
+        type=Path,
+        default=None,
+        help="Keep the parsed month sitemaps in this dir and reuse them (closed months forever)",
+    )
+
+
+def _sitemap_crawler_from_args(args, session: UPSession) -> UPSitemapCrawler:
+    """Create the UPSitemapCrawler from the args added by _add_sitemap_args."""
+    return UPSitemapCrawler(
+        session=session,
+        sitemap_workers=args.sitemap_workers,
+        month_cache=MonthSitemapCache(args.sitemap_cache) if args.sitemap_cache else None,
+    )
+
+
 def run(args):
     date_1 = args.date_start  # if d1 else "3 days ago"
     date_2 = args.date_end  # if d2 else 'yesterday'
     output_path = args.output
 
-    uc = UPSitemapCrawler()
+    uc = _sitemap_crawler_from_args(args, session=_session_from_args(args))
     res = uc.get_and_save_article_uris(d1=date_1, d2=date_2, save_path=output_path)
     #  print(res)
 
@@ -284,6 +661,8 @@ def parse_args() -> argparse.Namespace:
         type=str,
         default=DEFAULT_END_DATE,
     )
+    _add_session_args(parser)
+    _add_sitemap_args(parser)
     parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
     parser.add_argument(
         "-q",
@@ -330,6 +709,5 @@ if __name__ == "__main__":
 #   - "що передувало": https://www.pravda.com.ua/news/2023/10/10/7423534/
 #       - or just remove the text itself if I won't be implementing that
 #       - generally, look into all article texts that end up in ":"
-#   - "I'm running, and I haven't crawled stuff for 5 days, I'll go through the 5 days" or something
 
 #  c.arts[0].arts[Language.RU].text
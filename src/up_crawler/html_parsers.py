@@ -0,0 +1,92 @@
+"""
+Parser backends for turning UP pages into soup.
+
+The extractors (UPCrawler.parse_soup, UPCrawler.crawl_tags_uri and the
+404 page detection) only ever look at a handful of elements, so by default
+only those subtrees are built (a bs4 SoupStrainer): menus, scripts, related
+news etc. are skipped by the tree builder instead of becoming objects.
+
+lxml's tree builder (if installed) is several times faster than the pure
+Python html.parser one; both give the same results with the extractors.
+"""
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from typing import Optional
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSERS = ["lxml", "html.parser"]
+except ImportError:
+    HTML_PARSERS = ["html.parser"]
+
+DEFAULT_HTML_PARSER = HTML_PARSERS[0]
+
+# tag -> classes the extractors need (None: all tags with this name)
+#   h1: title of articles and of 404 pages
+#   span.post_author, span.post_tags_item, div.post_text: article data
+#   div.block_tags: tags listing on the tags pages
+ELEMENTS_TO_PARSE = {
+    "h1": None,
+    "span": {"post_author", "post_tags_item"},
+    "div": {"post_text", "block_tags"},
+}
+
+
+def _is_needed(tag, attrs: Optional[dict] = None) -> bool:
+    """SoupStrainer filter for ELEMENTS_TO_PARSE.
+
+    Depending on the bs4 version it gets either a Tag, a tag name, or a tag
+    name and its (not yet parsed) attributes.
+    """
+    if isinstance(tag, str):
+        name = tag
+    else:
+        name, attrs = tag.name, tag.attrs
+    if name not in ELEMENTS_TO_PARSE:
+        return False
+    classes_needed = ELEMENTS_TO_PARSE[name]
+    if classes_needed is None or attrs is None:
+        return True
+    classes = attrs.get("class") or list()
+    if isinstance(classes, str):
+        classes = classes.split()
+    return bool(classes_needed.intersection(classes))
+
+
+def make_soup(
+    content: bytes | str,
+    encoding: Optional[str] = None,
+    parser: str = DEFAULT_HTML_PARSER,
+    partial: bool = True,
+) -> BeautifulSoup:
+    """Parse a page with `parser` (one of HTML_PARSERS).
+
+    partial: build only the elements needed by the extractors, False builds
+        the tree of the whole page
+    """
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"Unknown or not installed parser {parser}, have {HTML_PARSERS}")
+    parse_only = SoupStrainer(_is_needed) if partial else None
+    return BeautifulSoup(
+        content, parser, from_encoding=encoding, parse_only=parse_only
+    )
+
+
+## CLI
+
+
+def _add_parser_args(parser) -> None:
+    """Add the --html_parser argument to an argparse parser."""
+    parser.add_argument(
+        "--html_parser",
+        choices=HTML_PARSERS,
+        default=DEFAULT_HTML_PARSER,
+        help="Parser backend for the downloaded pages (%(default)s)",
+    )
@@ -0,0 +1,245 @@
+"""
+Persistent HTTP cache for UPSession.
+
+Bodies are stored as files, the metadata (ETag, Last-Modified, size, last
+access) in a small sqlite db next to them. Entries are revalidated with
+conditional requests (If-None-Match / If-Modified-Since), except for the ones
+stored as immutable (e.g. sitemaps of months long past), which are served
+without any network request at all. When the cache grows over its size cap
+the least recently used entries are evicted.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from requests.structures import CaseInsensitiveDict
+
+from typing import Iterator, Optional
+
+from up_crawler.path_ops import make_path_ok, mkdir
+
+
+@dataclass
+class CacheEntry:
+    uri: str
+    body_path: Path
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    encoding: Optional[str] = None
+    content_type: Optional[str] = None
+    immutable: bool = False
+
+    def conditional_headers(self) -> dict:
+        """Headers that turn a GET into a revalidation of this entry."""
+        headers = dict()
+        if self.etag:
+            headers["if-none-match"] = self.etag
+        if self.last_modified:
+            headers["if-modified-since"] = self.last_modified
+        return headers
+
+
+class CachedResponse:
+    """Looks enough like a requests.Response for the crawlers."""
+
+    def __init__(self, entry: CacheEntry, content: bytes):
+        self.status_code = 200
+        self.content = content
+        self.encoding = entry.encoding
+        self.headers = CaseInsensitiveDict()
+        if entry.etag:
+            self.headers["etag"] = entry.etag
+        if entry.last_modified:
+            self.headers["last-modified"] = entry.last_modified
+        if entry.content_type:
+            self.headers["content-type"] = entry.content_type
+        self.from_cache = True
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class HTTPCache:
+    """On-disk cache of successful GET responses, LRU-evicted over max_size_mb."""
+
+    DB_FN = "index.sqlite"
+    BODIES_DIR = "bodies"
+
+    def __init__(self, cache_dir: Path | str, max_size_mb: float = 1024):
+        self.cache_dir = mkdir(make_path_ok(cache_dir))
+        self.max_size = int(max_size_mb * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.cache_dir / self.DB_FN, check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                uri TEXT PRIMARY KEY,
+                body_fn TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                content_type TEXT,
+                immutable INTEGER NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_access ON entries(last_access)"
+        )
+        self._db.commit()
+
+        # Requests served without / with a revalidation / not at all from cache
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def _body_path(self, body_fn: str) -> Path:
+        return self.cache_dir / self.BODIES_DIR / body_fn[:2] / body_fn
+
+    def lookup(self, uri: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                """SELECT body_fn, size, etag, last_modified, encoding,
+                content_type, immutable FROM entries WHERE uri = ?""",
+                (uri,),
+            ).fetchone()
+        if not row:
+            return None
+        body_fn, size, etag, last_modified, encoding, content_type, immutable = row
+        entry = CacheEntry(
+            uri=uri,
+            body_path=self._body_path(body_fn),
+            size=size,
+            etag=etag,
+            last_modified=last_modified,
+            encoding=encoding,
+            content_type=content_type,
+            immutable=bool(immutable),
+        )
+        if not entry.body_path.exists():
+            # Someone cleaned up the bodies by hand
+            self.delete(uri)
+            return None
+        return entry
+
+    def read(self, entry: CacheEntry) -> CachedResponse:
+        """Return the cached response, marking the entry as recently used."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE uri = ?",
+                (time.time(), entry.uri),
+            )
+            self._db.commit()
+        return CachedResponse(entry, content=entry.body_path.read_bytes())
+
+    def store(
+        self,
+        uri: str,
+        content: bytes,
+        headers: Optional[dict] = None,
+        encoding: Optional[str] = None,
+        immutable: bool = False,
+    ) -> None:
+        headers = headers if headers else dict()
+        body_fn = hashlib.sha256(uri.encode()).hexdigest()
+        body_path = self._body_path(body_fn)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so that other processes never see half a body
+        tmp_path = body_path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_bytes(content)
+        tmp_path.replace(body_path)
+
+        with self._lock:
+            self._db.execute(
+                """INSERT OR REPLACE INTO entries
+                (uri, body_fn, size, etag, last_modified, encoding,
+                content_type, immutable, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    uri,
+                    body_fn,
+                    len(content),
+                    headers.get("etag"),
+                    headers.get("last-modified"),
+                    encoding,
+                    headers.get("content-type"),
+                    int(immutable),
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+        self.evict()
+
+    def delete(self, uri: str) -> None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body_fn FROM entries WHERE uri = ?", (uri,)
+            ).fetchone()
+            self._db.execute("DELETE FROM entries WHERE uri = ?", (uri,))
+            self._db.commit()
+        if row:
+            self._body_path(row[0]).unlink(missing_ok=True)
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+
+    def evict(self) -> None:
+        """Remove least recently used entries until under the size cap."""
+        total = self.total_size()
+        if total <= self.max_size:
+            return
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uri, body_fn, size FROM entries ORDER BY last_access"
+            ).fetchall()
+        to_delete = list()
+        for uri, body_fn, size in rows:
+            if total <= self.max_size:
+                break
+            to_delete.append((uri, body_fn))
+            total -= size
+        logger.debug(f"Evicting {len(to_delete)} entries from {self.cache_dir}")
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM entries WHERE uri = ?", [(x[0],) for x in to_delete]
+            )
+            self._db.commit()
+        for _, body_fn in to_delete:
+            self._body_path(body_fn).unlink(missing_ok=True)
+
+    def report(self) -> str:
+        return (
+            f"HTTP cache: {self.hits} hits, {self.revalidated} revalidated, "
+            f"{self.misses} misses, {self.total_size() / 1024 / 1024:.1f}MB"
+        )
+
+    def close(self):
+        self._db.close()
+
+    def __repr__(self):
+        return f"HTTPCache({self.cache_dir}, max_size_mb={self.max_size / 1024 / 1024:.0f})"
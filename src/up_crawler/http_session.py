@@ -0,0 +1,288 @@
+"""
+One pooled keep-alive HTTP transport shared by the sitemap crawler, the
+tags crawler and the article crawler, so that we don't pay a TCP+TLS
+handshake for every single request to www.pravda.com.ua.
+"""
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from typing import Iterator, Optional
+
+from up_crawler.http_cache import HTTPCache, CachedResponse
+
+try:
+    # Needed only for HTTP/2
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    # If present, urllib3 and aiohttp transparently decode brotli
+    import brotli  # noqa: F401
+
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class BadStatusError(Exception):
+    """Response that's neither a page nor a 404, e.g. a 500: the URI
+    wasn't downloaded, but may well be there later."""
+
+    def __init__(self, uri: str, status_code: int):
+        self.uri = uri
+        self.status_code = status_code
+        super().__init__(f"{uri} returned {status_code}")
+
+
+class ServerBusyError(BadStatusError):
+    """Server asked us to slow down or is overloaded (429/5xx), worth
+    retrying later."""
+
+
+def is_server_busy(status_code: int) -> bool:
+    """429/5xx, the responses the adaptive rate controller slows down on."""
+    return status_code == 429 or status_code >= 500
+
+
+def iter_body(res, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Body of a response from UPSession.get in chunks (decoded if it has
+    a content-encoding), read as they're consumed if it was streamed."""
+    if httpx and isinstance(res, httpx.Response):
+        return res.iter_bytes(chunk_size)
+    return res.iter_content(chunk_size)
+
+
+# Networking errors (and 'slow down' responses) after which the request will be retried
+NETWORK_ERRORS = (requests.ConnectionError, requests.ReadTimeout, ServerBusyError)
+if httpx:
+    NETWORK_ERRORS = NETWORK_ERRORS + (httpx.TransportError,)
+
+
+class UPSession:
+    """Pooled keep-alive HTTP session.
+
+    Uses requests by default, httpx if HTTP/2 is wanted (and installed).
+    Responses of both have .status_code, .content, .encoding, .headers.
+
+    If an HTTPCache is passed, cached responses are revalidated with
+    conditional requests (or not requested at all if stored as immutable).
+    """
+
+    DEFAULT_POOL_SIZE = 10
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        http2: bool = False,
+        cache: Optional[HTTPCache] = None,
+    ):
+        self.pool_size = pool_size
+        self.http2 = http2
+        self.cache = cache
+        self.headers = {"accept-encoding": ACCEPT_ENCODING}
+
+        if http2 and not httpx:
+            logger.warning(f"HTTP/2 needs httpx[http2] installed, using HTTP/1.1")
+            self.http2 = False
+
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+            )
+        else:
+            self._client = requests.Session()
+            self._client.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self._client.mount("https://", adapter)
+            self._client.mount("http://", adapter)
+
+    def get(
+        self,
+        uri: str,
+        headers: Optional[dict] = None,
+        timeout: tuple[float, float] = (10, 10),
+        immutable: bool = False,
+        stream: bool = False,
+    ):
+        """GET uri reusing pooled connections, returns the response.
+
+        immutable: the response at this uri will never change, once cached
+            it will be served from cache without revalidation
+        stream: don't read the body yet, see iter_body(); the response
+            should be closed then. Ignored with a cache, that stores the body
+        """
+        cached, cache_headers = self.cache_lookup(uri)
+        if cached:
+            return cached
+        stream = stream and not self.cache
+
+        for extra_headers in (cache_headers, dict()):
+            res = self._send(
+                uri,
+                headers={**headers, **extra_headers} if headers else extra_headers,
+                timeout=timeout,
+                stream=stream,
+            )
+            if stream:
+                return res
+            cached = self.cache_update(
+                uri,
+                status_code=res.status_code,
+                content=res.content,
+                headers=res.headers,
+                encoding=res.encoding,
+                immutable=immutable,
+            )
+            if not (res.status_code == 304 and cache_headers and not cached):
+                break
+            # Evicted since cache_lookup(), so ask again for the page itself
+        return cached if cached else res
+
+    def _send(self, uri: str, headers: dict, timeout: tuple[float, float], stream: bool):
+        if self.http2:
+            connect, read = timeout
+            request = self._client.build_request(
+                "GET",
+                uri,
+                headers=headers,
+                timeout=httpx.Timeout(read, connect=connect),
+            )
+            return self._client.send(request, stream=stream)
+        return self._client.get(uri, headers=headers, timeout=timeout, stream=stream)
+
+    def cache_lookup(self, uri: str) -> tuple[Optional[CachedResponse], dict]:
+        """Returns (cached response usable without any request or None,
+        headers to add to the request to revalidate the cached one)."""
+        if not self.cache:
+            return None, dict()
+        entry = self.cache.lookup(uri)
+        if not entry:
+            return None, dict()
+        if entry.immutable:
+            self.cache.hits += 1
+            logger.debug(f"{uri} served from cache")
+            return self.cache.read(entry), dict()
+        return None, entry.conditional_headers()
+
+    def cache_update(
+        self,
+        uri: str,
+        status_code: int,
+        content: bytes,
+        headers: dict,
+        encoding: Optional[str] = None,
+        immutable: bool = False,
+    ) -> Optional[CachedResponse]:
+        """Store a fresh 200 response, or return the cached one on 304."""
+        if not self.cache:
+            return None
+        if status_code == 304:
+            entry = self.cache.lookup(uri)
+            if entry:
+                self.cache.revalidated += 1
+                logger.debug(f"{uri} not modified, served from cache")
+                return self.cache.read(entry)
+            logger.warning(f"{uri} returned 304 but isn't in cache anymore")
+            return None
+        if status_code == 200:
+            self.cache.misses += 1
+            self.cache.store(
+                uri,
+                content=content,
+                headers=headers,
+                encoding=encoding,
+                immutable=immutable,
+            )
+        return None
+
+    def async_session(self, limit: Optional[int] = None):
+        """aiohttp session with the same headers and a pool of `limit`
+        connections, for the asyncio crawler. To be used as context manager.
+        """
+        # Imported here because only the asyncio crawler needs it
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=limit or self.pool_size, keepalive_timeout=30
+        )
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=10)
+        return aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=self.headers
+        )
+
+    def close(self):
+        self._client.close()
+        if self.cache:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"UPSession(pool_size={self.pool_size}, http2={self.http2}, cache={self.cache})"
+
+
+_DEFAULT_SESSION: Optional[UPSession] = None
+
+
+def get_default_session() -> UPSession:
+    """Session used when none was passed explicitly, created on first use."""
+    global _DEFAULT_SESSION
+    if _DEFAULT_SESSION is None:
+        _DEFAULT_SESSION = UPSession()
+    return _DEFAULT_SESSION
+
+
+## CLI
+
+
+def _add_session_args(parser) -> None:
+    """Add the UPSession CLI arguments to an argparse parser."""
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=UPSession.DEFAULT_POOL_SIZE,
+        help="Max number of kept-alive connections to UP (%(default)s)",
+    )
+    parser.add_argument(
+        "--http2",
+        help="Use HTTP/2 if httpx[http2] is installed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=Path,
+        help="Cache HTTP responses (e.g. sitemaps) in this dir between runs (%(default)s)",
+    )
+    parser.add_argument(
+        "--cache_size_mb",
+        type=float,
+        default=1024,
+        help="Max size of --cache_dir, least recently used entries are evicted (%(default)s)",
+    )
+
+
+def _session_from_args(args) -> UPSession:
+    """Create the session from the args added by _add_session_args."""
+    cache = (
+        HTTPCache(args.cache_dir, max_size_mb=args.cache_size_mb)
+        if args.cache_dir
+        else None
+    )
+    return UPSession(pool_size=args.pool_size, http2=args.http2, cache=cache)
@@ -0,0 +1,92 @@
+"""
+Filter for the paragraphs not to be added to article text (ads, 'follow us
+on Twitter', 'read also' etc.), see consts.PARAS_TO_SKIP.
+
+All rules are compiled once into a single alternation, so each paragraph
+is scanned by one regex that stops at the first rule matching, instead of
+compiling and trying every rule separately. Which rule matched is
+counted, to see what the rules actually do and which ones never match.
+"""
+
+import re
+
+from collections import Counter
+from functools import lru_cache
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Iterable, Optional
+
+
+class ParagraphFilter:
+    """Decides which paragraphs to skip, counting the hits of each rule.
+
+    Rules are regexes matched (case-insensitive) against the start of
+    the normalized paragraph text, like re.match; the first matching
+    one is counted.
+    """
+
+    def __init__(self, regexes: Iterable[str]):
+        self.regexes = list(regexes)
+        self.hits: Counter = Counter()
+        self._compile()
+
+    def _compile(self) -> None:
+        # Each rule in its own named group, to know which one matched.
+        # Rules shouldn't use numbered backreferences, the groups get renumbered.
+        combined = "|".join(f"(?P<r{i}>{r})" for i, r in enumerate(self.regexes))
+        self._pattern = re.compile(combined, re.IGNORECASE) if self.regexes else None
+
+    @staticmethod
+    def get(
+        regexes: Optional["Iterable[str] | ParagraphFilter"],
+    ) -> Optional["ParagraphFilter"]:
+        """Filter for regexes, compiled only once for the same regexes.
+
+        Filters are passed through as they are, None (no rules) stays None.
+        """
+        if regexes is None or isinstance(regexes, ParagraphFilter):
+            return regexes
+        return ParagraphFilter._cached(tuple(regexes))
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _cached(regexes: tuple[str, ...]) -> "ParagraphFilter":
+        return ParagraphFilter(regexes)
+
+    def skip(self, text: str) -> bool:
+        """True if text (already normalized) matches any of the rules."""
+        if not self._pattern:
+            return False
+        m = self._pattern.match(text)
+        if not m:
+            return False
+        self.hits[self.regexes[int(m.lastgroup[1:])]] += 1
+        return True
+
+    def add_hits(self, hits: Counter) -> None:
+        """Merge hits counted elsewhere, e.g. in a parser process."""
+        self.hits.update(hits)
+
+    def unused_rules(self) -> list[str]:
+        return [r for r in self.regexes if not self.hits[r]]
+
+    def report(self) -> str:
+        hits = ", ".join(f"'{r}': {self.hits[r]}" for r in self.regexes)
+        return f"Skipped {sum(self.hits.values())} paragraphs ({hits})"
+
+    # Pickled (to parser processes) without the hits counted until now,
+    # so that the hits counted there can be merged back with add_hits()
+    def __getstate__(self):
+        return {"regexes": self.regexes}
+
+    def __setstate__(self, state):
+        self.regexes = state["regexes"]
+        self.hits = Counter()
+        self._compile()
+
+    def __repr__(self):
+        return f"ParagraphFilter({self.regexes})"
@@ -0,0 +1,225 @@
+"""
+Export of FullArticles to Parquet, the columnar alternative to UPToCSVExporter.
+
+Same per-language columns as the CSV (eng_title, ukr_text, ...), but the
+tags are lists instead of comma-separated strings:
+    tags:        [tag_short, ...] of all translations
+    <lang>_tags: [tag_name, ...]
+    <lang>_tags_full: [{tag_short, tag_name, tag_link}, ...]
+
+Articles are written as they're read, row_group_size articles per row group.
+With partition_by, one file per year (or month) of date_published, in
+hive-style directories that pandas/pyarrow/polars/datasets read as columns:
+    target/year=2023/month=11/part-0.parquet
+With `part`, the target is always a dir of part files named so, like
+up_convert does: each export run writes its own part-<run>.parquet files,
+and drop_articles() rewrites the parts of an earlier run without the
+articles exported again since.
+"""
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from pathlib import Path
+
+from typing import Iterable, Optional
+
+from up_crawler.data_structures import FullArticle, Language
+from up_crawler.path_ops import make_path_ok
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PARTITIONS = ["year", "month"]
+# Hive's name for the partition of null values
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class UPToParquetExporter:
+    """Writes FullArticles to parquet, see module docstring."""
+
+    # Article fields exported, the only ones read from the corpus
+    FIELDS = ["uri", "title", "author_name", "text", "tags", "tags_full"]
+    ROW_GROUP_SIZE = 1000
+
+    @staticmethod
+    def schema() -> "pa.Schema":
+        if pa is None:
+            raise ImportError("Parquet export needs pyarrow installed")
+        tag = pa.struct(
+            [("tag_short", pa.string()), ("tag_name", pa.string()), ("tag_link", pa.string())]
+        )
+        fields = [
+            ("art_id", pa.int64()),
+            ("date_published", pa.string()),
+            ("tags", pa.list_(pa.string())),
+        ]
+        for l in Language:
+            fields += [
+                (f"{l.value}_uri", pa.string()),
+                (f"{l.value}_title", pa.string()),
+                (f"{l.value}_author_name", pa.string()),
+                (f"{l.value}_text", pa.string()),
+                (f"{l.value}_tags", pa.list_(pa.string())),
+                (f"{l.value}_tags_full", pa.list_(tag)),
+            ]
+        return pa.schema(fields)
+
+    @staticmethod
+    def fa_to_record(fa: FullArticle) -> dict:
+        record = {
+            "art_id": int(fa.art_id),
+            "date_published": fa.date_published,
+            "tags": sorted(fa.tags),
+        }
+        for l in Language:
+            art = fa.articles.get(l, None)
+            tags_full = art.tags_full if art and art.tags_full is not None else None
+            record.update(
+                {
+                    f"{l.value}_uri": art.uri if art else None,
+                    f"{l.value}_title": art.title if art else None,
+                    f"{l.value}_author_name": art.author_name if art else None,
+                    f"{l.value}_text": art.get_text() if art and art.text is not None else None,
+                    f"{l.value}_tags": [x[1] for x in tags_full] if tags_full is not None else None,
+                    f"{l.value}_tags_full": [
+                        {"tag_short": x[0], "tag_name": x[1], "tag_link": x[2]}
+                        for x in tags_full
+                    ]
+                    if tags_full is not None
+                    else None,
+                }
+            )
+        return record
+
+    @staticmethod
+    def partition_of(fa: FullArticle, partition_by: Optional[str]) -> tuple[str, ...]:
+        """Hive partition dirs of fa, e.g. ('year=2023', 'month=11')."""
+        if not partition_by:
+            return tuple()
+        date = fa.date_published
+        year, month = (date[:4], date[5:7]) if date else (NULL_PARTITION, NULL_PARTITION)
+        if partition_by == "year":
+            return (f"year={year}",)
+        return (f"year={year}", f"month={month}")
+
+    @staticmethod
+    def part_name(run: int) -> str:
+        """File name of the parts written by export run."""
+        return f"part-{run}.parquet"
+
+    @staticmethod
+    def clear(target: Path | str) -> None:
+        """Remove an earlier export at target: its part files (in all
+        partitions), or the file if it's a single one."""
+        target = make_path_ok(target)
+        if target.is_file():
+            target.unlink()
+            return
+        if not target.exists():
+            return
+        for path in target.rglob("*.parquet"):
+            path.unlink()
+        # Partition dirs left empty, deepest first
+        for path in sorted(target.rglob("*"), key=lambda x: len(x.parts), reverse=True):
+            if path.is_dir() and not any(path.iterdir()):
+                path.rmdir()
+
+    @staticmethod
+    def drop_articles(target: Path | str, part: str, art_ids: Iterable[int]) -> int:
+        """Rewrite the part files named part (in all partitions of target)
+        without the rows of art_ids, one row group at a time. A part left
+        empty is removed. Returns number of rows dropped."""
+        target = make_path_ok(target)
+        value_set = pa.array(sorted(art_ids), pa.int64())
+        num_dropped = 0
+        for path in sorted(target.rglob(part)):
+            tmp_path = path.with_name(path.name + ".tmp")
+            num_kept = 0
+            with pq.ParquetFile(path) as pf:
+                num_rows = pf.metadata.num_rows
+                with pq.ParquetWriter(tmp_path, pf.schema_arrow) as writer:
+                    for i in range(pf.num_row_groups):
+                        table = pf.read_row_group(i)
+                        kept = table.filter(
+                            pc.invert(pc.is_in(table["art_id"], value_set=value_set))
+                        )
+                        num_dropped += table.num_rows - kept.num_rows
+                        num_kept += kept.num_rows
+                        if kept.num_rows:
+                            writer.write_table(kept)
+            if num_kept == num_rows:
+                tmp_path.unlink()
+            elif num_kept:
+                tmp_path.replace(path)
+            else:
+                tmp_path.unlink()
+                path.unlink()
+        logger.info(f"Dropped {num_dropped} superseded articles from {target}/**/{part}")
+        return num_dropped
+
+    @staticmethod
+    def fas_to_parquet(
+        fas: Iterable[FullArticle],
+        target: Path | str,
+        partition_by: Optional[str] = None,
+        row_group_size: int = ROW_GROUP_SIZE,
+        part: Optional[str] = None,
+    ) -> int:
+        """Write fas to the target parquet file, or to a dir of partitions
+        if partition_by (one of PARTITIONS). Returns number of articles.
+
+        part: file name of the parts, target is a dir of parts then
+        """
+        if partition_by and partition_by not in PARTITIONS:
+            raise ValueError(f"Unknown partitioning {partition_by}, have {PARTITIONS}")
+        schema = UPToParquetExporter.schema()
+        target = make_path_ok(target)
+        logger.info(f"Writing to parquet {target}")
+
+        # partition -> writer, rows not written yet
+        writers: dict[tuple, pq.ParquetWriter] = dict()
+        buffers: dict[tuple, list[dict]] = dict()
+
+        def flush(partition: tuple) -> None:
+            rows = buffers.pop(partition, None)
+            if not rows:
+                return
+            if partition not in writers:
+                if partition_by or part:
+                    path = target.joinpath(*partition, part if part else "part-0.parquet")
+                else:
+                    path = target
+                path.parent.mkdir(parents=True, exist_ok=True)
+                writers[partition] = pq.ParquetWriter(path, schema)
+            writers[partition].write_table(
+                pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size
+            )
+
+        num_written = 0
+        try:
+            for fa in fas:
+                partition = UPToParquetExporter.partition_of(fa, partition_by)
+                rows = buffers.setdefault(partition, list())
+                rows.append(UPToParquetExporter.fa_to_record(fa))
+                if len(rows) >= row_group_size:
+                    flush(partition)
+                num_written += 1
+                if num_written % 1000 == 0:
+                    logger.info(f"{num_written} articles written")
+            for partition in list(buffers):
+                flush(partition)
+            if not writers and not (partition_by or part):
+                # Nothing to write, but still a valid (empty) file
+                pq.write_table(schema.empty_table(), target)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        logger.info(f"Finished writing {num_written} articles to {target}")
+        return num_written
@@ -2,12 +2,25 @@ import random
 import time
 
 from dataclasses import dataclass
+from contextlib import contextmanager, asynccontextmanager
+from pathlib import Path
+
+import asyncio
 
 import logging
 
 logging.basicConfig()
 logger = logging.getLogger(__package__)
 
+from typing import Optional
+
+from up_crawler.rate_limit import (
+    HostRateLimiter,
+    ThrottleStats,
+    AIMDController,
+    RequestRecord,
+)
+
 
 @dataclass
 class RandomizationParams:
@@ -15,6 +28,12 @@ class RandomizationParams:
 
     - calculation of AND EXECUTION of timeouts/waits
     - picking a random useragent from list
+
+    If requests_per_sec is set, instead of a random wait before each request
+    a per-host token bucket shared by all workers is used (see rate_limit.py).
+    If adaptive is set as well, requests_per_sec is only the starting rate,
+    which then goes up and down (between min_rps and max_rps) depending on
+    the server's responses.
     """
 
     # let's do _ethical crawling_ (c)(tm)(r)
@@ -29,6 +48,33 @@ class RandomizationParams:
     # TODO - automate headers trhough latest-user-agents package etc. IF NEEDED
     user_agents: tuple[str] = (POLITE_USERAGENT,)
 
+    # Token bucket politeness budget, replaces random_wait() if set
+    requests_per_sec: Optional[float] = None
+    burst: int = 1
+    # Dir for the bucket state, to share the budget between processes
+    rate_state_dir: Optional[Path] = None
+
+    # AIMD: adapt requests_per_sec to status codes/latency/Retry-After
+    adaptive: bool = False
+    min_rps: float = 0.1
+    max_rps: float = 10
+
+    def __post_init__(self):
+        self.stats = ThrottleStats()
+        self.rate_limiter = (
+            HostRateLimiter(
+                requests_per_sec=self.requests_per_sec,
+                burst=self.burst,
+                state_dir=self.rate_state_dir,
+                stats=self.stats,
+                controller=AIMDController(min_rps=self.min_rps, max_rps=self.max_rps)
+                if self.adaptive
+                else None,
+            )
+            if self.requests_per_sec
+            else None
+        )
+
     def get_useragent(self):
         return random.choice(self.user_agents)
 
@@ -38,7 +84,48 @@ class RandomizationParams:
         )
 
     def random_wait(self):
-        time.sleep(self.get_wait_time())
+        wait_time = self.get_wait_time()
+        time.sleep(wait_time)
+        self.stats.add_throttled(wait_time)
+
+    async def async_random_wait(self):
+        wait_time = self.get_wait_time()
+        await asyncio.sleep(wait_time)
+        self.stats.add_throttled(wait_time)
+
+    @contextmanager
+    def slot(self, uri: str):
+        """Wait as politeness requires before a request to uri, then time it.
+
+        Yields a RequestRecord, to be filled with the status code and headers
+        of the response for the adaptive rate controller.
+        """
+        if self.rate_limiter:
+            with self.rate_limiter.slot(uri) as record:
+                yield record
+            return
+
+        self.random_wait()
+        start = time.time()
+        try:
+            yield RequestRecord()
+        finally:
+            self.stats.add_work(time.time() - start)
+
+    @asynccontextmanager
+    async def async_slot(self, uri: str):
+        """slot() for the asyncio crawler."""
+        if self.rate_limiter:
+            async with self.rate_limiter.async_slot(uri) as record:
+                yield record
+            return
+
+        await self.async_random_wait()
+        start = time.time()
+        try:
+            yield RequestRecord()
+        finally:
+            self.stats.add_work(time.time() - start)
 
     @staticmethod
     def _calc_rand_wait(min_sec: int = 0, max_sec: int = 12, eps: float = 2):
@@ -62,9 +149,54 @@ def _slightly_change_num(num: float, eps=0.01, only_positive: bool = True) -> fl
 
 
 def _parse_timeout(args) -> RandomizationParams:
-    """Parse CLI arguments arguments."""
-    if args.timeout == -1:
+    """Parse CLI arguments arguments. An explicit --rps (or --adaptive)
+    wins over --timeout, -1 included."""
+    if getattr(args, "rps", None) or getattr(args, "adaptive", False):
+        if args.timeout == -1:
+            logger.warning("Using the rate limit of --rps/--adaptive, ignoring -t -1")
+        rw = RandomizationParams(
+            # Start slow and let AIMD find the right rate
+            requests_per_sec=args.rps if args.rps else 1,
+            burst=args.burst,
+            rate_state_dir=args.rate_state_dir,
+            adaptive=args.adaptive,
+            max_rps=args.max_rps,
+        )
+    elif args.timeout == -1:
         rw = RandomizationParams(max_wait_sec=0, wait_eps=0)
     else:
         rw = RandomizationParams(max_wait_sec=args.timeout)
     return rw
+
+
+def _add_rate_limit_args(parser) -> None:
+    """Add the token bucket CLI arguments to an argparse parser."""
+    parser.add_argument(
+        "--rps",
+        type=float,
+        help="""Max requests/sec per host shared by all workers, replaces \
+                the random wait of --timeout (even -t -1). (%(default)s)""",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Max requests at once allowed by --rps (%(default)s)",
+    )
+    parser.add_argument(
+        "--rate_state_dir",
+        type=Path,
+        help="Dir to share the --rps budget between processes (%(default)s)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="""Adapt the rate to the server's responses, starting at \
+                --rps (or 1) and going up while it's healthy (AIMD)""",
+    )
+    parser.add_argument(
+        "--max_rps",
+        type=float,
+        default=10,
+        help="Max requests/sec reachable with --adaptive (%(default)s)",
+    )
@@ -0,0 +1,358 @@
+"""
+Per-host token bucket rate limiting, so that politeness is a global budget
+of requests/sec shared by all concurrent (and, through a state file, by all
+multi-process) workers, instead of a blocking sleep before every request.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from dataclasses import dataclass
+from contextlib import contextmanager, asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Optional
+
+from up_crawler.http_session import is_server_busy
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, there the state file can't be shared between processes
+    fcntl = None
+
+
+@dataclass
+class ThrottleStats:
+    """Where the time went: waiting for our politeness budget VS requests."""
+
+    throttled_sec: float = 0
+    work_sec: float = 0
+    num_requests: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add_throttled(self, sec: float):
+        with self._lock:
+            self.throttled_sec += sec
+
+    def add_work(self, sec: float):
+        with self._lock:
+            self.work_sec += sec
+            self.num_requests += 1
+
+    def report(self) -> str:
+        total = self.throttled_sec + self.work_sec
+        throttled_share = self.throttled_sec / total if total else 0
+        return (
+            f"{self.num_requests} requests, {self.work_sec:.1f}s of work, "
+            f"{self.throttled_sec:.1f}s throttled ({throttled_share:.0%})"
+        )
+
+
+class TokenBucket:
+    """Token bucket: `rate` requests/sec on average, up to `burst` at once.
+
+    A request reserves a token immediately and gets back how long it has
+    to wait for it, so many threads/tasks can wait at the same time
+    without holding a lock.
+
+    If `state_file` is given, the bucket state lives there (under a file lock)
+    and is shared by all processes using the same file.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, state_file: Optional[Path] = None):
+        if rate <= 0:
+            raise ValueError(f"Rate should be positive, got {rate}")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.state_file = Path(state_file) if state_file else None
+        if self.state_file and not fcntl:
+            logger.warning(f"No fcntl, {state_file} won't be shared between processes")
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        # No requests at all before that (e.g. because of Retry-After)
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token, return the number of seconds to wait before using it."""
+        with self._lock:
+            if self.state_file and fcntl:
+                return self._reserve_shared()
+            self._tokens, self._last, wait = self._take(self._tokens, self._last)
+            return max(wait, self._paused_until - time.time())
+
+    def set_rate(self, rate: float) -> None:
+        """Change the rate, the tokens accumulated until now are kept."""
+        with self._lock:
+            self.rate = rate
+
+    def pause(self, sec: float) -> None:
+        """No new requests for the next `sec` seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + sec)
+            # Don't let a burst of requests through right after the pause
+            self._tokens = min(self._tokens, 0.0)
+
+    def _take(self, tokens: float, last: float) -> tuple[float, float, float]:
+        """(tokens, last) -> (new tokens, new last, seconds to wait)
+
+        Tokens can go negative: that's the requests already queued up.
+        """
+        now = time.time()
+        tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+        tokens -= 1
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        return tokens, now, wait
+
+    def _reserve_shared(self) -> float:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_file, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else dict()
+                tokens, last, wait = self._take(
+                    state.get("tokens", self.burst), state.get("last", time.time())
+                )
+                paused_until = max(state.get("paused_until", 0), self._paused_until)
+                wait = max(wait, paused_until - time.time())
+                f.seek(0)
+                f.truncate()
+                f.write(
+                    json.dumps(
+                        {"tokens": tokens, "last": last, "paused_until": paused_until}
+                    )
+                )
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst}, state_file={self.state_file})"
+
+
+@dataclass
+class RequestRecord:
+    """Filled in by the caller inside a slot, used for adapting the rate."""
+
+    status_code: Optional[int] = None
+    headers: Optional[dict] = None
+
+
+class AIMDController:
+    """Adapts the rate of a host's TokenBucket to how the server is doing.
+
+    Additive increase: after every healthy response the rate grows by
+    `increase` requests/sec, up to max_rps.
+    Multiplicative decrease: the rate is multiplied by `decrease` (down to
+    min_rps) on 429/5xx or no response at all, on Retry-After (which also pauses the bucket) or if
+    the p95 latency gets `latency_factor` times worse than the best seen.
+    At most one decrease per `cooldown_sec`, so that a single slow-down
+    visible in many in-flight responses is only punished once.
+    """
+
+    def __init__(
+        self,
+        min_rps: float = 0.1,
+        max_rps: float = 10,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        latency_window: int = 50,
+        latency_factor: float = 2.0,
+        cooldown_sec: float = 5,
+    ):
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_window = latency_window
+        self.latency_factor = latency_factor
+        self.cooldown_sec = cooldown_sec
+
+        self._latencies: dict[str, deque] = dict()
+        self._best_p95: dict[str, float] = dict()
+        self._last_decrease: dict[str, float] = dict()
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        host: str,
+        bucket: TokenBucket,
+        latency: float,
+        status_code: Optional[int] = None,
+        headers: Optional[dict] = None,
+    ) -> None:
+        retry_after = self._parse_retry_after(headers)
+        with self._lock:
+            p95 = self._update_p95(host, latency)
+            if retry_after is not None:
+                logger.info(f"{host} asked to retry after {retry_after:.0f}s")
+                bucket.pause(retry_after)
+                self._decrease(host, bucket, reason="Retry-After")
+            elif status_code is None:
+                # The request raised, e.g. a timeout
+                self._decrease(host, bucket, reason="no response")
+            elif is_server_busy(status_code):
+                self._decrease(host, bucket, reason=f"HTTP {status_code}")
+            elif p95 and p95 > self.latency_factor * self._best_p95[host]:
+                self._decrease(host, bucket, reason=f"p95 latency {p95:.2f}s")
+            else:
+                bucket.set_rate(min(self.max_rps, bucket.rate + self.increase))
+
+    def _decrease(self, host: str, bucket: TokenBucket, reason: str) -> None:
+        now = time.time()
+        if now - self._last_decrease.get(host, 0) < self.cooldown_sec:
+            return
+        self._last_decrease[host] = now
+        new_rate = max(self.min_rps, bucket.rate * self.decrease)
+        logger.info(f"{host}: {reason}, rate {bucket.rate:.2f} -> {new_rate:.2f} req/s")
+        bucket.set_rate(new_rate)
+        # Latencies from before the slow-down aren't representative anymore
+        self._latencies[host].clear()
+
+    def _update_p95(self, host: str, latency: float) -> Optional[float]:
+        """Add latency, return p95 of the window if it's full."""
+        window = self._latencies.setdefault(host, deque(maxlen=self.latency_window))
+        window.append(latency)
+        if len(window) < self.latency_window:
+            return None
+        p95 = sorted(window)[int(0.95 * (len(window) - 1))]
+        self._best_p95[host] = min(p95, self._best_p95.get(host, p95))
+        return p95
+
+    @staticmethod
+    def _parse_retry_after(headers: Optional[dict]) -> Optional[float]:
+        """Retry-After is either seconds or a HTTP date."""
+        if not headers:
+            return None
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            logger.debug(f"Can't parse Retry-After: {value}")
+            return None
+
+
+class HostRateLimiter:
+    """One TokenBucket per host, plus stats about throttled/working time.
+
+    Usage:
+        with limiter.slot(uri) as record:
+            res = requests.get(uri)
+            record.status_code, record.headers = res.status_code, res.headers
+        # or
+        async with limiter.async_slot(uri) as record:
+            ...
+    """
+
+    def __init__(
+        self,
+        requests_per_sec: float,
+        burst: int = 1,
+        state_dir: Optional[Path] = None,
+        stats: Optional[ThrottleStats] = None,
+        controller: Optional[AIMDController] = None,
+    ):
+        self.requests_per_sec = requests_per_sec
+        self.burst = burst
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.stats = stats if stats else ThrottleStats()
+        # If set, adapts the rate of each host based on its responses
+        self.controller = controller
+
+        self._buckets: dict[str, TokenBucket] = dict()
+        self._lock = threading.Lock()
+
+    def bucket(self, uri: str) -> TokenBucket:
+        host = urlparse(uri).netloc
+        with self._lock:
+            if host not in self._buckets:
+                state_file = (
+                    self.state_dir / f"{host.replace(':', '_')}.bucket"
+                    if self.state_dir
+                    else None
+                )
+                self._buckets[host] = TokenBucket(
+                    rate=self.requests_per_sec, burst=self.burst, state_file=state_file
+                )
+            return self._buckets[host]
+
+    def wait(self, uri: str) -> float:
+        """Block until a request to uri's host is allowed."""
+        wait = self.bucket(uri).reserve()
+        if wait:
+            logger.debug(f"Throttling {uri} for {wait:.2f}s")
+            time.sleep(wait)
+            self.stats.add_throttled(wait)
+        return wait
+
+    async def async_wait(self, uri: str) -> float:
+        """Like wait(), without blocking the event loop."""
+        wait = self.bucket(uri).reserve()
+        if wait:
+            logger.debug(f"Throttling {uri} for {wait:.2f}s")
+            await asyncio.sleep(wait)
+            self.stats.add_throttled(wait)
+        return wait
+
+    def observe(self, uri: str, latency: float, record: RequestRecord) -> None:
+        """Let the controller (if any) adapt the rate to a response."""
+        self.stats.add_work(latency)
+        if self.controller:
+            self.controller.observe(
+                host=urlparse(uri).netloc,
+                bucket=self.bucket(uri),
+                latency=latency,
+                status_code=record.status_code,
+                headers=record.headers,
+            )
+
+    @contextmanager
+    def slot(self, uri: str):
+        """Yields a RequestRecord to be filled with the response info."""
+        self.wait(uri)
+        record = RequestRecord()
+        start = time.time()
+        try:
+            yield record
+        finally:
+            self.observe(uri, latency=time.time() - start, record=record)
+
+    @asynccontextmanager
+    async def async_slot(self, uri: str):
+        await self.async_wait(uri)
+        record = RequestRecord()
+        start = time.time()
+        try:
+            yield record
+        finally:
+            self.observe(uri, latency=time.time() - start, record=record)
+
+    def __repr__(self):
+        return (
+            f"HostRateLimiter(requests_per_sec={self.requests_per_sec}, "
+            f"burst={self.burst}, state_dir={self.state_dir})"
+        )
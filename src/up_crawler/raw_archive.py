@@ -0,0 +1,150 @@
+"""
+Archive of the full raw HTTP responses of crawled articles, so that articles
+can be re-extracted (see reparse.py) without downloading them again.
+
+The archive is a standard .warc.gz file: WARC/1.0 'response' records, each
+compressed as its own gzip member, so that any record can be read by itself.
+Next to it an index (.idx, one json per line) has the URI, offset and
+length of each record.
+"""
+
+import gzip
+import json
+import threading
+import uuid
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Iterator, Optional
+
+from up_crawler.path_ops import make_path_ok, make_writable
+
+# Describe the stored body, which is already decoded
+HEADERS_TO_SKIP = ["content-encoding", "transfer-encoding", "content-length"]
+
+
+@dataclass
+class ArchivedResponse:
+    uri: str
+    status_code: int
+    headers: dict[str, str]
+    content: bytes
+
+    @property
+    def encoding(self) -> Optional[str]:
+        """Charset from the Content-Type header, like requests' .encoding"""
+        content_type = self.headers.get("content-type", "")
+        for part in content_type.split(";"):
+            key, _, value = part.strip().partition("=")
+            if key.lower() == "charset" and value:
+                return value.strip("\"'")
+        return None
+
+
+class RawArchiveWriter:
+    """Appends responses to a .warc.gz archive and its index."""
+
+    def __init__(self, path: Path | str):
+        self.path = make_writable(make_path_ok(path))
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self._lock = threading.Lock()
+
+    def write(
+        self,
+        uri: str,
+        status_code: int,
+        headers: dict,
+        content: bytes,
+    ) -> None:
+        http_headers = "".join(
+            f"{k}: {v}\r\n"
+            for k, v in headers.items()
+            if k.lower() not in HEADERS_TO_SKIP
+        )
+        http_block = (
+            f"HTTP/1.1 {status_code}\r\n{http_headers}"
+            f"Content-Length: {len(content)}\r\n\r\n"
+        ).encode() + content
+
+        warc_headers = (
+            "WARC/1.0\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Target-URI: {uri}\r\n"
+            f"WARC-Date: {datetime.now(timezone.utc):%Y-%m-%dT%H:%M:%SZ}\r\n"
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+            "Content-Type: application/http;msgtype=response\r\n"
+            f"Content-Length: {len(http_block)}\r\n\r\n"
+        ).encode()
+        record = gzip.compress(warc_headers + http_block + b"\r\n\r\n")
+
+        with self._lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+            with open(self.index_path, "a") as f:
+                f.write(
+                    json.dumps({"uri": uri, "offset": offset, "length": len(record)})
+                    + "\n"
+                )
+
+    def __repr__(self):
+        return f"RawArchiveWriter({self.path})"
+
+
+class RawArchiveReader:
+    """Random and sequential access to a RawArchiveWriter archive."""
+
+    def __init__(self, path: Path | str):
+        self.path = make_path_ok(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+
+    def index(self) -> list[dict]:
+        """Index entries; for URIs archived more than once the last one wins."""
+        entries = dict()
+        with open(self.index_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entries[entry["uri"]] = entry
+        return list(entries.values())
+
+    def read_at(self, offset: int, length: int) -> ArchivedResponse:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = gzip.decompress(f.read(length))
+        return self.parse_record(record)
+
+    def __iter__(self) -> Iterator[ArchivedResponse]:
+        for entry in self.index():
+            yield self.read_at(entry["offset"], entry["length"])
+
+    @staticmethod
+    def parse_record(record: bytes) -> ArchivedResponse:
+        warc_head, _, rest = record.partition(b"\r\n\r\n")
+        warc_headers = RawArchiveReader._parse_headers(warc_head.split(b"\r\n")[1:])
+        http_block = rest[: int(warc_headers["content-length"])]
+
+        http_head, _, content = http_block.partition(b"\r\n\r\n")
+        status_line, *header_lines = http_head.split(b"\r\n")
+        return ArchivedResponse(
+            uri=warc_headers["warc-target-uri"],
+            status_code=int(status_line.split()[1]),
+            headers=RawArchiveReader._parse_headers(header_lines),
+            content=content,
+        )
+
+    @staticmethod
+    def _parse_headers(lines: list[bytes]) -> dict[str, str]:
+        headers = dict()
+        for line in lines:
+            key, _, value = line.decode("utf8", errors="replace").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return headers
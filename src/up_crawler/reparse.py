@@ -0,0 +1,245 @@
+"""
+Rebuild the article jsons from an archive of raw responses (see
+raw_archive.py), without any network requests, using all cores.
+
+Useful after changes to the extraction (REGEX_PARAS_TO_SKIP, PARAS_WITH_TEXT,
+tags...), so that the corpus doesn't have to be downloaded again.
+"""
+
+import pdb
+import sys
+import traceback
+import argparse
+import os
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from pathlib import Path
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
+
+from typing import Optional
+
+from up_crawler.data_structures import Article, TagsMapping
+from up_crawler.consts import REGEX_PARAS_TO_SKIP, TAGS_MAPPING_FN
+from up_crawler.path_ops import get_dir_or_temp, make_path_ok, mkdir
+from up_crawler.raw_archive import RawArchiveReader
+from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.html_parsers import DEFAULT_HTML_PARSER, _add_parser_args
+from up_crawler.para_filter import ParagraphFilter
+from up_crawler.tags_journal import TagsJournal
+from up_crawler.storage import (
+    ArticleStorage,
+    DirectoryStorage,
+    _add_storage_args,
+    _storage_from_args,
+)
+
+
+def _reparse_record(
+    offset: int,
+    length: int,
+    archive_path: Path,
+    regex_paras_to_skip: Optional[ParagraphFilter] = None,
+    html_parser: str = DEFAULT_HTML_PARSER,
+) -> Optional[tuple[dict, Article, Counter]]:
+    """Parse one archived response, in a worker process.
+
+    Returns (uri metadata, article, hits of the paragraph filter for this
+    article), or None if it's not a valid article.
+    """
+    if regex_paras_to_skip:
+        # The filter is shared by all the records of a chunk
+        regex_paras_to_skip.hits.clear()
+    res = RawArchiveReader(archive_path).read_at(offset, length)
+    meta = UPSitemapCrawler.parse_article_uri(res.uri)
+    if not meta:
+        logger.warning(f"{res.uri} doesn't look like an article URI, skipping")
+        return None
+
+    if not UPCrawler.check_status_code(uri=res.uri, status_code=res.status_code):
+        return None
+    article = UPCrawler.article_from_response(
+        uri=res.uri,
+        content=res.content,
+        encoding=res.encoding,
+        regex_paras_to_skip=regex_paras_to_skip,
+        html_parser=html_parser,
+    )
+    if not article:
+        return None
+    hits = Counter(regex_paras_to_skip.hits) if regex_paras_to_skip else Counter()
+    return meta, article, hits
+
+
+class UPReparser:
+    """Re-extracts Articles from a raw responses archive into target_dir,
+    with the same layout UPCrawler uses."""
+
+    def __init__(
+        self,
+        archive_path: Path | str,
+        target_dir: Optional[Path | str] = None,
+        tags_mapping_file: Optional[Path | str] = None,
+        regex_paras_to_skip: Optional[list[str]] = REGEX_PARAS_TO_SKIP,
+        workers: Optional[int] = None,
+        html_parser: str = DEFAULT_HTML_PARSER,
+        storage: Optional[ArticleStorage] = None,
+    ):
+        self.archive = RawArchiveReader(archive_path)
+        self.target_dir = get_dir_or_temp(target_dir)
+        self.tags_mapping_file = (
+            make_path_ok(tags_mapping_file)
+            if tags_mapping_file
+            else self.target_dir / TAGS_MAPPING_FN
+        )
+        self.regex_paras_to_skip = ParagraphFilter.get(regex_paras_to_skip)
+        self.workers = workers if workers else os.cpu_count()
+        self.html_parser = html_parser
+        self.storage = storage if storage else DirectoryStorage(self.target_dir)
+
+    def _read_tags_mapping(self) -> TagsMapping:
+        if self.tags_mapping_file.exists():
+            logger.info(f"Updating tags mapping at {self.tags_mapping_file}")
+            return TagsJournal.read(self.tags_mapping_file)
+        logger.info(f"Creating new tags mapping at {self.tags_mapping_file}")
+        return TagsMapping(tags_mapping=dict())
+
+    def run(self) -> int:
+        """Returns the number of articles written."""
+        entries = self.archive.index()
+        logger.info(
+            f"Reparsing {len(entries)} responses from {self.archive.path} "
+            f"to {self.target_dir} with {self.workers} processes"
+        )
+        tags = self._read_tags_mapping()
+
+        reparse = partial(
+            _reparse_record,
+            archive_path=self.archive.path,
+            regex_paras_to_skip=self.regex_paras_to_skip,
+            html_parser=self.html_parser,
+        )
+        num_written = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(
+                reparse,
+                [x["offset"] for x in entries],
+                [x["length"] for x in entries],
+                chunksize=max(1, min(64, len(entries) // (self.workers * 4))),
+            )
+            with logging_redirect_tqdm():
+                for res in tqdm(results, total=len(entries), desc="articles"):
+                    if res is None:
+                        continue
+                    meta, article, hits = res
+                    if self.regex_paras_to_skip:
+                        self.regex_paras_to_skip.add_hits(hits)
+                    UPCrawler.save_article(
+                        article,
+                        art_path=None,
+                        lang=meta["lang"],
+                        art_id=int(meta["id"]),
+                        date=meta["date"],
+                        tags_mapping=tags,
+                        storage=self.storage,
+                    )
+                    num_written += 1
+
+        TagsJournal(self.tags_mapping_file).compact(tags)
+        logger.info(f"Reparsed {num_written} articles to {self.target_dir}")
+        if self.regex_paras_to_skip:
+            logger.info(self.regex_paras_to_skip.report())
+        return num_written
+
+
+def run(args):
+    logger.info(f"Running with params {args}")
+    target_dir = get_dir_or_temp(args.output)
+    rp = UPReparser(
+        archive_path=args.input,
+        target_dir=target_dir,
+        tags_mapping_file=args.tags_mapping_file,
+        workers=args.workers,
+        html_parser=args.html_parser,
+        storage=_storage_from_args(args, target_dir=target_dir),
+    )
+    rp.run()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input",
+        "-i",
+        help="Archive of raw responses (.warc.gz) written with up_run --archive",
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Output for the dataset (%(default)s)",
+        type=Path,
+    )
+    parser.add_argument(
+        "--tags_mapping_file",
+        "-tm",
+        help="Tags mapping to update, default is the one in output. (%(default)s)",
+        type=Path,
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        help="Number of parser processes, default is all cores (%(default)s)",
+    )
+    _add_parser_args(parser)
+    _add_storage_args(parser)
+    parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
+    parser.add_argument(
+        "-q",
+        help="Output only warnings",
+        action="store_const",
+        dest="loglevel",
+        const=logging.WARN,
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Output more details",
+        action="store_const",
+        dest="loglevel",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.setLevel(args.loglevel if args.loglevel else logging.INFO)
+
+    logger.debug(args)
+
+    try:
+        run(args)
+    except Exception as e:
+        if args.pdb:
+            extype, value, tb = sys.exc_info()
+            traceback.print_exc()
+            pdb.post_mortem(tb)
+        else:
+            logger.exception(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Local store of parsed monthly sitemaps.
+
+Each month's sitemap dataframe (as returned by
+UPSitemapCrawler._sitemap_df) is kept as a parquet file (or a
+gzipped csv without pyarrow), next to a small json with where and when it
+came from and the validators (ETag / Last-Modified) of the response.
+
+Months that were already closed when fetched (see
+UPSitemapCrawler._is_month_closed) are used as they are forever, the others
+are revalidated with a conditional request and refetched only if changed.
+
+    cache_dir/sitemap-2023-11.parquet
+    cache_dir/sitemap-2023-11.json
+"""
+
+import json
+import os
+import time
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+import pandas as pd
+
+from typing import Optional
+
+from up_crawler.path_ops import make_path_ok, mkdir
+
+try:
+    import pyarrow  # noqa: F401
+
+    MONTH_FORMAT = "parquet"
+except ImportError:
+    MONTH_FORMAT = "csv.gz"
+
+
+class MonthSitemapCache:
+    """Parsed month sitemaps, see module docstring."""
+
+    def __init__(self, cache_dir: Path | str):
+        self.cache_dir = mkdir(make_path_ok(cache_dir))
+
+    def _paths(self, month: pd.Period) -> tuple[Path, Path]:
+        name = f"sitemap-{month.year}-{month.month:02d}"
+        return self.cache_dir / f"{name}.{MONTH_FORMAT}", self.cache_dir / f"{name}.json"
+
+    def load(self, month: pd.Period) -> tuple[Optional[pd.DataFrame], Optional[dict]]:
+        """(dataframe, metadata) of month if stored; dataframe is None if the
+        sitemap didn't exist (metadata['missing'])."""
+        data_path, meta_path = self._paths(month)
+        if not meta_path.exists():
+            return None, None
+        meta = json.loads(meta_path.read_text())
+        if meta.get("missing"):
+            return None, meta
+        if not data_path.exists():
+            return None, None
+        if MONTH_FORMAT == "parquet":
+            df = pd.read_parquet(data_path)
+        else:
+            df = pd.read_csv(data_path, dtype=str, keep_default_na=False, na_values=[""])
+            df["date"] = pd.to_datetime(df.date)
+        return df, meta
+
+    def store(
+        self,
+        month: pd.Period,
+        df: Optional[pd.DataFrame],
+        uri: str,
+        closed: bool,
+        headers: Optional[dict] = None,
+    ) -> None:
+        """Store month's dataframe (None: no sitemap for month).
+
+        closed: the month's sitemap won't change anymore
+        headers: of the response, to revalidate it later
+        """
+        data_path, meta_path = self._paths(month)
+        headers = headers if headers else dict()
+        meta = {
+            "uri": uri,
+            "closed": closed,
+            "missing": df is None,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched": time.time(),
+        }
+        if df is not None:
+            tmp_path = data_path.with_name(f"{data_path.name}.tmp{os.getpid()}")
+            if MONTH_FORMAT == "parquet":
+                df.to_parquet(tmp_path, index=False)
+            else:
+                df.to_csv(tmp_path, index=False, compression="gzip")
+            tmp_path.replace(data_path)
+        # Written last: a month without its json isn't there
+        meta_path.write_text(json.dumps(meta))
+
+    @staticmethod
+    def conditional_headers(meta: Optional[dict]) -> dict:
+        """Headers to revalidate the stored month with."""
+        headers = dict()
+        if meta and meta.get("etag"):
+            headers["if-none-match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["if-modified-since"] = meta["last_modified"]
+        return headers
+
+    def __repr__(self):
+        return f"MonthSitemapCache({self.cache_dir})"
@@ -0,0 +1,517 @@
+"""
+Storage backends for the crawled articles.
+
+DirectoryStorage is the original layout: one directory per article (art_id)
+with one pretty-printed json per translation, named lang_<base64(uri)>.json.
+
+ShardStorage appends the articles as compressed json lines to a few big
+shard files instead (one series of shards per month of publication,
+rolled over when they get bigger than max_shard_mb), with a sqlite index
+from (art_id, lang) to (shard, offset, length). Each record is compressed
+on its own (zstd if `zstandard` is installed, gzip otherwise), so any
+article can be read without decompressing the rest of its shard.
+
+Both keep the raw html of the articles in a BlobStore next to them (see
+blobs.py) by default, inline_raw_html keeps it inside the articles like
+before.
+
+up_storage converts a corpus from one to the other.
+"""
+
+import pdb
+import sys
+import traceback
+import argparse
+
+import base64
+import dataclasses
+
+from abc import ABC, abstractmethod
+import os
+
+from functools import partial
+import sqlite3
+import threading
+import uuid
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from tqdm import tqdm
+
+from typing import Iterator, Optional
+
+from up_crawler.data_structures import Article, Language
+from up_crawler.consts import TAGS_MAPPING_FN
+from up_crawler.path_ops import make_path_ok, mkdir
+from up_crawler.tags_journal import TagsJournal
+from up_crawler.blobs import BlobStore, compress, decompress, default_compression
+from up_crawler.codec import CODECS, DEFAULT_CODEC, Codec, get_codec
+
+LANGS = [x.value for x in Language]
+
+
+class ArticleStorage(ABC):
+    """Where UPCrawler writes articles and UPReader reads them from."""
+
+    # Raw html of the articles, see blobs.py
+    blobs: BlobStore
+    # Write the raw html inside the articles instead of to self.blobs
+    inline_raw_html: bool = False
+    # How articles are (de)serialized, see codec.py
+    codec: Codec = get_codec()
+
+    @abstractmethod
+    def exists(self, art_id: int, lang: str, uri: str) -> bool:
+        """True if the translation at uri is stored already."""
+
+    @abstractmethod
+    def write(self, art: Article) -> None:
+        """Write an article with its art_id, lang and date filled in."""
+
+    @abstractmethod
+    def read(
+        self, art_id: int, lang: str, fields: Optional[frozenset[str]] = None
+    ) -> Optional[Article]:
+        """fields: only read those (a codec.projection), None for all"""
+
+    @abstractmethod
+    def iter_articles(
+        self, fields: Optional[frozenset[str]] = None
+    ) -> Iterator[tuple[int, dict[str, Article]]]:
+        """(art_id, {lang: Article}) for all stored articles."""
+
+    @abstractmethod
+    def signatures(self) -> Iterator[tuple[int, str, str]]:
+        """(art_id, lang, signature) of all stored translations; the
+        signature changes when a translation is written again."""
+
+    @abstractmethod
+    def read_bytes(self, art_id: int, lang: str) -> bytes:
+        """A translation as stored, e.g. to hash it."""
+
+    def close(self) -> None:
+        pass
+
+    def _to_write(self, art: Article) -> Article:
+        """art as it should be written: its raw html moved to self.blobs,
+        or brought back inside it if inline_raw_html."""
+        if self.inline_raw_html:
+            if art.raw_html is None and art.raw_html_ref:
+                return dataclasses.replace(
+                    art, raw_html=art.get_raw_html(), raw_html_ref=None
+                )
+            return art
+        if art.raw_html is not None:
+            ref = self.blobs.put(art.raw_html)
+        elif art.raw_html_ref and art.raw_html_ref not in self.blobs:
+            # Read from another storage, copy its blob
+            ref = self.blobs.put(art.get_raw_html())
+        else:
+            return art
+        return dataclasses.replace(art, raw_html=None, raw_html_ref=ref)
+
+    def _read_article(self, art: Article) -> Article:
+        """Articles read get their raw html from our blobs, lazily."""
+        art._blobs = self.blobs
+        return art
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DirectoryStorage(ArticleStorage):
+    """target_dir/<art_id>/<lang>_<base64(uri)>.json"""
+
+    def __init__(
+        self,
+        target_dir: Path | str,
+        inline_raw_html: bool = False,
+        codec: Optional[str | Codec] = None,
+    ):
+        self.target_dir = make_path_ok(target_dir)
+        self.blobs = BlobStore(self.target_dir)
+        self.inline_raw_html = inline_raw_html
+        self.codec = get_codec(codec)
+
+    @staticmethod
+    def article_path(group_dir: Path, lang: str, uri: str) -> Path:
+        """Path of the json of one translation, e.g. group_dir/eng_<base64(uri)>.json"""
+        art_filename = lang + "_" + base64.b64encode(uri.encode()).decode() + ".json"
+        return group_dir / art_filename
+
+    def _path(self, art_id, lang: str, uri: str) -> Path:
+        return self.article_path(self.target_dir / str(art_id), lang=lang, uri=uri)
+
+    def exists(self, art_id: int, lang: str, uri: str) -> bool:
+        return self._path(art_id, lang, uri).exists()
+
+    def write(self, art: Article) -> None:
+        art_path = self._path(art.art_id, art.lang.value, art.uri)
+        art = self._to_write(art)
+        mkdir(art_path.parent)
+        self.codec.write_article(art, art_path)
+
+    def read(self, art_id, lang, fields=None):
+        for art_file in (self.target_dir / str(art_id)).glob(f"{lang}_*.json"):
+            return self._read_article(self.codec.read_article(art_file, fields=fields))
+        return None
+
+    def iter_articles(self, fields=None):
+        with os.scandir(self.target_dir) as it:
+            dirs = [x for x in it if x.is_dir() and x.name.isnumeric()]
+        for d in sorted(dirs, key=lambda x: int(x.name)):
+            articles = dict()
+            with os.scandir(d.path) as it:
+                for f in it:
+                    lang = f.name.split("_")[0]
+                    if not f.name.endswith(".json") or lang not in LANGS:
+                        continue
+                    try:
+                        articles[lang] = self._read_article(
+                            self.codec.read_article(f.path, fields=fields)
+                        )
+                    except Exception as e:
+                        logger.warning(f"Failed to read {f.path} as article: {e}")
+            if articles:
+                yield int(d.name), articles
+
+    def signatures(self):
+        with os.scandir(self.target_dir) as it:
+            dirs = [x for x in it if x.is_dir() and x.name.isnumeric()]
+        for d in dirs:
+            with os.scandir(d.path) as it:
+                for f in it:
+                    lang = f.name.split("_")[0]
+                    if not f.name.endswith(".json") or lang not in LANGS:
+                        continue
+                    stat = f.stat()
+                    yield int(d.name), lang, f"{f.name}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def read_bytes(self, art_id, lang):
+        for art_file in (self.target_dir / str(art_id)).glob(f"{lang}_*.json"):
+            return art_file.read_bytes()
+        raise KeyError(f"No {lang} translation of {art_id} in {self}")
+
+    def __repr__(self):
+        return f"DirectoryStorage({self.target_dir})"
+
+
+class ShardStorage(ArticleStorage):
+    """Articles as compressed json lines in shards, see module docstring."""
+
+    SHARDS_DIR = "shards"
+    INDEX_FN = "index.sqlite"
+    DEFAULT_MAX_SHARD_MB = 256
+
+    def __init__(
+        self,
+        target_dir: Path | str,
+        max_shard_mb: float = DEFAULT_MAX_SHARD_MB,
+        compression: Optional[str] = None,
+        inline_raw_html: bool = False,
+        codec: Optional[str | Codec] = None,
+    ):
+        self.target_dir = make_path_ok(target_dir)
+        self.shards_dir = mkdir(self.target_dir / self.SHARDS_DIR)
+        self.max_shard_size = int(max_shard_mb * 1024 * 1024)
+        self.compression = compression if compression else default_compression()
+        self.blobs = BlobStore(self.target_dir, compression=self.compression)
+        self.inline_raw_html = inline_raw_html
+        self.codec = get_codec(codec)
+
+        # Several writers (processes) never append to the same shard
+        self._writer_id = uuid.uuid4().hex[:8]
+        # month -> (sequence number, path) of the shard being written
+        self._shards: dict[str, tuple[int, Path]] = dict()
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.shards_dir / self.INDEX_FN, check_same_thread=False, timeout=60
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS articles (
+                art_id INTEGER NOT NULL,
+                lang TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                date TEXT,
+                shard TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (art_id, lang)
+            )"""
+        )
+        self._db.commit()
+
+    @staticmethod
+    def is_shard_storage(path: Path | str) -> bool:
+        return (
+            make_path_ok(path) / ShardStorage.SHARDS_DIR / ShardStorage.INDEX_FN
+        ).exists()
+
+    def _shard_path(self, month: str, record_size: int) -> Path:
+        """Shard for an article of month, a new one if the current one is full."""
+        ext = "zst" if self.compression == "zstd" else "gz"
+        seq, path = self._shards.get(month, (0, None))
+        if path is None or path.stat().st_size + record_size > self.max_shard_size:
+            if path is not None:
+                seq += 1
+            path = self.shards_dir / f"{month}_{self._writer_id}_{seq:04d}.jsonl.{ext}"
+            path.touch()
+            self._shards[month] = (seq, path)
+        return path
+
+    def exists(self, art_id: int, lang: str, uri: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM articles WHERE art_id = ? AND lang = ?",
+                (int(art_id), lang),
+            ).fetchone()
+        return row is not None
+
+    def write(self, art: Article) -> None:
+        art = self._to_write(art)
+        record = compress(self.codec.dumps_article(art) + b"\n", self.compression)
+        month = art.date[:7] if art.date else "unknown"
+        with self._lock:
+            shard_path = self._shard_path(month, len(record))
+            with open(shard_path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+            self._db.execute(
+                """INSERT OR REPLACE INTO articles
+                (art_id, lang, uri, date, shard, offset, length)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    int(art.art_id),
+                    art.lang.value,
+                    art.uri,
+                    art.date,
+                    shard_path.name,
+                    offset,
+                    len(record),
+                ),
+            )
+            self._db.commit()
+
+    def _read_at(
+        self,
+        shard: str,
+        offset: int,
+        length: int,
+        fields: Optional[frozenset[str]] = None,
+    ) -> Article:
+        with open(self.shards_dir / shard, "rb") as f:
+            f.seek(offset)
+            data = decompress(shard, f.read(length))
+        art = self.codec.loads_article(data, fields=fields)
+        if fields is not None:
+            art._loader = partial(self._read_at, shard, offset, length)
+        return self._read_article(art)
+
+    def read(self, art_id, lang, fields=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT shard, offset, length FROM articles WHERE art_id = ? AND lang = ?",
+                (int(art_id), lang),
+            ).fetchone()
+        return self._read_at(*row, fields=fields) if row else None
+
+    def iter_articles(self, fields=None):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT art_id, lang, shard, offset, length FROM articles "
+                "ORDER BY art_id, lang"
+            ).fetchall()
+        art_id, articles = None, dict()
+        for row_art_id, lang, shard, offset, length in rows:
+            if row_art_id != art_id and articles:
+                yield art_id, articles
+                articles = dict()
+            art_id = row_art_id
+            articles[lang] = self._read_at(shard, offset, length, fields=fields)
+        if articles:
+            yield art_id, articles
+
+    def signatures(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT art_id, lang, shard, offset, length FROM articles"
+            ).fetchall()
+        for art_id, lang, shard, offset, length in rows:
+            yield art_id, lang, f"{shard}:{offset}:{length}"
+
+    def read_bytes(self, art_id, lang):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT shard, offset, length FROM articles WHERE art_id = ? AND lang = ?",
+                (int(art_id), lang),
+            ).fetchone()
+        if not row:
+            raise KeyError(f"No {lang} translation of {art_id} in {self}")
+        shard, offset, length = row
+        with open(self.shards_dir / shard, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def num_articles(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __repr__(self):
+        return f"ShardStorage({self.target_dir}, compression={self.compression})"
+
+
+STORAGES = ["dirs", "shards"]
+
+
+def open_storage(path: Path | str, kind: Optional[str] = None, **kwargs) -> ArticleStorage:
+    """Storage of kind (one of STORAGES) at path; if kind is not given,
+    shards if there are shards there, dirs otherwise."""
+    if kind is None:
+        kind = "shards" if ShardStorage.is_shard_storage(path) else "dirs"
+    if kind == "shards":
+        return ShardStorage(path, **kwargs)
+    if kind == "dirs":
+        return DirectoryStorage(path, **kwargs)
+    raise ValueError(f"Unknown storage {kind}, have {STORAGES}")
+
+
+def convert(src: ArticleStorage, dst: ArticleStorage) -> int:
+    """Copy all articles from src to dst, returns how many."""
+    num_written = 0
+    for art_id, articles in tqdm(src.iter_articles(), desc="articles"):
+        for art in articles.values():
+            dst.write(art)
+            num_written += 1
+    return num_written
+
+
+## CLI
+
+
+def _add_storage_args(parser) -> None:
+    """Add the storage CLI arguments to an argparse parser."""
+    parser.add_argument(
+        "--storage",
+        choices=STORAGES,
+        default="dirs",
+        help="How to store the articles: a dir per article, or compressed shards (%(default)s)",
+    )
+    parser.add_argument(
+        "--max_shard_mb",
+        type=float,
+        default=ShardStorage.DEFAULT_MAX_SHARD_MB,
+        help="With --storage shards, start a new shard after this size (%(default)s)",
+    )
+    parser.add_argument(
+        "--inline_raw_html",
+        action="store_true",
+        help="Keep the raw html inside the article jsons instead of a separate blob store",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=list(CODECS),
+        default=DEFAULT_CODEC,
+        help="How to (de)serialize the articles, see codec.py (%(default)s)",
+    )
+
+
+def _storage_from_args(args, target_dir: Path) -> ArticleStorage:
+    """Create the storage from the args added by _add_storage_args."""
+    if args.storage == "shards":
+        return ShardStorage(
+            target_dir,
+            max_shard_mb=args.max_shard_mb,
+            inline_raw_html=args.inline_raw_html,
+            codec=args.codec,
+        )
+    return DirectoryStorage(
+        target_dir, inline_raw_html=args.inline_raw_html, codec=args.codec
+    )
+
+
+def run(args):
+    logger.info(f"Running with params {args}")
+    src = open_storage(args.input)
+    dst = _storage_from_args(args, target_dir=make_path_ok(args.output))
+    logger.info(f"Converting {src} to {dst}")
+    num_written = convert(src, dst)
+
+    # The tags mapping goes along, with its journal compacted
+    tags_file = make_path_ok(args.input) / TAGS_MAPPING_FN
+    if tags_file.exists():
+        TagsJournal(make_path_ok(args.output) / TAGS_MAPPING_FN).compact(
+            TagsJournal.read(tags_file)
+        )
+    src.close()
+    dst.close()
+    logger.info(f"Converted {num_written} articles")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input",
+        "-i",
+        help="Corpus to convert (dirs or shards, detected)",
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Where to write the converted corpus",
+        type=Path,
+        required=True,
+    )
+    _add_storage_args(parser)
+    parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
+    parser.add_argument(
+        "-q",
+        help="Output only warnings",
+        action="store_const",
+        dest="loglevel",
+        const=logging.WARN,
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Output more details",
+        action="store_const",
+        dest="loglevel",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.setLevel(args.loglevel if args.loglevel else logging.INFO)
+
+    logger.debug(args)
+
+    try:
+        run(args)
+    except Exception as e:
+        if args.pdb:
+            extype, value, tb = sys.exc_info()
+            traceback.print_exc()
+            pdb.post_mortem(tb)
+        else:
+            logger.exception(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Incremental persistence of the tags mapping.
+
+Instead of rewriting the whole tags mapping json after every article,
+changed tags are appended to a journal next to it (one json per line),
+and the json itself is rewritten (atomically) only every now and then and
+at the end of the crawl, which empties the journal.
+
+Reading a tags mapping replays the journal, so after a crash nothing
+flushed to the journal is lost.
+"""
+
+import json
+import os
+import time
+
+from pathlib import Path
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+from typing import Optional
+
+from up_crawler.data_structures import Language, TagsMapping
+from up_crawler.codec import get_codec
+from up_crawler.path_ops import make_path_ok
+
+
+class TagsJournal:
+    """A tags mapping json plus the journal of its changes since written."""
+
+    JOURNAL_SUFFIX = ".journal"
+    # Rewrite the json (and empty the journal) at most this often on flush()
+    COMPACT_EVERY_SEC = 5 * 60
+
+    def __init__(
+        self, tags_mapping_file: Path | str, compact_every_sec: float = COMPACT_EVERY_SEC
+    ):
+        self.path = make_path_ok(tags_mapping_file)
+        self.journal_path = self.journal_path_for(self.path)
+        self.compact_every_sec = compact_every_sec
+
+        # (tag_short, lang) -> (tag_name, tag_link), as persisted until now
+        self._persisted: Optional[dict] = None
+        self._last_compaction = time.time()
+
+    @staticmethod
+    def journal_path_for(tags_mapping_file: Path) -> Path:
+        return tags_mapping_file.with_name(
+            tags_mapping_file.name + TagsJournal.JOURNAL_SUFFIX
+        )
+
+    @staticmethod
+    def read(tags_mapping_file: Path | str) -> TagsMapping:
+        """Read the tags mapping json and replay its journal (if any)."""
+        tags_mapping_file = make_path_ok(tags_mapping_file)
+        tm = get_codec().loads_tags_mapping(tags_mapping_file.read_bytes())
+        if tm.tags_mapping is None:
+            tm.tags_mapping = dict()
+        journal_path = TagsJournal.journal_path_for(tags_mapping_file)
+        if not journal_path.exists():
+            return tm
+
+        num_replayed = 0
+        with open(journal_path, encoding="utf8") as f:
+            for line in f:
+                try:
+                    tag_short, lang, value = json.loads(line)
+                except ValueError:
+                    # Last line half-written when we crashed
+                    logger.debug(f"Skipping broken line in {journal_path}: {line}")
+                    continue
+                tm.tags_mapping.setdefault(tag_short, dict())[Language(lang)] = (
+                    tuple(value) if value else None
+                )
+                num_replayed += 1
+        if num_replayed:
+            logger.info(f"Replayed {num_replayed} tag changes from {journal_path}")
+        return tm
+
+    def load(self) -> TagsMapping:
+        """read() our tags mapping, remembering it as persisted."""
+        tm = self.read(self.path)
+        self._persisted = self._flatten(tm)
+        return tm
+
+    def flush(self, tags: TagsMapping) -> int:
+        """Append the tags changed since the last flush to the journal,
+        compact if it's time to. Returns number of changes written."""
+        if self._persisted is None:
+            self.compact(tags)
+            return 0
+
+        current = self._flatten(tags)
+        changes = [
+            (tag_short, lang, value)
+            for (tag_short, lang), value in current.items()
+            if self._persisted.get((tag_short, lang), ()) != value
+        ]
+        if changes:
+            with open(self.journal_path, "a", encoding="utf8") as f:
+                for tag_short, lang, value in changes:
+                    f.write(json.dumps([tag_short, lang, value], ensure_ascii=False))
+                    f.write("\n")
+            self._persisted.update(((t, l), v) for t, l, v in changes)
+
+        if time.time() - self._last_compaction > self.compact_every_sec:
+            self.compact(tags)
+        return len(changes)
+
+    def compact(self, tags: TagsMapping) -> None:
+        """Atomically rewrite the tags mapping json, then empty the journal."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        tmp_path.write_bytes(get_codec().dumps_tags_mapping(tags, indent=True))
+        tmp_path.replace(self.path)
+        # If we crash right here, replaying the journal changes nothing
+        self.journal_path.unlink(missing_ok=True)
+
+        self._persisted = self._flatten(tags)
+        self._last_compaction = time.time()
+
+    @staticmethod
+    def _flatten(tags: TagsMapping) -> dict:
+        """{(tag_short, lang): [tag_name, tag_link] or None}"""
+        flat = dict()
+        for tag_short, langs in (tags.tags_mapping or dict()).items():
+            for lang, value in langs.items():
+                lang = lang.value if isinstance(lang, Language) else lang
+                flat[(tag_short, lang)] = list(value) if value else None
+        return flat
+
+    def __repr__(self):
+        return f"TagsJournal({self.path})"
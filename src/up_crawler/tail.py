@@ -0,0 +1,90 @@
+"""
+Tail mode: download new articles minutes after they're published.
+
+The archive sitemaps (see UPSitemapCrawler.get_article_uris) only have the
+articles older than about two weeks. UPTailer instead polls the latest
+sitemaps (sitemap-news.xml, sitemap-now.xml) every poll interval, adds the
+URIs not seen yet to the crawl frontier of the output dir and lets the
+crawler download them.
+
+The frontier has every URI ever queued, downloaded or not, so adding to it
+is the diff against what was already crawled. Sitemaps unchanged since the
+last poll are answered with a 304 and not parsed at all, so a quiet poll
+costs a couple of small requests. Translations published after their
+article appear in the sitemaps later and are queued by a later poll.
+"""
+
+import time
+
+import logging
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+import requests
+
+from typing import Optional
+
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.consts import FRONTIER_FN
+from up_crawler.frontier import CrawlFrontier
+from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.http_session import NETWORK_ERRORS
+
+
+class UPTailer:
+    """Follows the latest sitemaps, see module docstring."""
+
+    POLL_INTERVAL_SEC = 5 * 60
+
+    def __init__(
+        self,
+        crawler: UPCrawler,
+        sitemap_crawler: Optional[UPSitemapCrawler] = None,
+    ):
+        # Downloads what's pending in the frontier of its target_dir
+        self.crawler = crawler
+        self.sitemap_crawler = (
+            sitemap_crawler
+            if sitemap_crawler
+            else UPSitemapCrawler(session=crawler.session)
+        )
+        self.frontier = CrawlFrontier(crawler.target_dir / FRONTIER_FN)
+
+    def poll(self) -> int:
+        """Queue the articles of the latest sitemaps not queued yet,
+        returns number of new URIs (incl. translations)."""
+        df = self.sitemap_crawler.get_latest_articles()
+        if not len(df):
+            return 0
+        num_new = self.frontier.add(df)
+        logger.info(f"{num_new} new URIs out of {len(df)} in the latest sitemaps")
+        return num_new
+
+    def run(
+        self,
+        poll_interval: float = POLL_INTERVAL_SEC,
+        max_polls: Optional[int] = None,
+    ) -> None:
+        """Poll and download the new articles every poll_interval seconds,
+        max_polls times (None: until interrupted)."""
+        num_polls = 0
+        try:
+            while True:
+                try:
+                    self.poll()
+                except NETWORK_ERRORS + (requests.HTTPError,) as e:
+                    # Next poll will get them
+                    logger.warning(f"Couldn't get the latest sitemaps: {e}")
+                if self.frontier.num_articles(self.frontier.PENDING):
+                    self.crawler.run()
+                num_polls += 1
+                if max_polls and num_polls >= max_polls:
+                    break
+                logger.info(f"Next poll in {poll_interval}s")
+                time.sleep(poll_interval)
+        finally:
+            self.frontier.close()
+
+    def __repr__(self):
+        return f"UPTailer({self.crawler.target_dir})"
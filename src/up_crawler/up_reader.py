@@ -40,8 +40,12 @@ from rich import inspect
 import base64
 
 import csv
+import os
 
-from typing import List, Tuple, Optional, Dict, Union, Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from typing import List, Tuple, Optional, Dict, Union, Iterator, Iterable
 
 from collections import defaultdict
 
@@ -52,6 +56,13 @@ from up_crawler.get_uris import UPSitemapCrawler
 from up_crawler.data_structures import Language, Article, TagsMapping, FullArticle
 from up_crawler.consts import URI_TAGS_RU, URI_TAGS_UA, REGEX_PARAS_TO_SKIP
 from up_crawler.consts import MAX_RETRIES_FOR_REQUEST, TAGS_MAPPING_FN
+from up_crawler.tags_journal import TagsJournal
+from up_crawler.storage import ArticleStorage, DirectoryStorage, open_storage
+from up_crawler.blobs import BlobStore
+from up_crawler.codec import get_codec, projection
+from up_crawler.corpus import CompactCorpus
+from up_crawler.parquet_export import PARTITIONS, UPToParquetExporter
+from up_crawler.export_manifest import ExportManifest
 
 
 b = breakpoint
@@ -62,6 +73,8 @@ class UPReader:
     Reads the crawl results of UParser.
     """
 
+    LANGS = [x.value for x in Language]
+
     # Paragraphs matching either of those will be skipped
 
     def __init__(
@@ -97,7 +110,8 @@ class UPReader:
     @staticmethod
     def get_tags(tags_file: Path) -> TagsMapping:
         try:
-            tm = TagsMapping.from_json_file(tags_file)
+            # With the changes not compacted yet, e.g. if the crawler crashed
+            tm = TagsJournal.read(tags_file)
         except Exception as e:
             logger.exception(e)
             raise e
@@ -133,7 +147,9 @@ class UPReader:
             if art_file.suffix != ".json":
                 continue
             try:
-                article = Article.from_json_file(art_file)
+                article = get_codec().read_article(art_file)
+                # Raw html (if not inline) loaded from the corpus' blobs on access
+                article._blobs = BlobStore(d.parent)
                 art_id = int(d.name)
                 lang = art_file.name.split("_")[0]
                 # NB - same article in diff languages can have diff tags!
@@ -154,32 +170,149 @@ class UPReader:
         return fa
 
     @staticmethod
-    def read_dir(path: Path) -> list[FullArticle]:
+    def read_dir(
+        path: Path, workers: Optional[int] = None, fields: Optional[Iterable[str]] = None
+    ) -> list[FullArticle]:
         """Read all articles in path, return as list of FullArticles."""
-        all_fas = list()
-        dirs = path.iterdir()
-
-        num_files = len(list(path.iterdir()))
-
-        for d in tqdm(dirs, total=num_files):
-            if not UPReader.is_dir_articles_dir(d):
-                continue
-            fa = UPReader.read_article_dir(d)
-            all_fas.append(fa)
+        art_dirs = UPReader.article_dirs(path)
+        fas = UPReader.iter_dir(path, workers=workers, art_dirs=art_dirs, fields=fields)
+        all_fas = list(tqdm(fas, total=len(art_dirs)))
         if not all_fas:
             raise ValueError(f"No valid articles found in {path}")
         return all_fas
 
     @staticmethod
-    def read_dir_chunked(path: Path) -> list[FullArticle]:
-        """Read all articles in path, return as list of FullArticles."""
-        dirs = path.iterdir()
+    def article_dirs(path: Path) -> list[str]:
+        """Paths of the article dirs in path (one scandir), sorted by art_id."""
+        with os.scandir(path) as it:
+            dirs = [(int(x.name), x.path) for x in it if x.name.isnumeric() and x.is_dir()]
+        return [d for _, d in sorted(dirs)]
 
-        for d in dirs:
-            if not UPReader.is_dir_articles_dir(d):
-                continue
-            fa = UPReader.read_article_dir(d)
-            yield fa
+    @staticmethod
+    def iter_dir(
+        path: Path,
+        workers: Optional[int] = None,
+        threads: bool = False,
+        dirs_per_task: int = 32,
+        art_dirs: Optional[list[str]] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> Iterator[FullArticle]:
+        """FullArticles of all article dirs in path, sorted by art_id.
+
+        fields: read only those Article fields (and codec.ALWAYS_READ),
+            e.g. ["title", "text"]; the others are read when accessed
+            through Article.get_field()
+
+        The dirs are read and decoded in `workers` processes (threads if
+        `threads`), dirs_per_task at a time; None is one per core, 0 reads
+        them here. Only a few tasks per worker are in flight at once, so
+        memory stays bounded however big the corpus.
+        """
+        art_dirs = art_dirs if art_dirs is not None else UPReader.article_dirs(path)
+        fields = projection(fields)
+        tasks = [
+            art_dirs[i : i + dirs_per_task] for i in range(0, len(art_dirs), dirs_per_task)
+        ]
+        workers = os.cpu_count() if workers is None else workers
+        if workers <= 1:
+            for task in tasks:
+                yield from _read_article_dirs(task, fields)
+            return
+
+        executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+        with executor(max_workers=workers) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(_read_article_dirs, task, fields))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    @staticmethod
+    def full_article(art_id: int, articles: dict[str, Article]) -> FullArticle:
+        """FullArticle from the translations of an article, keyed by lang."""
+        fa_tags = set()
+        last_date_published = None
+        for article in articles.values():
+            # NB - same article in diff languages can have diff tags!
+            fa_tags = fa_tags.union(article.tags)
+            last_date_published = article.date
+        return FullArticle(
+            articles=articles,
+            art_id=int(art_id),
+            date_published=last_date_published,
+            tags=list(fa_tags),
+        )
+
+    @staticmethod
+    def read_storage(
+        storage: ArticleStorage, fields: Optional[Iterable[str]] = None
+    ) -> Iterator[FullArticle]:
+        """Read all articles of any storage backend, see storage.py
+
+        fields: only those Article fields, see iter_dir()
+        """
+        for art_id, articles in storage.iter_articles(fields=projection(fields)):
+            yield UPReader.full_article(art_id, articles)
+
+    @staticmethod
+    def read_art_ids(
+        storage: ArticleStorage,
+        art_ids: Iterable[int],
+        fields: Optional[Iterable[str]] = None,
+    ) -> Iterator[FullArticle]:
+        """FullArticles of just these art_ids of storage (the ones with any
+        translation there), e.g. the delta of an incremental export."""
+        fields = projection(fields)
+        for art_id in art_ids:
+            articles = dict()
+            for lang in UPReader.LANGS:
+                art = storage.read(art_id, lang, fields=fields)
+                if art is not None:
+                    articles[lang] = art
+            if articles:
+                yield UPReader.full_article(art_id, articles)
+
+    @staticmethod
+    def read_compact(storage: ArticleStorage) -> CompactCorpus:
+        """All articles of storage in memory, compactly (see corpus.py)."""
+        return CompactCorpus.from_full_articles(UPReader.read_storage(storage))
+
+    @staticmethod
+    def read_dir_chunked(
+        path: Path, workers: Optional[int] = None, fields: Optional[Iterable[str]] = None
+    ) -> Iterator[FullArticle]:
+        """Read all articles in path, yielding FullArticles one by one."""
+        yield from UPReader.iter_dir(path, workers=workers, fields=fields)
+
+
+def _read_article_dirs(
+    art_dirs: list[str], fields: Optional[frozenset[str]] = None
+) -> list[FullArticle]:
+    """FullArticles of the article dirs with any articles, in UPReader.iter_dir
+    workers."""
+    fas = list()
+    if not art_dirs:
+        return fas
+    # All in the same corpus dir
+    storage = DirectoryStorage(os.path.dirname(art_dirs[0]))
+    for art_dir in art_dirs:
+        articles = dict()
+        with os.scandir(art_dir) as it:
+            for f in it:
+                lang = f.name.split("_")[0]
+                if not f.name.endswith(".json") or lang not in UPReader.LANGS:
+                    continue
+                try:
+                    articles[lang] = storage._read_article(
+                        storage.codec.read_article(f.path, fields=fields)
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to read {f.path} as article: {e}")
+        if articles:
+            fas.append(UPReader.full_article(os.path.basename(art_dir), articles))
+    return fas
 
 
 class UPToCSVExporter:
@@ -189,6 +322,7 @@ class UPToCSVExporter:
     # TODO https://www.pravda.com.ua/news/2023/08/10/7414962/ why few tags?
 
     FA_FIELDS = ['art_id', 'date_published', 'tags']
+    # Article fields exported, the only ones read from the corpus
     FIELDS = ["uri", "title", "author_name", "text", "tags", "tags_full"]
 
     def fa_to_row(fa: FullArticle, fields=FIELDS) -> dict:
@@ -221,9 +355,34 @@ class UPToCSVExporter:
                 row[fn] = fv_clean
         return row
 
+    def drop_articles(target_csv: Path, art_ids: Iterable[int]) -> int:
+        """Rewrite target_csv without the rows of art_ids, e.g. before
+        appending their new versions. Returns number of rows dropped."""
+        art_ids = {str(x) for x in art_ids}
+        tmp_csv = target_csv.with_name(target_csv.name + ".tmp")
+        num_dropped = 0
+        with open(target_csv, newline="") as src, open(tmp_csv, "w", newline="") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst, dialect="unix")
+            header = next(reader, None)
+            if header:
+                writer.writerow(header)
+                id_col = header.index("art_id")
+                for row in reader:
+                    if row[id_col] in art_ids:
+                        num_dropped += 1
+                        continue
+                    writer.writerow(row)
+        tmp_csv.replace(target_csv)
+        logger.info(f"Dropped {num_dropped} superseded articles from {str(target_csv)}")
+        return num_dropped
+
     def fas_to_csv(
-        fas: list[FullArticle] | Iterator[FullArticle], target_csv: Path
+        fas: list[FullArticle] | Iterator[FullArticle],
+        target_csv: Path,
+        append: bool = False,
     ) -> None:
+        """append: add the rows to target_csv if it exists already"""
         logger.info(f"Writing to CSV {str(target_csv)}")
         fieldnames = list()
         fieldnames.extend(UPToCSVExporter.FA_FIELDS)
@@ -231,20 +390,23 @@ class UPToCSVExporter:
             for fn in UPToCSVExporter.FIELDS:
                 fieldnames.append(f"{l}_{fn}")
 
-        with open(target_csv, "w", newline="") as csvfile:
+        write_header = not (append and target_csv.exists() and target_csv.stat().st_size)
+        with open(target_csv, "a" if append else "w", newline="") as csvfile:
             pwriter = csv.DictWriter(
                 #  csvfile, fieldnames=fieldnames, delimiter=" ", quotechar="|", quoting=csv.QUOTE_MINIMAL
                 csvfile, fieldnames=fieldnames, dialect="unix", 
             )
-            pwriter.writeheader()
+            if write_header:
+                pwriter.writeheader()
             # TODO tqdm?
+            i = -1
             for i,fa in enumerate(fas):
                 #  first = fas[0] if isinstance(fas, list) else next(fas)
                 row = UPToCSVExporter.fa_to_row(fa)
                 pwriter.writerow(row)
                 if i%50==0:
                     logger.info(f"{i} lines written")
-            logger.info(f"Finished writing {i} articles to {str(target_csv)} ")
+            logger.info(f"Finished writing {i + 1} articles to {str(target_csv)} ")
         pass
 
 
@@ -253,9 +415,58 @@ def run(args):
 
     ur = UPReader(input_dir=args.input)
     #  ur.read()
-    chunks = ur.read_dir_chunked(args.input)
-    target_file = get_file_or_temp(Path(args.output))
-    r = UPToCSVExporter.fas_to_csv(fas=chunks, target_csv=target_file)
+    # Dir per article or shards, whatever is there
+    storage = open_storage(args.input)
+    parquet = args.format == "parquet"
+    fields = UPToParquetExporter.FIELDS if parquet else UPToCSVExporter.FIELDS
+    # Parquet is always a dir of part files, one per export run (and partition)
+    target = make_path_ok(args.output) if parquet else get_file_or_temp(Path(args.output))
+
+    # What's already in the output, see export_manifest.py
+    manifest = ExportManifest(
+        args.manifest if args.manifest else ExportManifest.path_for(target)
+    )
+    run_num = manifest.next_run()
+    if not args.incremental:
+        manifest.reset()
+        if parquet:
+            UPToParquetExporter.clear(target)
+    elif parquet and target.is_file():
+        raise ValueError(
+            f"{target} is a single parquet file, rewrite it (without --incremental) first"
+        )
+    art_ids, manifest_rows = manifest.delta(storage)
+
+    if args.incremental:
+        # Old rows of the articles exported again, replaced by the new ones
+        superseded = manifest.runs_of(art_ids)
+        if parquet:
+            for run, ids in superseded.items():
+                UPToParquetExporter.drop_articles(
+                    target, part=UPToParquetExporter.part_name(run), art_ids=ids
+                )
+        elif superseded and target.exists():
+            UPToCSVExporter.drop_articles(target, set().union(*superseded.values()))
+        chunks = ur.read_art_ids(storage, art_ids, fields=fields)
+    elif isinstance(storage, DirectoryStorage):
+        chunks = ur.iter_dir(storage.target_dir, workers=args.workers, fields=fields)
+    else:
+        chunks = ur.read_storage(storage, fields=fields)
+
+    if parquet:
+        UPToParquetExporter.fas_to_parquet(
+            fas=chunks,
+            target=target,
+            partition_by=args.partition_by,
+            row_group_size=args.row_group_size,
+            part=UPToParquetExporter.part_name(run_num),
+        )
+    else:
+        UPToCSVExporter.fas_to_csv(
+            fas=chunks, target_csv=target, append=args.incremental
+        )
+    manifest.record(manifest_rows, output=target, run=run_num, art_ids=art_ids)
+    manifest.close()
 
 
 def parse_args() -> argparse.Namespace:
@@ -272,6 +483,43 @@ def parse_args() -> argparse.Namespace:
         help="Output for the dataset (%(default)s)",
         type=Path,
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Processes reading the article dirs (one per core), 0 reads them in the main one",
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Output format (%(default)s)",
+    )
+    parser.add_argument(
+        "--partition_by",
+        choices=PARTITIONS,
+        default=None,
+        help="Parquet only: write a dir of partitions by year (or year and month) published",
+    )
+    parser.add_argument(
+        "--row_group_size",
+        type=int,
+        default=UPToParquetExporter.ROW_GROUP_SIZE,
+        help="Parquet only: articles per row group (%(default)s)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only add the articles new or changed since the last export to the output",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        help="Manifest of what was exported (next to / in the output)",
+    )
     parser.add_argument("--pdb", "-P", help="Run PDB on exception", action="store_true")
     parser.add_argument(
         "-q",
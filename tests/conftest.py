@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+from tenacity import stop_after_attempt, wait_none
+
+PAGES_DIR = Path(__file__).parent / "assets" / "pages"
+
+SITEMAP_LOCS = [
+    "https://www.pravda.com.ua/news/2023/11/13/7428464/",
+    "https://www.pravda.com.ua/eng/news/2023/11/13/7428464/",
+    "https://www.pravda.com.ua/rus/news/2023/11/14/7428472/",
+    "https://www.pravda.com.ua/articles/2023/11/14/7428480/",
+    "https://www.pravda.com.ua/news/2023/11/20/7428999/",
+]
+
+# In the latest sitemaps: one new article and one from SITEMAP_LOCS
+LATEST_LOCS = [
+    "https://www.pravda.com.ua/news/2023/12/01/7431000/",
+    "https://www.pravda.com.ua/eng/news/2023/12/01/7431000/",
+    "https://www.pravda.com.ua/news/2023/11/20/7428999/",
+]
+
+
+def make_sitemap(locs: list[str] = SITEMAP_LOCS) -> bytes:
+    urls = "".join(f"<url><loc>{x}</loc></url>" for x in locs)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f"{urls}</urlset>"
+    ).encode()
+
+
+class FakeUPHandler(BaseHTTPRequestHandler):
+    """Serves the saved pages in assets/pages instead of www.pravda.com.ua
+
+    - /eng/... and /news/... -> a normal article
+    - /rus/... -> 404 status code
+    - /.../404page/ -> 200 with a UP 'error 404' page
+    - /forbidden/... -> 403
+    - /error500/... -> 500, /busy/... -> 503
+    - /sitemap/sitemap-2023-11.xml.gz -> gzipped sitemap with SITEMAP_LOCS
+    - /sitemap/sitemap-news.xml -> sitemap with LATEST_LOCS
+
+    200s have an ETag, If-None-Match with it gets a 304.
+    """
+
+    # keep-alive
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests_log.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+        if self.path == "/sitemap/sitemap-news.xml":
+            return self._send(200, make_sitemap(LATEST_LOCS), "text/xml")
+        if self.path.startswith("/sitemap/"):
+            if "2023-11" not in self.path:
+                return self._send(404, b"not found")
+            return self._send(200, gzip.compress(make_sitemap()), "application/x-gzip")
+        if self.path.startswith("/forbidden"):
+            return self._send(403, b"nope")
+        if self.path.startswith("/error500"):
+            return self._send(500, b"oops")
+        if self.path.startswith("/busy"):
+            return self._send(503, b"later")
+        if self.path.startswith("/rus/"):
+            return self._send(404, b"not found")
+        if "404page" in self.path:
+            return self._send(200, (PAGES_DIR / "article_404.html").read_bytes())
+        if "tags" in self.path:
+            return self._send(200, (PAGES_DIR / "tags.html").read_bytes())
+        return self._send(200, (PAGES_DIR / "article.html").read_bytes())
+
+    def _send(self, code: int, body: bytes, content_type="text/html; charset=utf-8"):
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if code == 200 and self.headers.get("if-none-match") == etag:
+            self.server.not_modified += 1
+            code, body = 304, b""
+        self.send_response(code)
+        if code in (200, 304):
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_up():
+    """Local HTTP server with UP-like pages, yields its base URI"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeUPHandler)
+    server.requests_log = list()
+    # One per TCP connection
+    server.client_ports = set()
+    server.not_modified = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    server.base = base
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_sitemaps(fake_up, monkeypatch):
+    """Archive sitemaps requested from fake_up, yields it"""
+    from up_crawler.get_uris import UPSitemapCrawler
+
+    monkeypatch.setattr(
+        UPSitemapCrawler,
+        "SITEMAP_MONTH_ARCHIVE_URI",
+        fake_up.base + "/sitemap/sitemap-{year}-{month:02d}.xml.gz",
+    )
+    yield fake_up
+
+
+@pytest.fixture
+def no_wait():
+    """Randomization params that don't wait between requests"""
+    from up_crawler.randomization import RandomizationParams
+
+    return RandomizationParams(max_wait_sec=0, wait_eps=0)
+
+
+@pytest.fixture
+def crawler(tmp_path, no_wait):
+    """UPCrawler without an input csv, downloading to tmp_path"""
+    from up_crawler.bs_oop import UPCrawler
+    from up_crawler.http_session import UPSession
+
+    return UPCrawler(
+        input_csv=None,
+        target_dir=tmp_path,
+        randomization_params=no_wait,
+        session=UPSession(),
+    )
+
+
+# Attempts per request with fast_retries
+FAST_RETRIES = 2
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    """Article requests retried FAST_RETRIES times, without waiting"""
+    from up_crawler.async_crawler import AsyncArticleFetcher
+    from up_crawler.bs_oop import UPCrawler
+
+    for f in [UPCrawler.do_basic_uri_ops_when_crawling, AsyncArticleFetcher.fetch]:
+        monkeypatch.setattr(f.retry, "stop", stop_after_attempt(FAST_RETRIES))
+        monkeypatch.setattr(f.retry, "wait", wait_none())
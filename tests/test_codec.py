@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from up_crawler.codec import Codec, FastCodec, WizardCodec, get_codec, projection
+from up_crawler.data_structures import Article, FullArticle, Language, TagsMapping
+from up_crawler.up_reader import UPReader
+
+from tests.test_storage import ARTICLES, _article
+
+fast = FastCodec()
+wizard = WizardCodec()
+
+TAGS = TagsMapping(
+    tags_mapping={
+        "stavka": {
+            Language.UA: ("Ставка", "/tags/stavka/"),
+            Language.EN: None,
+        }
+    }
+)
+
+
+@pytest.mark.parametrize("art", ARTICLES + [Article("u", "t", "a", [])])
+@pytest.mark.parametrize("indent", [False, True])
+def test_same_articles_as_wizard(art, indent):
+    for written in (fast.dumps_article(art, indent), wizard.dumps_article(art, indent)):
+        assert fast.loads_article(written) == wizard.loads_article(written)
+    assert fast.loads_article(fast.dumps_article(art)) == wizard.loads_article(
+        wizard.dumps_article(art)
+    )
+
+
+def test_snake_case_and_numpy():
+    art = _article(7428464, "eng")
+    art.art_id = np.int64(7428464)
+    written = fast.dumps_article(art)
+    assert b'"artId":7428464' in written
+    assert fast.loads_article(written).art_id == "7428464"
+
+    snake = b'{"uri": "u", "title": "t", "author_name": "a", "text": [], "art_id": 5}'
+    assert fast.loads_article(snake) == wizard.loads_article(snake)
+
+
+def test_full_article_and_tags_mapping():
+    fa = UPReader.full_article(1, {"ukr": ARTICLES[0], "eng": ARTICLES[1]})
+    for written in (fast.dumps_full_article(fa), wizard.dumps_full_article(fa)):
+        assert fast.loads_full_article(written) == wizard.loads_full_article(written)
+
+    for tm in (TAGS, TagsMapping()):
+        for written in (fast.dumps_tags_mapping(tm), wizard.dumps_tags_mapping(tm)):
+            assert fast.loads_tags_mapping(written) == wizard.loads_tags_mapping(written)
+    assert fast.loads_tags_mapping(fast.dumps_tags_mapping(TAGS)) == TAGS
+
+
+def test_get_codec():
+    assert get_codec() is get_codec("fast")
+    assert get_codec(wizard) is wizard
+    with pytest.raises(ValueError):
+        get_codec("pickle")
+
+
+@pytest.mark.parametrize("codec", [fast, wizard])
+def test_projection(codec):
+    written = codec.dumps_article(ARTICLES[0])
+    art = codec.loads_article(written, fields=projection(["title"]))
+    assert art.title == ARTICLES[0].title
+    assert art.tags == ARTICLES[0].tags and art.lang == Language.UA
+    assert art.text is None and art.tags_full is None
+    # Nowhere to read the rest from
+    with pytest.raises(ValueError):
+        art.get_field("text")
+    assert projection(None) is None
+    with pytest.raises(ValueError):
+        projection(["title", "body"])
+
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        Codec()
+
+    class ArticlesOnly(Codec):
+        dumps_article = loads_article = lambda self, x: x
+
+    with pytest.raises(TypeError, match="loads_tags_mapping"):
+        ArticlesOnly()
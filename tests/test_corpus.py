@@ -0,0 +1,36 @@
+import dataclasses
+
+from up_crawler.corpus import CompactCorpus
+from up_crawler.storage import DirectoryStorage
+from up_crawler.up_reader import UPReader
+
+from tests.test_storage import ARTICLES
+
+
+def test_compact_corpus(tmp_path):
+    storage = DirectoryStorage(tmp_path)
+    for art in ARTICLES:
+        storage.write(art)
+    fas = list(UPReader.read_storage(storage))
+    corpus = UPReader.read_compact(storage)
+
+    assert len(corpus) == 3
+    assert 2 in corpus and 4 not in corpus
+    # Same FullArticles, just without the raw html
+    for fa, compact_fa in zip(fas, corpus):
+        for art in fa.articles.values():
+            art.raw_html_ref = None
+        assert compact_fa == fa
+    assert corpus.get(3) == fas[2]
+
+    # Same tags and authors are the same objects
+    arts = [a for x in corpus._articles for a in x.articles]
+    assert arts[0].tags_full is arts[-1].tags_full
+    assert arts[0].author_name is arts[-1].author_name
+
+
+def test_empty_text():
+    art = dataclasses.replace(ARTICLES[0], text=[])
+    fa = UPReader.full_article(1, {"ukr": art})
+    corpus = CompactCorpus.from_full_articles([fa])
+    assert corpus[0].articles["ukr"].text == []
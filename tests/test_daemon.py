@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from up_crawler.daemon import UPDaemon
+
+NOW = datetime(2023, 11, 30)
+
+
+@pytest.fixture
+def daemon(fake_sitemaps, crawler, monkeypatch):
+    # The csvs planned, instead of crawling them
+    crawler.planned = list()
+    monkeypatch.setattr(
+        crawler, "run", lambda input_csv: crawler.planned.append(pd.read_csv(input_csv))
+    )
+    return UPDaemon(crawler, start=datetime(2023, 11, 1))
+
+
+def test_plans_only_the_gap(daemon):
+    assert daemon.watermark.load() is None
+    assert daemon.run_once(now=NOW)
+    assert list(daemon.crawler.planned[0].id) == [7428464, 7428464, 7428472, 7428999]
+    # The newest day is planned again
+    assert daemon.watermark.load() == datetime(2023, 11, 19)
+
+    assert daemon.run_once(now=NOW)
+    assert list(daemon.crawler.planned[1].id) == [7428999]
+    assert daemon.watermark.load() == datetime(2023, 11, 19)
+
+
+def test_failed_run_keeps_mark(daemon, monkeypatch):
+    def fail(input_csv):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(daemon.crawler, "run", fail)
+    with pytest.raises(ConnectionError):
+        daemon.run_once(now=NOW)
+    assert daemon.watermark.load() is None
+    # Logged, the daemon goes on
+    daemon.run(interval=0, max_runs=2)
+    assert daemon.watermark.load() is None
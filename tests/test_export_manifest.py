@@ -0,0 +1,181 @@
+import argparse
+import csv
+import os
+
+import pytest
+
+from up_crawler import up_reader
+from up_crawler.data_structures import Language
+from up_crawler.export_manifest import ExportManifest
+from up_crawler.storage import open_storage
+
+from tests.test_storage import ARTICLES, _article
+
+
+def _convert(storage_dir, output, incremental=True, format="csv"):
+    up_reader.run(
+        argparse.Namespace(
+            input=storage_dir,
+            output=output,
+            workers=0,
+            format=format,
+            partition_by=None,
+            row_group_size=1000,
+            incremental=incremental,
+            manifest=None,
+        )
+    )
+
+
+def _csv_ids(path):
+    with open(path) as f:
+        return [int(x["art_id"]) for x in csv.DictReader(f)]
+
+
+@pytest.mark.parametrize("kind", ["dirs", "shards"])
+def test_delta(tmp_path, kind):
+    storage = open_storage(tmp_path / "corpus", kind=kind)
+    for art in ARTICLES:
+        storage.write(art)
+    manifest = ExportManifest(tmp_path / "manifest.sqlite")
+
+    art_ids, rows = manifest.delta(storage)
+    assert art_ids == [1, 2, 3] and len(rows) == 4
+    manifest.record(rows, output="out.csv", run=manifest.next_run())
+    assert manifest.delta(storage) == ([], [])
+    assert manifest.next_run() == 2
+
+    # Not hashed when nothing was exported yet, so rewritten it's exported again
+    storage.write(ARTICLES[3])
+    if kind == "dirs":
+        path = next((tmp_path / "corpus" / "3").glob("*.json"))
+        os.utime(path, ns=(1, 1))
+    art_ids, rows = manifest.delta(storage)
+    assert art_ids == [3] and len(rows) == 1
+    manifest.record(rows, output="out.csv", run=2, art_ids=art_ids)
+    assert manifest.runs_of([1, 3]) == {1: {1}, 2: {3}}
+
+    # Rewritten unchanged again: only the signature is updated
+    storage.write(ARTICLES[3])
+    if kind == "dirs":
+        os.utime(path, ns=(2, 2))
+    art_ids, rows = manifest.delta(storage)
+    assert art_ids == [] and len(rows) == 1
+    manifest.record(rows, output="out.csv", run=3, art_ids=art_ids)
+    assert manifest.runs_of([3]) == {2: {3}}
+    assert manifest.delta(storage) == ([], [])
+
+    # New translation, changed article
+    storage.write(_article(2, "eng"))
+    changed = _article(3, "rus")
+    changed.title = "New title"
+    storage.write(changed)
+    assert manifest.delta(storage)[0] == [2, 3]
+
+
+def test_incremental_csv(tmp_path):
+    storage = open_storage(tmp_path / "corpus", kind="dirs")
+    for art in ARTICLES[:2]:
+        storage.write(art)
+    out = tmp_path / "out.csv"
+
+    _convert(tmp_path / "corpus", out, incremental=False)
+    assert _csv_ids(out) == [1]
+    assert ExportManifest.path_for(out).exists()
+
+    for art in ARTICLES[2:]:
+        storage.write(art)
+    _convert(tmp_path / "corpus", out)
+    assert _csv_ids(out) == [1, 2, 3]
+    # Nothing new
+    _convert(tmp_path / "corpus", out)
+    assert _csv_ids(out) == [1, 2, 3]
+
+    # A full export starts over
+    _convert(tmp_path / "corpus", out, incremental=False)
+    assert _csv_ids(out) == [1, 2, 3]
+
+
+def test_incremental_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    storage = open_storage(tmp_path / "corpus", kind="shards")
+    storage.write(ARTICLES[0])
+    out = tmp_path / "out"
+
+    _convert(tmp_path / "corpus", out, format="parquet")
+    storage.write(ARTICLES[2])
+    _convert(tmp_path / "corpus", out, format="parquet")
+
+    assert sorted(x.name for x in out.glob("*.parquet")) == [
+        "part-1.parquet",
+        "part-2.parquet",
+    ]
+    assert pq.read_table(out).column("art_id").to_pylist() == [1, 2]
+
+
+def test_full_then_incremental_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    storage = open_storage(tmp_path / "corpus", kind="shards")
+    storage.write(ARTICLES[0])
+    out = tmp_path / "out.parquet"
+
+    _convert(tmp_path / "corpus", out, incremental=False, format="parquet")
+    storage.write(ARTICLES[2])
+    _convert(tmp_path / "corpus", out, format="parquet")
+
+    assert out.is_dir()
+    assert pq.read_table(out).column("art_id").to_pylist() == [1, 2]
+
+
+def test_incremental_then_full_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    storage = open_storage(tmp_path / "corpus", kind="shards")
+    storage.write(ARTICLES[0])
+    out = tmp_path / "out"
+
+    _convert(tmp_path / "corpus", out, format="parquet")
+    storage.write(ARTICLES[2])
+    _convert(tmp_path / "corpus", out, format="parquet")
+    # The old parts are replaced by the ones of the full export
+    _convert(tmp_path / "corpus", out, incremental=False, format="parquet")
+
+    assert [x.name for x in out.glob("*.parquet")] == ["part-3.parquet"]
+    assert sorted(pq.read_table(out).column("art_id").to_pylist()) == [1, 2]
+
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+def test_incremental_changed_article(tmp_path, format):
+    if format == "parquet":
+        pytest.importorskip("pyarrow.parquet")
+    storage = open_storage(tmp_path / "corpus", kind="shards")
+    for art in ARTICLES[:3]:
+        storage.write(art)
+    out = tmp_path / ("out" if format == "parquet" else "out.csv")
+    _convert(tmp_path / "corpus", out, incremental=False, format=format)
+
+    # A new translation of 2, and 1 changed
+    storage.write(_article(2, "eng"))
+    changed = _article(1, "eng")
+    changed.title = "New title"
+    storage.write(changed)
+    _convert(tmp_path / "corpus", out, format=format)
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(out)
+        assert sorted(table.column("art_id").to_pylist()) == [1, 2]
+        rows = {x["art_id"]: x for x in table.to_pylist()}
+        # Part 1 of the full export had both, rewritten empty
+        assert [x.name for x in out.glob("*.parquet")] == ["part-2.parquet"]
+    else:
+        with open(out) as f:
+            # Same column names as fas_to_csv
+            rows = {
+                int(x["art_id"]): {f"{l.value}_title": x[f"{l}_title"] for l in Language}
+                for x in csv.DictReader(f)
+            }
+        assert sorted(_csv_ids(out)) == [1, 2]
+    assert rows[1]["eng_title"] == "New title"
+    assert rows[1]["ukr_title"] == "Title 1 ukr"
+    assert rows[2]["eng_title"] == "Title 2 eng"
@@ -0,0 +1,230 @@
+import time
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.consts import FRONTIER_FN
+from up_crawler.data_structures import Language, TagsMapping
+from up_crawler.frontier import CrawlFrontier
+from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.http_session import UPSession
+from up_crawler.storage import open_storage
+
+
+
+def _uris_csv(path, base="https://www.pravda.com.ua") -> None:
+    rows = [
+        ("/news/2023/11/13/7428464/", "ukr", 7428464),
+        ("/eng/news/2023/11/13/7428464/", "eng", 7428464),
+        ("/rus/news/2023/11/13/7428464/", "rus", 7428464),
+        ("/news/2023/11/13/404page/", "ukr", 7428465),
+        ("/news/2023/11/14/7428466/", "ukr", 7428466),
+    ]
+    pd.DataFrame(
+        [
+            {"uri": base + p, "lang": lang, "id": art_id, "date": "2023-11-13"}
+            for p, lang, art_id in rows
+        ]
+    ).to_csv(path, index=False)
+
+
+def test_import_once(tmp_path):
+    _uris_csv(tmp_path / "uris.csv")
+    fr = CrawlFrontier(tmp_path / FRONTIER_FN)
+    assert fr.import_csv(tmp_path / "uris.csv") == 5
+    assert fr.import_csv(tmp_path / "uris.csv") == 0
+    assert fr.counts() == {"pending": 5}
+    assert fr.num_articles() == 3
+
+
+def test_import_after_reconcile(tmp_path):
+    """URIs of a later csv downloaded before the frontier existed are done"""
+    _uris_csv(tmp_path / "uris.csv")
+    fr = CrawlFrontier(tmp_path / FRONTIER_FN)
+    fr.reconcile(is_downloaded=lambda art_id, lang, uri: False)
+    downloaded = "https://www.pravda.com.ua/news/2023/11/14/7428466/"
+    assert fr.import_csv(
+        tmp_path / "uris.csv", is_downloaded=lambda art_id, lang, uri: uri == downloaded
+    ) == 5
+    assert fr.counts() == {"pending": 4, "done": 1}
+
+
+def test_leases_dont_overlap(tmp_path):
+    _uris_csv(tmp_path / "uris.csv")
+    fr1 = CrawlFrontier(tmp_path / FRONTIER_FN, worker="w1")
+    fr2 = CrawlFrontier(tmp_path / FRONTIER_FN, worker="w2")
+    fr1.import_csv(tmp_path / "uris.csv")
+
+    groups1 = fr1.lease(num_articles=2)
+    groups2 = fr2.lease(num_articles=2)
+    assert [x[0] for x in groups1] == [7428464, 7428465]
+    assert [x[0] for x in groups2] == [7428466]
+    assert len(groups1[0][1]) == 3
+    assert not fr1.lease()
+
+    # Unfinished leases go back to pending
+    fr1.mark(groups1[1][1].uri.iloc[0], CrawlFrontier.NOT_FOUND)
+    fr1.release()
+    assert fr1.counts() == {"pending": 3, "in_flight": 1, "404": 1}
+
+
+def test_failed_retried_then_given_up(tmp_path):
+    _uris_csv(tmp_path / "uris.csv")
+    fr = CrawlFrontier(tmp_path / FRONTIER_FN)
+    fr.import_csv(tmp_path / "uris.csv")
+    uri = "https://www.pravda.com.ua/news/2023/11/14/7428466/"
+    for i in range(CrawlFrontier.MAX_ATTEMPTS):
+        assert uri in [u for _, g in fr.lease(num_articles=3) for u in g.uri]
+        # Finished only once it's given up on
+        assert fr.mark(uri, CrawlFrontier.FAILED) == (i == CrawlFrontier.MAX_ATTEMPTS - 1)
+        fr.release()
+    assert fr.counts()["failed"] == 1
+
+
+def test_expired_lease(tmp_path, monkeypatch):
+    _uris_csv(tmp_path / "uris.csv")
+    fr = CrawlFrontier(tmp_path / FRONTIER_FN, worker="dead")
+    fr.import_csv(tmp_path / "uris.csv")
+    monkeypatch.setattr(CrawlFrontier, "LEASE_SEC", -1)
+    assert len(fr.lease(num_articles=3)) == 3
+    fr2 = CrawlFrontier(tmp_path / FRONTIER_FN, worker="alive")
+    assert len(fr2.lease(num_articles=3)) == 3
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_crawler_resumes_from_frontier(fake_up, tmp_path, concurrency, no_wait):
+    _uris_csv(tmp_path / "uris.csv", base=fake_up.base)
+    tm_file = tmp_path / "tm.json"
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    out = tmp_path / "out"
+
+    # Downloaded before the frontier existed
+    out.mkdir()
+    (out / "7428466").mkdir()
+    UPCrawler._article_path(
+        out / "7428466", lang="ukr", uri=fake_up.base + "/news/2023/11/14/7428466/"
+    ).write_text("{}")
+
+    def crawl():
+        UPCrawler(
+            input_csv=tmp_path / "uris.csv",
+            target_dir=out,
+            tags_mapping_file=tm_file,
+            randomization_params=no_wait,
+            concurrency=concurrency,
+        ).run()
+
+    crawl()
+    assert CrawlFrontier(out / FRONTIER_FN).counts() == {"done": 3, "404": 2}
+    assert len(list((out / "7428464").iterdir())) == 2
+
+    # Resuming with a fresh tags mapping fills it from the tag index
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    num_requests = len(fake_up.requests_log)
+    crawl()
+    assert len(fake_up.requests_log) == num_requests
+    tm = TagsMapping.from_json_file(tm_file).tags_mapping
+    assert tm["stavka"][Language.UA] == ("Ставка", "/tags/stavka/")
+    assert Language.EN in tm["stavka"]
+
+
+def test_tag_index(tmp_path):
+    _uris_csv(tmp_path / "uris.csv")
+    fr = CrawlFrontier(tmp_path / FRONTIER_FN)
+    fr.import_csv(tmp_path / "uris.csv")
+    (_, group), *_ = fr.lease(num_articles=1)
+    tags = [("stavka", "Ставка", "/tags/stavka/")]
+    for uri in group.uri:
+        fr.mark(uri, CrawlFrontier.DONE, tags=tags)
+    assert fr.tags() == {"ukr": tags, "eng": tags, "rus": tags}
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_crawler_streams_uri_batches(fake_up, tmp_path, concurrency, no_wait):
+    _uris_csv(tmp_path / "uris.csv", base=fake_up.base)
+    df = pd.read_csv(tmp_path / "uris.csv")
+    tm_file = tmp_path / "tm.json"
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    out = tmp_path / "out"
+
+    def batches():
+        yield df[df.id == 7428464]
+        # The first batch is downloaded before the next one is found
+        for _ in range(100):
+            if fake_up.requests_log:
+                break
+            time.sleep(0.05)
+        assert fake_up.requests_log
+        yield df[df.id != 7428464]
+
+    UPCrawler(
+        input_csv=None,
+        target_dir=out,
+        tags_mapping_file=tm_file,
+        randomization_params=no_wait,
+        concurrency=concurrency,
+    ).run(uri_batches=batches())
+    assert CrawlFrontier(out / FRONTIER_FN).counts() == {"done": 3, "404": 2}
+
+
+def test_streamed_sitemap_dates(fake_up, fake_sitemaps, tmp_path, no_wait):
+    tm_file = tmp_path / "tm.json"
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    out = tmp_path / "out"
+    # Straight from the sitemap (dates as datetime64), pointing to fake_up
+    batches = (
+        df.assign(uri=df.uri.str.replace("https://www.pravda.com.ua", fake_up.base))
+        for df in UPSitemapCrawler(session=UPSession()).iter_article_uris(
+            datetime(2023, 11, 1), datetime(2023, 11, 30)
+        )
+    )
+    UPCrawler(
+        input_csv=None,
+        target_dir=out,
+        tags_mapping_file=tm_file,
+        randomization_params=no_wait,
+    ).run(uri_batches=batches)
+
+    storage = open_storage(out)
+    # Same as from the csvs of the sitemaps
+    assert storage.read(7428464, "ukr").date == "2023-11-13"
+    assert storage.read(7428464, "eng").date == "2023-11-13"
+
+
+def test_stream_stops_on_batch_error(crawler):
+    def batches():
+        raise ConnectionError("sitemap down")
+        yield
+
+    crawler.tags = TagsMapping(tags_mapping=dict())
+    with pytest.raises(ConnectionError):
+        crawler.run(uri_batches=batches())
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_server_error_is_failed_not_404(
+    fake_up, tmp_path, fast_retries, concurrency, no_wait
+):
+    uris = tmp_path / "uris.csv"
+    _uris_csv(uris, base=fake_up.base)
+    df = pd.read_csv(uris)
+    df.loc[df.id == 7428466, "uri"] = fake_up.base + "/error500/news/2023/11/14/7428466/"
+    df.to_csv(uris, index=False)
+    tm_file = tmp_path / "tm.json"
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    UPCrawler(
+        input_csv=uris,
+        target_dir=tmp_path / "out",
+        tags_mapping_file=tm_file,
+        randomization_params=no_wait,
+        concurrency=concurrency,
+    ).run()
+    fr = CrawlFrontier(tmp_path / "out" / FRONTIER_FN)
+    # The 500 is retried (pending again if it failed after the last lease
+    # of the asyncio crawler), the real 404s aren't
+    counts = fr.counts()
+    assert counts.pop("failed", 0) + counts.pop("pending", 0) == 1
+    assert counts == {"done": 2, "404": 2}
@@ -0,0 +1,58 @@
+import pytest
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.consts import REGEX_PARAS_TO_SKIP
+from up_crawler.html_parsers import HTML_PARSERS, make_soup
+
+PAGES = Path(__file__).parent / "assets" / "pages"
+ARTICLE_PAGES = ["article.html", "article_eng.html"]
+
+
+def _reference_article(content: bytes):
+    """What the extractor returned with a full html.parser tree"""
+    soup = BeautifulSoup(content, "html.parser")
+    art = UPCrawler.parse_soup(soup, regex_paras_to_skip=REGEX_PARAS_TO_SKIP)
+    art.uri = "https://www.pravda.com.ua/news/"
+    return art
+
+
+@pytest.mark.parametrize("parser", HTML_PARSERS)
+@pytest.mark.parametrize("page", ARTICLE_PAGES)
+def test_parser_parity_articles(parser, page):
+    content = (PAGES / page).read_bytes()
+    art = UPCrawler.article_from_response(
+        "https://www.pravda.com.ua/news/",
+        content,
+        regex_paras_to_skip=REGEX_PARAS_TO_SKIP,
+        html_parser=parser,
+    )
+    assert art == _reference_article(content)
+
+
+@pytest.mark.parametrize("parser", HTML_PARSERS)
+def test_parser_parity_tags_and_404(parser):
+    content = (PAGES / "tags.html").read_bytes()
+    reference = UPCrawler.tags_from_soup(BeautifulSoup(content, "html.parser"))
+    assert UPCrawler.tags_from_soup(make_soup(content, parser=parser)) == reference
+
+    content_404 = (PAGES / "article_404.html").read_bytes()
+    assert not UPCrawler.article_from_response(
+        "https://www.pravda.com.ua/news/", content_404, html_parser=parser
+    )
+
+
+@pytest.mark.parametrize("parser", HTML_PARSERS)
+def test_partial_soup_is_smaller(parser):
+    content = (PAGES / "article_eng.html").read_bytes()
+    partial = make_soup(content, parser=parser)
+    full = make_soup(content, parser=parser, partial=False)
+    assert not partial.find_all("script")
+    assert len(partial.find_all(True)) < len(full.find_all(True))
+
+
+def test_unknown_parser():
+    with pytest.raises(ValueError):
+        make_soup(b"<html></html>", parser="selectolax")
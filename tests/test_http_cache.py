@@ -0,0 +1,122 @@
+import asyncio
+
+from up_crawler.async_crawler import AsyncArticleFetcher
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.http_cache import HTTPCache
+from up_crawler.http_session import UPSession
+
+
+def test_cache_store_lookup(tmp_path):
+    cache = HTTPCache(tmp_path)
+    assert cache.lookup("https://x/1") is None
+    cache.store("https://x/1", b"body", headers={"etag": '"e1"'}, encoding="utf-8")
+    entry = cache.lookup("https://x/1")
+    assert entry.etag == '"e1"'
+    assert entry.conditional_headers() == {"if-none-match": '"e1"'}
+    assert cache.read(entry).content == b"body"
+
+    # persisted between instances
+    cache.close()
+    assert HTTPCache(tmp_path).lookup("https://x/1").size == 4
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = HTTPCache(tmp_path, max_size_mb=2.5 / 1024)
+    kb = b"x" * 1024
+    cache.store("https://x/1", kb)
+    cache.store("https://x/2", kb)
+    # 1 is now more recently used than 2
+    cache.read(cache.lookup("https://x/1"))
+    cache.store("https://x/3", kb)
+    assert cache.lookup("https://x/2") is None
+    assert cache.lookup("https://x/1") is not None
+    assert cache.lookup("https://x/3") is not None
+    assert cache.total_size() <= 2.5 * 1024
+
+
+def test_session_revalidates(fake_up, tmp_path):
+    session = UPSession(cache=HTTPCache(tmp_path))
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    first = session.get(uri)
+    second = session.get(uri)
+    assert len(fake_up.requests_log) == 2
+    assert fake_up.not_modified == 1
+    assert second.status_code == 200
+    assert second.from_cache
+    assert second.content == first.content
+
+
+def test_session_immutable(fake_up, tmp_path):
+    session = UPSession(cache=HTTPCache(tmp_path))
+    uri = fake_up.base + "/sitemap/sitemap-2023-11.xml.gz"
+    first = session.get(uri, immutable=True)
+    second = session.get(uri, immutable=True)
+    assert len(fake_up.requests_log) == 1
+    assert second.content == first.content
+    assert session.cache.hits == 1
+
+
+def _evict_after_lookup(session, monkeypatch):
+    """Cache entries evicted right after cache_lookup() found them"""
+    lookup = session.cache_lookup
+
+    def evicting_lookup(uri):
+        res = lookup(uri)
+        session.cache.delete(uri)
+        return res
+
+    monkeypatch.setattr(session, "cache_lookup", evicting_lookup)
+
+
+def _async_fetch(session, uri, randomization_params, tmp_path):
+    f = AsyncArticleFetcher(
+        target_dir=tmp_path, randomization_params=randomization_params, session=session
+    )
+
+    async def fetch():
+        # As in AsyncArticleFetcher._run
+        f._semaphore = asyncio.Semaphore(1)
+        async with session.async_session() as s:
+            return await f.fetch(s, uri)
+
+    return asyncio.run(fetch())
+
+
+def test_session_evicted_304(fake_up, tmp_path, monkeypatch):
+    session = UPSession(cache=HTTPCache(tmp_path))
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    first = session.get(uri)
+    _evict_after_lookup(session, monkeypatch)
+    second = session.get(uri)
+    # The 304 had nothing to revalidate anymore, the page is asked again
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert fake_up.not_modified == 1
+    assert len(fake_up.requests_log) == 3
+
+
+def test_async_fetch_evicted_304(fake_up, tmp_path, monkeypatch, no_wait):
+    session = UPSession(cache=HTTPCache(tmp_path / "cache"))
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    first = session.get(uri)
+    _evict_after_lookup(session, monkeypatch)
+    content, _ = _async_fetch(session, uri, no_wait, tmp_path)
+    assert content == first.content
+    assert fake_up.not_modified == 1
+
+
+def test_cache_hit_skips_slot(fake_up, tmp_path, monkeypatch, no_wait):
+    session = UPSession(cache=HTTPCache(tmp_path / "cache"))
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    session.get(uri, immutable=True)
+
+    def slot(uri):
+        raise AssertionError(f"Waited to request {uri}")
+
+    monkeypatch.setattr(no_wait, "slot", slot)
+    monkeypatch.setattr(no_wait, "async_slot", slot)
+    assert UPCrawler.do_basic_uri_ops_when_crawling(
+        uri, randomization_params=no_wait, session=session
+    )
+    assert _async_fetch(session, uri, no_wait, tmp_path)
+    assert len(fake_up.requests_log) == 1
@@ -0,0 +1,66 @@
+import pickle
+import re
+
+from up_crawler.consts import REGEX_PARAS_TO_SKIP
+from up_crawler.para_filter import ParagraphFilter
+
+PARAS = [
+    "Support UP or become our patron!",
+    "Ukrainska Pravda is the place... Follow us on Twitter, support us, or become our patron!",
+    "Читайте також: Увага, міни!",
+    "Читайте также: Внимание, мины!",
+    "Президент провів засідання Ставки.",
+    "Support\xa0UP",
+]
+
+
+def test_same_as_separate_regexes():
+    pf = ParagraphFilter(REGEX_PARAS_TO_SKIP)
+    for p in PARAS[:-1]:
+        expected = any(re.match(r, p, re.IGNORECASE) for r in REGEX_PARAS_TO_SKIP)
+        assert pf.skip(p) == expected
+
+
+def test_hits_first_rule_counted():
+    pf = ParagraphFilter(REGEX_PARAS_TO_SKIP)
+    for p in PARAS[:5]:
+        pf.skip(p)
+    assert pf.hits[".*Follow (us|Ukrainska Pravda) on Twitter.*"] == 1
+    assert pf.hits[".*Support UP.*"] == 1
+    assert pf.hits[".*(читайте|слухайте|слушайте) (також|также).*"] == 2
+    assert pf.unused_rules() == [".*become our patron.*"]
+    assert "Skipped 4 paragraphs" in pf.report()
+
+
+def test_no_rules():
+    pf = ParagraphFilter([])
+    assert not pf.skip("Support UP")
+
+
+def test_get_compiles_once():
+    pf = ParagraphFilter.get(REGEX_PARAS_TO_SKIP)
+    assert ParagraphFilter.get(list(REGEX_PARAS_TO_SKIP)) is pf
+    assert ParagraphFilter.get(pf) is pf
+    assert ParagraphFilter.get(None) is None
+
+
+def test_pickled_without_hits():
+    pf = ParagraphFilter(REGEX_PARAS_TO_SKIP)
+    pf.skip(PARAS[0])
+    pf2 = pickle.loads(pickle.dumps(pf))
+    assert not pf2.hits
+    assert pf2.skip(PARAS[0])
+    pf.add_hits(pf2.hits)
+    assert pf.hits[".*Support UP.*"] == 2
+
+
+def test_parse_soup_matches_normalized_text():
+    from bs4 import BeautifulSoup
+    from up_crawler.bs_oop import UPCrawler
+
+    soup = BeautifulSoup(
+        '<h1>T</h1><div class="post_text"><p>Text</p><p>Support&nbsp;UP</p></div>',
+        "html.parser",
+    )
+    art = UPCrawler.parse_soup(soup, regex_paras_to_skip=REGEX_PARAS_TO_SKIP)
+    assert art.text == ["Text"]
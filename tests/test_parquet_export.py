@@ -0,0 +1,59 @@
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+import pyarrow.dataset as ds
+
+from up_crawler.parquet_export import UPToParquetExporter
+from up_crawler.storage import DirectoryStorage
+from up_crawler.up_reader import UPReader
+
+from tests.test_storage import ARTICLES
+
+
+@pytest.fixture
+def fas(tmp_path):
+    storage = DirectoryStorage(tmp_path / "corpus")
+    for art in ARTICLES:
+        storage.write(art)
+    return list(
+        UPReader.read_storage(storage, fields=UPToParquetExporter.FIELDS)
+    )
+
+
+def test_parquet_file(tmp_path, fas):
+    target = tmp_path / "out.parquet"
+    assert UPToParquetExporter.fas_to_parquet(iter(fas), target, row_group_size=2) == 3
+
+    f = pq.ParquetFile(target)
+    assert f.metadata.num_row_groups == 2
+    df = f.read().to_pandas()
+    assert df.art_id.tolist() == [1, 2, 3]
+    row = df.iloc[0]
+    assert row.ukr_title == "Title 1 ukr" and row.eng_title == "Title 1 eng"
+    assert row.rus_title is None
+    assert row.ukr_text == ARTICLES[0].get_text()
+    assert list(row.tags) == ["stavka"]
+    assert list(row.ukr_tags) == ["Ставка"]
+    assert row.ukr_tags_full[0]["tag_link"] == "/tags/stavka/"
+
+
+@pytest.mark.parametrize("partition_by", ["year", "month"])
+def test_partitions(tmp_path, fas, partition_by):
+    target = tmp_path / "out"
+    UPToParquetExporter.fas_to_parquet(fas, target, partition_by=partition_by)
+
+    parts = sorted(str(x.relative_to(target)) for x in target.rglob("*.parquet"))
+    if partition_by == "year":
+        assert parts == ["year=2023/part-0.parquet"]
+    else:
+        assert parts == [
+            "year=2023/month=11/part-0.parquet",
+            "year=2023/month=12/part-0.parquet",
+        ]
+    table = ds.dataset(target, partitioning="hive").to_table(columns=["art_id"])
+    assert sorted(table.column("art_id").to_pylist()) == [1, 2, 3]
+
+
+def test_empty(tmp_path):
+    UPToParquetExporter.fas_to_parquet([], tmp_path / "empty.parquet")
+    assert pq.read_table(tmp_path / "empty.parquet").num_rows == 0
@@ -0,0 +1,106 @@
+import argparse
+import logging
+
+import pytest
+
+from up_crawler.rate_limit import TokenBucket, HostRateLimiter, AIMDController
+from up_crawler.randomization import RandomizationParams, _add_rate_limit_args, _parse_timeout
+
+
+def test_token_bucket_burst_then_rate():
+    tb = TokenBucket(rate=10, burst=2)
+    waits = [tb.reserve() for _ in range(5)]
+    assert waits[0] == waits[1] == 0
+    # queued requests wait 0.1s more each
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.3, abs=0.01)
+
+
+def test_token_bucket_shared_between_instances(tmp_path):
+    # As if two processes used the same state file
+    state = tmp_path / "host.bucket"
+    tb1 = TokenBucket(rate=10, burst=1, state_file=state)
+    tb2 = TokenBucket(rate=10, burst=1, state_file=state)
+    assert tb1.reserve() == 0
+    assert tb2.reserve() == pytest.approx(0.1, abs=0.01)
+    assert tb1.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_host_rate_limiter_per_host_and_stats():
+    rl = HostRateLimiter(requests_per_sec=20, burst=1)
+    with rl.slot("https://www.pravda.com.ua/news/1/"):
+        pass
+    # other host has its own bucket
+    assert rl.wait("https://www.epravda.com.ua/news/1/") == 0
+    with rl.slot("https://www.pravda.com.ua/news/2/"):
+        pass
+    assert rl.stats.num_requests == 2
+    assert rl.stats.throttled_sec == pytest.approx(0.05, abs=0.01)
+    assert "throttled" in rl.stats.report()
+
+
+def test_randomization_params_uses_bucket():
+    rp = RandomizationParams(requests_per_sec=100, burst=5)
+    assert rp.rate_limiter is not None
+    for _ in range(5):
+        with rp.slot("https://www.pravda.com.ua/"):
+            pass
+    assert rp.stats.throttled_sec == 0
+    assert rp.stats.num_requests == 5
+
+    assert RandomizationParams(max_wait_sec=0, wait_eps=0).rate_limiter is None
+
+
+def test_rps_wins_over_no_timeout(caplog):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeout", "-t", type=int, default=5)
+    _add_rate_limit_args(parser)
+
+    assert _parse_timeout(parser.parse_args(["-t", "-1"])).rate_limiter is None
+    with caplog.at_level(logging.WARNING):
+        rp = _parse_timeout(parser.parse_args(["-t", "-1", "--rps", "2"]))
+    assert rp.rate_limiter is not None
+    assert "ignoring -t -1" in caplog.text
+
+
+def test_aimd_increase_decrease():
+    c = AIMDController(min_rps=0.5, max_rps=2, increase=0.5, cooldown_sec=60)
+    tb = TokenBucket(rate=1)
+    c.observe("up", tb, latency=0.1, status_code=200)
+    assert tb.rate == 1.5
+    c.observe("up", tb, latency=0.1, status_code=200)
+    c.observe("up", tb, latency=0.1, status_code=200)
+    assert tb.rate == 2
+
+    c.observe("up", tb, latency=0.1, status_code=429)
+    assert tb.rate == 1
+    # only once per cooldown
+    c.observe("up", tb, latency=0.1, status_code=503)
+    assert tb.rate == 1
+
+
+def test_aimd_retry_after_pauses():
+    c = AIMDController()
+    tb = TokenBucket(rate=100, burst=10)
+    c.observe("up", tb, latency=0.1, status_code=429, headers={"Retry-After": "2"})
+    assert tb.rate == 50
+    assert tb.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_aimd_p95_latency():
+    c = AIMDController(latency_window=10, increase=0, cooldown_sec=0)
+    tb = TokenBucket(rate=4)
+    for _ in range(10):
+        c.observe("up", tb, latency=0.1, status_code=200)
+    assert tb.rate == 4
+    for _ in range(10):
+        c.observe("up", tb, latency=1, status_code=200)
+    assert tb.rate == 2
+
+
+def test_randomization_params_adaptive():
+    rp = RandomizationParams(requests_per_sec=100, adaptive=True, max_rps=150)
+    for _ in range(3):
+        with rp.slot("https://www.pravda.com.ua/") as record:
+            record.status_code = 200
+    assert rp.rate_limiter.bucket("https://www.pravda.com.ua/").rate > 100
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from up_crawler.bs_oop import UPCrawler
+from up_crawler.data_structures import Article
+from up_crawler.raw_archive import RawArchiveWriter, RawArchiveReader
+from up_crawler.reparse import UPReparser
+
+PAGES_DIR = Path(__file__).parent / "assets" / "pages"
+
+UK_URI = "https://www.pravda.com.ua/news/2023/11/13/7428464/"
+EN_URI = "https://www.pravda.com.ua/eng/news/2023/11/13/7428464/"
+BAD_URI = "https://www.pravda.com.ua/news/2023/11/13/7428465/"
+
+
+def _write_archive(path: Path) -> RawArchiveWriter:
+    aw = RawArchiveWriter(path)
+    headers = {"Content-Type": "text/html; charset=utf-8", "Content-Encoding": "gzip"}
+    page = (PAGES_DIR / "article.html").read_bytes()
+    aw.write(UK_URI, status_code=200, headers=headers, content=page)
+    aw.write(EN_URI, status_code=200, headers=headers, content=page)
+    page_404 = (PAGES_DIR / "article_404.html").read_bytes()
+    aw.write(BAD_URI, status_code=200, headers=headers, content=page_404)
+    return aw
+
+
+def test_archive_roundtrip(tmp_path):
+    aw = _write_archive(tmp_path / "raw.warc.gz")
+    ar = RawArchiveReader(aw.path)
+    responses = list(ar)
+    assert [x.uri for x in responses] == [UK_URI, EN_URI, BAD_URI]
+    assert responses[0].content == (PAGES_DIR / "article.html").read_bytes()
+    assert responses[0].encoding == "utf-8"
+    # the stored body is already decoded
+    assert "content-encoding" not in responses[0].headers
+
+
+def test_crawl_writes_archive(fake_up, tmp_path, no_wait):
+    aw = RawArchiveWriter(tmp_path / "raw.warc.gz")
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    UPCrawler.crawl_article_uri(uri=uri, randomization_params=no_wait, archive=aw)
+    # 404s aren't archived
+    UPCrawler.crawl_article_uri(
+        uri=fake_up.base + "/rus/news/2023/11/13/7428464/",
+        randomization_params=no_wait,
+        archive=aw,
+    )
+    assert [x["uri"] for x in RawArchiveReader(aw.path).index()] == [uri]
+
+
+def test_reparse(tmp_path):
+    aw = _write_archive(tmp_path / "raw.warc.gz")
+    out = tmp_path / "out"
+    n = UPReparser(archive_path=aw.path, target_dir=out, workers=2).run()
+    assert n == 2
+
+    files = sorted((out / "7428464").iterdir())
+    assert [x.name.split("_")[0] for x in files] == ["eng", "ukr"]
+    art = Article.from_json_file(files[1])
+    assert art.uri == UK_URI
+    assert art.date == "2023-11-13"
+    assert art.art_id == "7428464"
+    assert art.text[0].startswith("Президент Володимир Зеленський")
+    assert (out / "tags_mapping.json").exists()
@@ -0,0 +1,202 @@
+import pytest
+
+from up_crawler.data_structures import Article, Language
+from up_crawler.storage import (
+    ArticleStorage,
+    DirectoryStorage,
+    ShardStorage,
+    convert,
+    open_storage,
+)
+from up_crawler.up_reader import UPReader
+from up_crawler.codec import projection
+
+
+def _article(art_id: int, lang: str, date: str = "2023-11-13") -> Article:
+    return Article(
+        uri=f"https://www.pravda.com.ua/{lang}/news/{art_id}/",
+        title=f"Title {art_id} {lang}",
+        author_name="Олена Рощина",
+        text=["Перший абзац.", "Second paragraph"],
+        raw_html="<div class='post_text'><p>Перший абзац.</p></div>",
+        lang=Language(lang),
+        art_id=art_id,
+        date=date,
+        tags_full=[("stavka", "Ставка", "/tags/stavka/")],
+        tags=["stavka"],
+    )
+
+
+ARTICLES = [
+    _article(1, "ukr"),
+    _article(1, "eng"),
+    _article(2, "ukr", date="2023-12-01"),
+    _article(3, "rus", date="2023-12-02"),
+]
+
+
+@pytest.mark.parametrize("kind", ["dirs", "shards"])
+def test_storage_roundtrip(tmp_path, kind):
+    storage = open_storage(tmp_path, kind=kind)
+    for art in ARTICLES:
+        storage.write(art)
+
+    assert storage.exists(1, lang="eng", uri=ARTICLES[1].uri)
+    assert not storage.exists(2, lang="eng", uri="https://www.pravda.com.ua/eng/x/")
+    assert storage.read(2, "ukr").title == "Title 2 ukr"
+
+    groups = list(storage.iter_articles())
+    assert [(art_id, sorted(x)) for art_id, x in groups] == [
+        (1, ["eng", "ukr"]),
+        (2, ["ukr"]),
+        (3, ["rus"]),
+    ]
+    assert groups[0][1]["ukr"].text == ARTICLES[0].text
+    storage.close()
+
+    # Detected when reopened
+    assert isinstance(open_storage(tmp_path), type(storage))
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        ArticleStorage()
+
+    class NoReadBytes(ArticleStorage):
+        exists = write = read = iter_articles = signatures = lambda self: None
+
+    with pytest.raises(TypeError, match="read_bytes"):
+        NoReadBytes()
+
+
+def test_shards_roll_by_month_and_size(tmp_path):
+    storage = ShardStorage(tmp_path, max_shard_mb=0.0001)
+    for art in ARTICLES:
+        storage.write(art)
+    shards = sorted(x.name.split("_")[0] for x in storage.shards_dir.glob("*.jsonl.*"))
+    # 100 bytes max: every article gets its own shard
+    assert shards == ["2023-11", "2023-11", "2023-12", "2023-12"]
+    assert storage.num_articles() == 4
+    # Rewriting an article replaces it in the index
+    storage.write(_article(1, "ukr"))
+    assert storage.num_articles() == 4
+
+
+def test_convert_both_ways(tmp_path):
+    dirs = DirectoryStorage(tmp_path / "dirs")
+    for art in ARTICLES:
+        dirs.write(art)
+
+    shards = ShardStorage(tmp_path / "shards")
+    assert convert(dirs, shards) == 4
+    back = DirectoryStorage(tmp_path / "back")
+    assert convert(shards, back) == 4
+
+    fas = list(UPReader.read_storage(back))
+    fas_dirs = list(UPReader.read_storage(dirs))
+    assert [x.art_id for x in fas] == [1, 2, 3]
+    assert fas == fas_dirs
+    # Same files as the original directory layout
+    assert sorted(x.name for x in (tmp_path / "back" / "1").iterdir()) == sorted(
+        x.name for x in (tmp_path / "dirs" / "1").iterdir()
+    )
+
+
+def test_crawl_to_shards(fake_up, tmp_path, no_wait):
+    from up_crawler.bs_oop import UPCrawler
+    from up_crawler.data_structures import TagsMapping
+    from tests.test_frontier import _uris_csv
+
+    _uris_csv(tmp_path / "uris.csv", base=fake_up.base)
+    TagsMapping(tags_mapping=dict()).to_json_file(tmp_path / "tm.json")
+    out = tmp_path / "out"
+    UPCrawler(
+        input_csv=tmp_path / "uris.csv",
+        target_dir=out,
+        tags_mapping_file=tmp_path / "tm.json",
+        randomization_params=no_wait,
+        storage=ShardStorage(out),
+    ).run()
+
+    assert not (out / "7428464").exists()
+    storage = open_storage(out)
+    assert [(i, sorted(x)) for i, x in storage.iter_articles()] == [
+        (7428464, ["eng", "ukr"]),
+        (7428466, ["ukr"]),
+    ]
+
+
+@pytest.mark.parametrize("kind", ["dirs", "shards"])
+def test_raw_html_in_blobs(tmp_path, kind):
+    storage = open_storage(tmp_path, kind=kind)
+    for art in ARTICLES:
+        storage.write(art)
+    # Same html in all of them, stored once
+    assert len(list(storage.blobs.root.rglob("*.html.*"))) == 1
+
+    art = storage.read(1, "eng")
+    assert art.raw_html is None
+    assert art.raw_html_ref == storage.blobs.ref_for(ARTICLES[0].raw_html)
+    assert art.get_raw_html() == ARTICLES[0].raw_html
+    # The articles passed to write() aren't changed
+    assert ARTICLES[0].raw_html_ref is None
+
+
+def test_inline_raw_html(tmp_path):
+    dirs = DirectoryStorage(tmp_path / "dirs")
+    for art in ARTICLES:
+        dirs.write(art)
+    assert "raw_html" not in next((tmp_path / "dirs" / "1").glob("*.json")).read_text()
+
+    # Blobs of the source are copied or brought back inside the articles
+    shards = ShardStorage(tmp_path / "shards")
+    inline = DirectoryStorage(tmp_path / "inline", inline_raw_html=True)
+    convert(dirs, shards)
+    convert(shards, inline)
+    assert shards.read(3, "rus").get_raw_html() == ARTICLES[3].raw_html
+    art = inline.read(3, "rus")
+    assert art.raw_html == ARTICLES[3].raw_html
+    assert art.raw_html_ref is None
+    assert not (tmp_path / "inline" / "blobs").exists()
+
+
+@pytest.mark.parametrize("workers,threads", [(0, False), (2, True), (2, False)])
+def test_read_dir_parallel(tmp_path, workers, threads):
+    dirs = DirectoryStorage(tmp_path)
+    for art_id in [10, 9, 100]:
+        for art in ARTICLES:
+            dirs.write(_article(art_id * 10 + int(art.art_id), art.lang.value))
+    (tmp_path / "12345").mkdir()
+    (tmp_path / "notes").mkdir()
+
+    fas = list(
+        UPReader.iter_dir(tmp_path, workers=workers, threads=threads, dirs_per_task=2)
+    )
+    assert [x.art_id for x in fas] == [91, 92, 93, 101, 102, 103, 1001, 1002, 1003]
+    assert fas == list(UPReader.read_storage(dirs))
+    assert fas[0].articles["ukr"].get_raw_html() == ARTICLES[0].raw_html
+
+
+@pytest.mark.parametrize("kind", ["dirs", "shards"])
+def test_read_fields(tmp_path, kind):
+    storage = open_storage(tmp_path, kind=kind)
+    for art in ARTICLES:
+        storage.write(art)
+
+    fas = list(UPReader.read_storage(storage, fields=["title"]))
+    art = fas[0].articles["ukr"]
+    assert (art.title, art.date, art.tags) == ("Title 1 ukr", "2023-11-13", ["stavka"])
+    assert art.text is None and art.raw_html_ref is None
+    # The rest is read when asked for
+    assert art.get_field("text") == ARTICLES[0].text
+    assert art.get_raw_html() == ARTICLES[0].raw_html
+    assert storage.read(3, "rus", fields=projection(["text"])).get_field("uri") == ARTICLES[3].uri
+
+
+def test_read_dir_fields_in_processes(tmp_path):
+    dirs = DirectoryStorage(tmp_path)
+    for art in ARTICLES:
+        dirs.write(art)
+    fas = list(UPReader.iter_dir(tmp_path, workers=2, fields=["text"]))
+    assert fas[1].articles["ukr"].title is None
+    assert fas[1].articles["ukr"].get_field("title") == "Title 2 ukr"
@@ -0,0 +1,54 @@
+from up_crawler.data_structures import Language, TagsMapping
+from up_crawler.tags_journal import TagsJournal
+
+
+def _tm() -> TagsMapping:
+    return TagsMapping(
+        tags_mapping={
+            "pozhezha": {
+                Language.UA: ("пожежа", "/tags/pozhezha/"),
+                Language.RU: None,
+            }
+        }
+    )
+
+
+def test_flush_appends_only_changes(tmp_path):
+    path = tmp_path / "tags_mapping.json"
+    tj = TagsJournal(path)
+    tm = _tm()
+    tj.compact(tm)
+    json_mtime = path.stat().st_mtime_ns
+
+    assert tj.flush(tm) == 0
+    assert not tj.journal_path.exists()
+
+    tm.tags_mapping["pozhezha"][Language.EN] = ("fire", "/eng/tags/pozhezha/")
+    tm.tags_mapping["kijiv"] = {Language.RU: ("Киев", "/rus/tags/kijiv/")}
+    assert tj.flush(tm) == 2
+    assert tj.flush(tm) == 0
+    assert len(tj.journal_path.read_text().splitlines()) == 2
+    # The json itself wasn't touched
+    assert path.stat().st_mtime_ns == json_mtime
+
+    # What a crashed crawler leaves behind is still readable
+    tm2 = TagsJournal.read(path)
+    assert tm2.tags_mapping == tm.tags_mapping
+
+
+def test_broken_last_line_and_compaction(tmp_path):
+    path = tmp_path / "tags_mapping.json"
+    tj = TagsJournal(path, compact_every_sec=0)
+    tm = _tm()
+    tj.compact(tm)
+    with open(tj.journal_path, "a") as f:
+        f.write('["kijiv", "rus", ["Ки')
+    assert TagsJournal.read(path).tags_mapping == tm.tags_mapping
+
+    tj2 = TagsJournal(path, compact_every_sec=0)
+    tm2 = tj2.load()
+    tm2.tags_mapping["kijiv"] = {Language.RU: ("Киев", "/rus/tags/kijiv/")}
+    tj2.flush(tm2)
+    # Compacted right away
+    assert not tj2.journal_path.exists()
+    assert TagsMapping.from_json_file(path).tags_mapping == tm2.tags_mapping
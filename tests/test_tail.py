@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from up_crawler.get_uris import UPSitemapCrawler
+from up_crawler.tail import UPTailer
+
+from tests.conftest import LATEST_LOCS
+
+
+@pytest.fixture
+def tailer(fake_up, crawler, monkeypatch) -> UPTailer:
+    monkeypatch.setattr(
+        UPSitemapCrawler,
+        "SITEMAP_LATEST_URIS",
+        [
+            fake_up.base + "/sitemap/sitemap-news.xml",
+            # No sitemap-now there, skipped
+            fake_up.base + "/sitemap/sitemap-now.xml",
+        ],
+    )
+    return UPTailer(crawler)
+
+
+def test_poll_queues_only_new(fake_up, tailer):
+    # An article already queued from the archive sitemaps
+    tailer.frontier.add(
+        pd.DataFrame(
+            [{"uri": LATEST_LOCS[2], "lang": "ukr", "id": 7428999, "date": "2023-11-20"}]
+        )
+    )
+
+    assert tailer.poll() == 2
+    assert tailer.frontier.counts() == {"pending": 3}
+    groups = dict(tailer.frontier.lease(num_articles=10))
+    assert set(groups[7431000].uri) == set(LATEST_LOCS[:2])
+    assert set(groups[7431000].date) == {"2023-12-01"}
+
+    # Unchanged sitemap: 304, nothing new
+    assert tailer.poll() == 0
+    assert fake_up.not_modified == 1
+
+
+def test_run_crawls_after_polls(tailer, monkeypatch):
+    runs = list()
+    monkeypatch.setattr(tailer.crawler, "run", lambda: runs.append(1))
+    tailer.run(poll_interval=0, max_polls=2)
+    # Pending after the first poll, and still pending since nothing was crawled
+    assert len(runs) == 2
+
+
+def test_failed_parse_polled_again(fake_up, tailer, monkeypatch):
+    sc = tailer.sitemap_crawler
+    read_sitemap_df = sc._read_sitemap_df
+
+    def fail(res, d1=None, d2=None):
+        res.close()
+        raise ConnectionError("stream broke")
+
+    monkeypatch.setattr(sc, "_read_sitemap_df", fail)
+    with pytest.raises(ConnectionError):
+        tailer.poll()
+    monkeypatch.setattr(sc, "_read_sitemap_df", read_sitemap_df)
+    # Not asked conditionally, so nothing is lost
+    assert tailer.poll() == 3
+    assert fake_up.not_modified == 0
@@ -1,3 +1,4 @@
+import gzip
 import pytest
 from datetime import datetime
 from pathlib import Path
@@ -7,7 +8,17 @@ from up_crawler.get_uris import UPSitemapCrawler
 from up_crawler.bs_oop import UPCrawler
 from up_crawler.path_ops import get_file_or_temp
 from up_crawler.up_reader import UPReader, UPToCSVExporter
-from up_crawler.consts import REGEX_PARAS_TO_SKIP
+from up_crawler.consts import REGEX_PARAS_TO_SKIP, URI_REGEX_EXT
+from up_crawler.async_crawler import AsyncArticleFetcher
+from up_crawler.data_structures import Article, TagsMapping
+from up_crawler.http_session import UPSession, ServerBusyError
+from up_crawler.frontier import CrawlFrontier
+from up_crawler.consts import FRONTIER_FN
+from up_crawler.sitemap_cache import MonthSitemapCache
+
+import pandas as pd
+
+from tests.conftest import FAST_RETRIES, make_sitemap
 
 import logging
 
@@ -19,6 +30,23 @@ b = breakpoint
 SMALL_CORPUS = Path(__file__).parent / "assets" / "2days_corpus"
 
 
+
+def _uris_df(base: str) -> pd.DataFrame:
+    """URI list like UPSitemapCrawler's, pointing to the fake_up server"""
+    rows = [
+        ("/news/2023/11/13/7428464/", "ukr", 7428464),
+        ("/eng/news/2023/11/13/7428464/", "eng", 7428464),
+        ("/rus/news/2023/11/13/7428464/", "rus", 7428464),
+        ("/news/2023/11/13/404page/", "ukr", 7428465),
+    ]
+    return pd.DataFrame(
+        [
+            {"uri": base + path, "lang": lang, "id": art_id, "date": "2023-11-13"}
+            for path, lang, art_id in rows
+        ]
+    )
+
+
 def test_version():
     assert __version__ == "0.1.0"
 
@@ -29,6 +57,55 @@ def test_sitemap():
     assert sitemap_uri == "https://www.pravda.com.ua/sitemap/sitemap-2022-12.xml.gz"
 
 
+def test_sitemap_through_session(fake_up, fake_sitemaps):
+    us = UPSitemapCrawler(session=UPSession())
+    df = us.get_articles_from_sitemap(
+        us._get_sitemap_uri_for_month(datetime(2023, 11, 1))
+    )
+    assert list(df.id) == ["7428464", "7428464", "7428472", "7428999"]
+    assert list(df.lang) == ["ukr", "eng", "rus", "ukr"]
+    no_sitemap = fake_up.base + "/sitemap/sitemap-2023-10.xml.gz"
+    assert us.get_articles_from_sitemap(no_sitemap) is None
+
+
+def test_iter_and_save_article_uris(fake_sitemaps, tmp_path):
+    us = UPSitemapCrawler(session=UPSession())
+    d1, d2 = datetime(2023, 10, 1), datetime(2023, 12, 31)
+    dfs = list(us.iter_and_save_article_uris(d1, d2, save_path=tmp_path / "uris.csv"))
+    # Only 2023-11 has a sitemap
+    assert len(dfs) == 1
+    df = us.get_article_uris(d1, d2)
+    assert list(pd.read_csv(tmp_path / "uris.csv").uri) == list(df.uri)
+
+
+def test_iter_article_uris_window():
+    us = UPSitemapCrawler(sitemap_workers=2)
+    got = list()
+
+    def get_month(month, d1=None, d2=None):
+        got.append(month)
+        date = month.to_timestamp() + pd.Timedelta(days=14)
+        return pd.DataFrame({"uri": [str(month)], "date": [date]})
+
+    us.get_month = get_month
+    dfs = us.iter_article_uris(datetime(2023, 1, 1), datetime(2023, 12, 31))
+    assert next(dfs).uri.item() == "2023-01"
+    # Only sitemap_workers months downloaded ahead of what's read
+    assert len(got) <= 2
+    assert [x.uri.item() for x in dfs] == [f"2023-{x:02d}" for x in range(2, 13)]
+
+
+def test_session_keepalive(fake_up, no_wait):
+    session = UPSession(pool_size=2)
+    uri = fake_up.base + "/news/2023/11/13/7428464/"
+    for _ in range(5):
+        UPCrawler.crawl_article_uri(
+            uri=uri, randomization_params=no_wait, session=session
+        )
+    assert len(fake_up.requests_log) == 5
+    assert len(fake_up.client_ports) == 1
+
+
 @pytest.mark.network
 def test_uri_crawl_not_404():
     # Has 404 in the title but is not an error
@@ -129,3 +206,217 @@ def test_correct_tags():
     res_skip = UPCrawler.crawl_article_uri(uri=URI)
     # TODO
 
+
+
+def test_async_fetcher_same_output(fake_up, tmp_path, no_wait):
+    df = _uris_df(fake_up.base)
+    f = AsyncArticleFetcher(
+        target_dir=tmp_path, concurrency=4, randomization_params=no_wait
+    )
+    f.run(df.groupby("id"))
+
+    files = sorted(x.name.split("_")[0] for x in (tmp_path / "7428464").iterdir())
+    # rus is a 404, the ukr one of 7428465 has a 404 title
+    assert files == ["eng", "ukr"]
+    # No empty dirs for articles without any translation
+    assert not (tmp_path / "7428465").exists()
+
+    sync_art = UPCrawler.crawl_article_uri(
+        uri=df.uri[0], randomization_params=no_wait
+    )
+    ukr = [x for x in (tmp_path / "7428464").iterdir() if x.name.startswith("ukr")]
+    async_art = Article.from_json_file(ukr[0])
+    assert async_art.text == sync_art.text
+    assert [list(x) for x in async_art.tags_full] == [
+        list(x) for x in sync_art.tags_full
+    ]
+
+    # Already downloaded files aren't requested again
+    n_requests = len(fake_up.requests_log)
+    f.run(df.groupby("id"))
+    assert len(fake_up.requests_log) == n_requests + 2
+
+
+def test_async_fetcher_403(fake_up, tmp_path, no_wait):
+    df = _uris_df(fake_up.base)
+    df.loc[0, "uri"] = fake_up.base + "/forbidden/news/2023/11/13/7428464/"
+    f = AsyncArticleFetcher(
+        target_dir=tmp_path, concurrency=2, randomization_params=no_wait
+    )
+    with pytest.raises(ValueError):
+        f.run(df.groupby("id"))
+
+
+@pytest.mark.parametrize("path", ["/busy/", "/error500/"])
+def test_server_busy_retried(fake_up, fast_retries, path, no_wait):
+    uri = fake_up.base + path + "news/2023/11/13/7428464/"
+    with pytest.raises(ServerBusyError):
+        UPCrawler.crawl_article_uri(
+            uri=uri, randomization_params=no_wait, session=UPSession()
+        )
+    assert len(fake_up.requests_log) == FAST_RETRIES
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_busy_uri_doesnt_stop_crawl(
+    fake_up, tmp_path, fast_retries, concurrency, no_wait
+):
+    df = _uris_df(fake_up.base)
+    df.loc[0, "uri"] = fake_up.base + "/busy/news/2023/11/13/7428464/"
+    df.to_csv(tmp_path / "uris.csv", index=False)
+    tm_file = tmp_path / "tm.json"
+    TagsMapping(tags_mapping=dict()).to_json_file(tm_file)
+    UPCrawler(
+        input_csv=tmp_path / "uris.csv",
+        target_dir=tmp_path / "out",
+        tags_mapping_file=tm_file,
+        randomization_params=no_wait,
+        concurrency=concurrency,
+    ).run()
+    counts = CrawlFrontier(tmp_path / "out" / FRONTIER_FN).counts()
+    # Failed, or pending again if it failed after the last lease (asyncio)
+    assert counts.pop("failed", 0) + counts.pop("pending", 0) == 1
+    assert counts == {"done": 1, "404": 2}
+    num_busy = sum(x.startswith("/busy/") for x in fake_up.requests_log)
+    assert num_busy % FAST_RETRIES == 0
+    if concurrency == 1:
+        # Leased again until MAX_ATTEMPTS
+        assert num_busy == CrawlFrontier.MAX_ATTEMPTS * FAST_RETRIES
+
+
+class _Pbar:
+    n = 0
+
+    def update(self, n=1):
+        self.n += n
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_pbar_without_frontier(fake_up, tmp_path, fast_retries, concurrency, no_wait):
+    df = _uris_df(fake_up.base)
+    df.loc[0, "uri"] = fake_up.base + "/busy/news/2023/11/13/7428464/"
+    pbar = _Pbar()
+    if concurrency == 1:
+        for group in df.groupby("id"):
+            UPCrawler.process_group(
+                group, randomization_params=no_wait, target_dir=tmp_path, pbar=pbar
+            )
+    else:
+        AsyncArticleFetcher(
+            target_dir=tmp_path, concurrency=concurrency, randomization_params=no_wait
+        ).run(df.groupby("id"), pbar=pbar)
+    # Downloaded, 404s and given up on alike
+    assert pbar.n == len(df)
+
+
+def test_async_fetcher_parser_processes(fake_up, tmp_path, no_wait):
+    df = _uris_df(fake_up.base)
+    groups_done = list()
+    f = AsyncArticleFetcher(
+        target_dir=tmp_path,
+        concurrency=3,
+        parse_workers=2,
+        randomization_params=no_wait,
+        on_group_done=lambda: groups_done.append(1),
+    )
+    f.run(df.groupby("id"))
+    files = sorted(x.name.split("_")[0] for x in (tmp_path / "7428464").iterdir())
+    assert files == ["eng", "ukr"]
+    assert len(groups_done) == 2
+
+
+def test_split_article_uri():
+    uris = [
+        "https://www.pravda.com.ua/news/2023/11/13/7428464/",
+        "https://www.pravda.com.ua/eng/news/2023/11/13/7428464/",
+        "https://www.pravda.com.ua/rus/articles/2023/01/5/7428472/",
+        "https://www.epravda.com.ua/columns/2022/02/24/683420/",
+    ]
+    for uri in uris:
+        m = URI_REGEX_EXT.match(uri)
+        assert UPSitemapCrawler.split_article_uri(uri) == tuple(
+            m.group(x)
+            for x in ["uri", "date_part", "domain", "lang", "kind", "art_id", "id"]
+        )
+    for uri in [
+        "https://www.pravda.com.ua/news/2023/11/13/7428464",
+        "https://www.pravda.com.ua/tags/",
+        "https://www.pravda.com.ua/",
+    ]:
+        assert UPSitemapCrawler.split_article_uri(uri) is None
+
+
+def test_sitemap_df_stream():
+    content = gzip.compress(make_sitemap())
+    df = UPSitemapCrawler._sitemap_df(content)
+    assert list(df.columns) == UPSitemapCrawler.SITEMAP_COLUMNS
+    assert list(df.id) == ["7428464", "7428464", "7428472", "7428999"]
+    assert df.date.dtype == "datetime64[ns]"
+    # Filtered while parsing, the same as _filter_arts_by_hr_date
+    d1, d2 = datetime(2023, 11, 13), datetime(2023, 11, 20)
+    df = UPSitemapCrawler._sitemap_df(content, d1=d1, d2=d2)
+    assert list(df.id) == ["7428472"]
+    df = UPSitemapCrawler._sitemap_df(content, d1=d1, d2=datetime(2023, 11, 20, 10))
+    assert list(df.id) == ["7428472", "7428999"]
+    assert UPSitemapCrawler._sitemap_df(make_sitemap([])).empty
+
+
+@pytest.mark.parametrize("gzipped", [True, False])
+def test_sitemap_locs_chunks(gzipped):
+    content = make_sitemap(["https://www.pravda.com.ua/news/2023/11/13/7428464/"] * 3)
+    # Empty <loc>s are skipped
+    content = content.replace(b"</urlset>", b"<url><loc/></url><url><loc> </loc></url></urlset>")
+    content = gzip.compress(content) if gzipped else content
+    chunks = (content[i : i + 7] for i in range(0, len(content), 7))
+
+    locs = UPSitemapCrawler._iter_sitemap_locs(chunks)
+    assert next(locs) == "https://www.pravda.com.ua/news/2023/11/13/7428464/"
+    assert len(list(locs)) == 2
+
+
+def test_sitemap_streamed(fake_sitemaps):
+    sc = UPSitemapCrawler(session=UPSession())
+    res = sc._get_sitemap(sc._get_sitemap_uri_for_month(datetime(2023, 11, 1)))
+    # Body not read before it's parsed
+    assert not res._content_consumed
+    assert list(sc._read_sitemap_df(res).id) == ["7428464", "7428464", "7428472", "7428999"]
+
+
+def test_months_needed():
+    months = UPSitemapCrawler.months_needed(datetime(2023, 10, 31), datetime(2024, 1, 1))
+    assert [str(x) for x in months] == ["2023-10", "2023-11", "2023-12", "2024-01"]
+    # No month after d2's
+    months = UPSitemapCrawler.months_needed(datetime(2023, 11, 5), datetime(2023, 11, 20))
+    assert [str(x) for x in months] == ["2023-11"]
+
+
+@pytest.mark.parametrize("closed", [True, False])
+def test_month_sitemap_cache(fake_up, fake_sitemaps, monkeypatch, tmp_path, closed):
+    monkeypatch.setattr(
+        UPSitemapCrawler, "_is_month_closed", classmethod(lambda cls, day: closed)
+    )
+
+    def get_uris():
+        us = UPSitemapCrawler(
+            session=UPSession(), month_cache=MonthSitemapCache(tmp_path)
+        )
+        return us.get_article_uris(datetime(2023, 9, 1), datetime(2023, 11, 30))
+
+    df = get_uris()
+    assert list(df.id) == ["7428464", "7428464", "7428472", "7428999"]
+    assert sorted(fake_up.requests_log) == [
+        "/sitemap/sitemap-2023-09.xml.gz",
+        "/sitemap/sitemap-2023-10.xml.gz",
+        "/sitemap/sitemap-2023-11.xml.gz",
+    ]
+
+    fake_up.requests_log.clear()
+    df_again = get_uris()
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), df_again.reset_index(drop=True))
+    if closed:
+        # Nothing downloaded again, missing months included
+        assert fake_up.requests_log == []
+    else:
+        # Revalidated, not downloaded again
+        assert len(fake_up.requests_log) == 3
+        assert fake_up.not_modified == 1